@@ -14,6 +14,10 @@
 # limitations under the License.
 
 import os, errno
+from bisect import bisect_left, bisect_right
+from functools import partial
+from itertools import izip
+from multiprocessing.pool import ThreadPool
 
 from gluster.swift.common.utils import clean_metadata, dir_empty, rmdirs, \
      mkdirs, validate_account, validate_container, is_marker, \
@@ -22,7 +26,8 @@ from gluster.swift.common.utils import clean_metadata, dir_empty, rmdirs, \
      DEFAULT_UID, validate_object, create_object_metadata, read_metadata, \
      write_metadata, X_CONTENT_TYPE, X_CONTENT_LENGTH, X_TIMESTAMP, \
      X_PUT_TIMESTAMP, X_TYPE, X_ETAG, X_OBJECTS_COUNT, X_BYTES_USED, \
-     X_CONTAINER_COUNT, CONTAINER, os_path
+     X_CONTAINER_COUNT, CONTAINER, os_path, get_container_stats, \
+     reconcile_container_stats, remove_container_stats
 from gluster.swift.common import Glusterfs
 
 from swift.common.constraints import CONTAINER_LISTING_LIMIT
@@ -30,6 +35,37 @@ from swift.common.utils import normalize_timestamp, TRUE_VALUES
 
 
 DATADIR = 'containers'
+# Objects whose metadata iter_objects() reads at a time.
+LISTING_PAGE_SIZE = 1000
+
+_metadata_pool = None
+_metadata_pool_pid = None
+
+
+def _get_metadata_pool():
+    """
+    :returns: the pool of threads that read object metadata, or None to
+              read it in the calling thread
+    """
+    global _metadata_pool, _metadata_pool_pid
+    if Glusterfs.METADATA_READ_THREADS <= 1:
+        return None
+    # Threads do not survive a fork, so each worker makes its own pool.
+    if _metadata_pool_pid != os.getpid():
+        _metadata_pool = ThreadPool(Glusterfs.METADATA_READ_THREADS)
+        _metadata_pool_pid = os.getpid()
+    return _metadata_pool
+
+
+def _object_summary(datadir, obj):
+    obj_path = os.path.join(datadir, obj)
+    metadata = read_metadata(obj_path)
+    if not metadata or not validate_object(metadata):
+        metadata = create_object_metadata(obj_path)
+    if not metadata:
+        return None
+    return (metadata[X_TIMESTAMP], int(metadata[X_CONTENT_LENGTH]),
+            metadata[X_CONTENT_TYPE], metadata[X_ETAG])
 
 
 def _read_metadata(dd):
@@ -259,12 +295,27 @@ class DiskDir(DiskCommon):
         """
         if dir_empty(self.datadir):
             rmdirs(self.datadir)
+            remove_container_stats(self.datadir)
 
     def list_objects_iter(self, limit, marker, end_marker,
                           prefix, delimiter, path):
         """
         Returns tuple of name, created_at, size, content_type, etag.
         """
+        return list(self.iter_objects(limit, marker, end_marker,
+                                      prefix, delimiter, path))
+
+    def iter_objects(self, limit, marker, end_marker, prefix, delimiter, path):
+        """
+        Same as list_objects_iter, but yields the entries one by one, so the
+        object metadata is read a page at a time as the listing is consumed.
+
+        The names come from the sorted list that get_container_details()
+        keeps per process, which is walked from the marker or prefix on
+        without being copied. The list itself still holds every name in the
+        container, and a container too large for that cache is walked and
+        sorted on each call.
+        """
         if path:
             prefix = path = path.rstrip('/') + '/'
             delimiter = '/'
@@ -274,40 +325,73 @@ class DiskDir(DiskCommon):
         self.update_object_count()
 
         objects, object_count, bytes_used = self.object_info
+        if not objects:
+            return
 
-        if objects and prefix:
-            objects = self.filter_prefix(objects, prefix)
-
-        if objects and delimiter:
-            objects = self.filter_delimiter(objects, delimiter, prefix)
-
-        if objects and marker:
-            objects = self.filter_marker(objects, marker)
-
-        if objects and end_marker:
-            objects = self.filter_end_marker(objects, end_marker)
-
-        if objects and limit:
-            if len(objects) > limit:
-                objects = self.filter_limit(objects, limit)
+        # A name rolled up at the delimiter sorts no later than the names it
+        # stands for, so none of those at or before the marker are listed.
+        if marker and marker >= (prefix or ''):
+            index = bisect_right(objects, marker)
+        else:
+            index = bisect_left(objects, prefix or '')
+        listed = set()
+        count = 0
+        page = []
+        while index < len(objects):
+            obj = objects[index]
+            index += 1
+            if prefix and not obj.startswith(prefix):
+                break
+            if delimiter:
+                obj = prefix + obj[len(prefix):].split(delimiter, 1)[0]
+                if not obj or obj in listed:
+                    continue
+            if marker and obj <= marker:
+                continue
+            if end_marker and obj >= end_marker:
+                break
+            if delimiter:
+                listed.add(obj)
+            count += 1
+            page.append(obj)
+            if limit and count >= limit:
+                break
+            if len(page) >= LISTING_PAGE_SIZE:
+                for list_item in self._listing_page(page):
+                    yield list_item
+                page = []
+        for list_item in self._listing_page(page):
+            yield list_item
+
+    def _listing_page(self, names):
+        summaries = self.get_objects_metadata(names) if names else {}
+        for obj in names:
+            list_item = [obj]
+            list_item.extend(summaries.get(obj, ()))
+            yield list_item
+
+    def get_objects_metadata(self, names):
+        """
+        Get the listing metadata of a page of objects in one call.
 
-        container_list = []
-        if objects:
-            for obj in objects:
-                list_item = []
-                list_item.append(obj)
-                obj_path = os.path.join(self.datadir, obj)
-                metadata = read_metadata(obj_path)
-                if not metadata or not validate_object(metadata):
-                    metadata = create_object_metadata(obj_path)
-                if metadata:
-                    list_item.append(metadata[X_TIMESTAMP])
-                    list_item.append(int(metadata[X_CONTENT_LENGTH]))
-                    list_item.append(metadata[X_CONTENT_TYPE])
-                    list_item.append(metadata[X_ETAG])
-                container_list.append(list_item)
+        Gluster keeps the metadata in the xattrs of each object and there is
+        no call that reads those of many files, so the reads are spread over
+        a pool of Glusterfs.METADATA_READ_THREADS threads, which keeps that
+        many of them in flight to the volume at once.
 
-        return container_list
+        :param names: list of object names in this container
+        :returns: dict mapping object name to a (created_at, size,
+                  content_type, etag) tuple; objects without metadata are
+                  left out
+        """
+        read = partial(_object_summary, self.datadir)
+        pool = _get_metadata_pool() if len(names) > 1 else None
+        if pool:
+            results = pool.map(read, names)
+        else:
+            results = map(read, names)
+        return dict((obj, summary) for obj, summary in izip(names, results)
+                    if summary)
 
     def update_object_count(self):
         if not self.object_info:
@@ -323,6 +407,20 @@ class DiskDir(DiskCommon):
             self.metadata[X_BYTES_USED] = (bytes_used, 0)
             write_metadata(self.datadir, self.metadata)
 
+    def update_object_stats(self):
+        """
+        Refresh the object count and bytes used from the container's stats
+        journal, which unlike update_object_count() does not walk the tree.
+        """
+        object_count, bytes_used = get_container_stats(self.datadir)
+        if X_OBJECTS_COUNT not in self.metadata \
+                or int(self.metadata[X_OBJECTS_COUNT][0]) != object_count \
+                or X_BYTES_USED not in self.metadata \
+                or int(self.metadata[X_BYTES_USED][0]) != bytes_used:
+            self.metadata[X_OBJECTS_COUNT] = (object_count, 0)
+            self.metadata[X_BYTES_USED] = (bytes_used, 0)
+            write_metadata(self.datadir, self.metadata)
+
     def update_container_count(self):
         if not self.container_info:
             self.container_info = get_account_details(self.datadir)
@@ -350,7 +448,7 @@ class DiskDir(DiskCommon):
         if not Glusterfs.OBJECT_ONLY:
             # If we are not configured for object only environments, we should
             # update the object counts in case they changed behind our back.
-            self.update_object_count()
+            self.update_object_stats()
 
         data = {'account' : self.account, 'container' : self.container,
                 'object_count' : self.metadata.get(X_OBJECTS_COUNT, ('0', 0))[0],
@@ -373,6 +471,9 @@ class DiskDir(DiskCommon):
         if not self.dir_exists:
             mkdirs(self.datadir)
             self.dir_exists = os_path.exists(self.datadir)
+            if self.container:
+                # Start counting while the container is cheap to walk.
+                reconcile_container_stats(self.datadir)
         self._initialize()
 
     def update_put_timestamp(self, timestamp):
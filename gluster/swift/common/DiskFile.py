@@ -23,7 +23,8 @@ from swift.common.exceptions import DiskFileNotExist
 from gluster.swift.common.exceptions import AlreadyExistsAsDir
 from gluster.swift.common.utils import mkdirs, rmdirs, validate_object, \
      create_object_metadata, do_open, do_close, do_unlink, do_chown, \
-     do_listdir, read_metadata, write_metadata, os_path, do_fsync
+     do_listdir, read_metadata, write_metadata, os_path, do_fsync, \
+     record_container_stats
 from gluster.swift.common.utils import X_CONTENT_TYPE, X_CONTENT_LENGTH, \
      X_TIMESTAMP, X_PUT_TIMESTAMP, X_TYPE, X_ETAG, X_OBJECTS_COUNT, \
      X_BYTES_USED, X_OBJECT_TYPE, FILE, DIR, MARKER_DIR, OBJECT, DIR_TYPE, \
@@ -172,6 +173,8 @@ class Gluster_DiskFile(DiskFile):
         if os_path.exists(dir_path) and not os_path.isdir(dir_path):
             self.logger.error("Deleting file %s", dir_path)
             do_unlink(dir_path)
+        elif not os_path.exists(dir_path):
+            record_container_stats(self._container_path, 1, 0)
         #If dir aleady exist just override metadata.
         mkdirs(dir_path)
         do_chown(dir_path, self.uid, self.gid)
@@ -239,6 +242,12 @@ class Gluster_DiskFile(DiskFile):
         newpath = os.path.join(self.datadir, self._obj)
         renamer(self.tmppath, newpath)
         do_chown(newpath, self.uid, self.gid)
+        size = int(metadata.get(X_CONTENT_LENGTH, 0))
+        if self.data_file:
+            record_container_stats(self._container_path, 0,
+                size - int(self.metadata.get(X_CONTENT_LENGTH, 0)))
+        else:
+            record_container_stats(self._container_path, 1, size)
         self.metadata = metadata
         self.data_file = newpath
         self.filter_metadata()
@@ -262,9 +271,12 @@ class Gluster_DiskFile(DiskFile):
             if not rmdirs(self.data_file):
                 logging.error('Unable to delete dir object: %s', self.data_file)
                 return
+            record_container_stats(self._container_path, -1, 0)
         else:
             # File object
             do_unlink(self.data_file)
+            record_container_stats(self._container_path, -1,
+                -int(self.metadata.get(X_CONTENT_LENGTH, 0)))
 
         self.metadata = {}
         self.data_file = None
@@ -26,6 +26,7 @@ _fs_conf = ConfigParser()
 MOUNT_IP = 'localhost'
 OBJECT_ONLY = False
 RUN_DIR='/var/run/swift'
+METADATA_READ_THREADS = 8
 SWIFT_DIR = '/etc/swift'
 _do_getsize = False
 if _fs_conf.read(os.path.join('/etc/swift', 'fs.conf')):
@@ -48,6 +49,12 @@ if _fs_conf.read(os.path.join('/etc/swift', 'fs.conf')):
     except (NoSectionError, NoOptionError):
         pass
 
+    try:
+        METADATA_READ_THREADS = int(_fs_conf.get('DEFAULT',
+                                                 'metadata_read_threads', 8))
+    except (NoSectionError, NoOptionError):
+        pass
+
 NAME = 'glusterfs'
 
 
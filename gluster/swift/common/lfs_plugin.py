@@ -20,6 +20,8 @@
 
 from gluster.swift.common.DiskDir import DiskDir, DiskAccount
 from gluster.swift.common.DiskFile import Gluster_DiskFile
+from swift.proxy.lfs_copy import copy_file
+from swift.proxy.lfs_writer import lfs_writer
 
 # Let's just duck-type for avoid circular loading issues.
 #class LFSPluginGluster(lfs.LFSPlugin):
@@ -27,6 +29,10 @@ class LFSPluginGluster():
     def __init__(self, app, account, container, obj, keep_data_fp):
         # XXX config from where? app something? XXX
         self.ufo_drive = "g"
+        self.root = app.lfs_root
+        self.logger = app.logger
+        self.account = account
+        self.container = container
 
         if obj:
             is_readable = False
@@ -90,6 +96,13 @@ class LFSPluginGluster():
         return self.broker.list_objects_iter(limit, marker, end_marker,
                                              prefix, delimiter, path)
 
+    def iter_objects(self, limit, marker, end_marker, prefix, delimiter, path):
+        return self.broker.iter_objects(limit, marker, end_marker,
+                                        prefix, delimiter, path)
+
+    def get_objects_metadata(self, names):
+        return self.broker.get_objects_metadata(names)
+
     def put_container(self, container, put_timestamp, delete_timestamp,
                       object_count, bytes_used):
         # BTW, Gluster in 3.3.x does this:
@@ -103,6 +116,11 @@ class LFSPluginGluster():
             return None
         return self.broker.mkstemp()
 
+    def writer(self, size=None):
+        if self._type != 0:
+            return None
+        return lfs_writer(self.broker.mkstemp, self.put, size)
+
     def put(self, fd, metadata):
         if self._type != 0:
             return None
@@ -113,6 +131,15 @@ class LFSPluginGluster():
         fp.close()
         return ret
 
+    def copy(self, source, metadata):
+        if self._type != 0:
+            return None
+        # The metadata is in xattrs of the data file, so no hard links.
+        with self.broker.mkstemp() as fd:
+            how = copy_file(source.broker.data_file, self.broker.tmppath, fd)
+            self.put(fd, metadata)
+        return how
+
     def put_metadata(self, metadata):
         if self._type != 0:
             return None
@@ -126,6 +153,13 @@ class LFSPluginGluster():
     def __iter__(self):
         return self.broker.__iter__()
 
+    def app_iter_range(self, start, stop):
+        return self.broker.app_iter_range(start, stop)
+
+    def app_iter_ranges(self, ranges, content_type, boundary, size):
+        return self.broker.app_iter_ranges(ranges, content_type, boundary,
+                                           size)
+
     def close(self, verify_file=True):
         return self.broker.close(verify_file=verify_file)
 
@@ -134,6 +168,30 @@ class LFSPluginGluster():
             return None
         return self.broker.unlinkold(timestamp)
 
+    def delete(self, timestamp):
+        # Gluster keeps no tombstones, the file or directory just goes.
+        if self._type == 0:
+            return self.broker.unlinkold(timestamp)
+        if self._type == 1:
+            return self.broker.delete_db(timestamp)
+        return None
+
+    def delete_objects(self, names, timestamp):
+        if self._type != 1:
+            return None
+        results = {}
+        for name in names:
+            obj = Gluster_DiskFile(self.root, self.ufo_drive, "-",
+                                   self.account, self.container, name,
+                                   self.logger)
+            metadata = obj.metadata
+            if obj.is_deleted():
+                results[name] = None
+            else:
+                obj.unlinkold(timestamp)
+                results[name] = metadata
+        return results
+
     def get_data_file_size(self):
         if self._type != 0:
             return None
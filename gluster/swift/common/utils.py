@@ -22,7 +22,9 @@ from hashlib import md5
 from eventlet import sleep
 import cPickle as pickle
 from ConfigParser import ConfigParser, NoSectionError, NoOptionError
-from swift.common.utils import normalize_timestamp, TRUE_VALUES
+from swift.common.exceptions import LockTimeout
+from swift.common.utils import lock_file, normalize_timestamp, LRUCache, \
+    TRUE_VALUES
 from gluster.swift.common.fs_utils import *
 from gluster.swift.common import Glusterfs
 
@@ -45,6 +47,13 @@ DIR = 'dir'
 MARKER_DIR = 'marker_dir'
 TEMP_DIR = 'tmp'
 ASYNCDIR = 'async_pending'  # Keep in sync with swift.obj.server.ASYNCDIR
+STATS_JOURNAL_DIR = 'stats_journal'
+# Fold the deltas into the base line once a journal grows past this.
+STATS_JOURNAL_COMPACT_SIZE = 16384
+# Object lists of up to this many containers, holding up to this many names
+# in all, are kept in each process; a larger list is never cached.
+CONTAINER_DETAILS_CACHE_SIZE = 64
+CONTAINER_DETAILS_CACHE_NAMES = 1000000
 FILE = 'file'
 FILE_TYPE = 'application/octet-stream'
 OBJECT = 'Object'
@@ -288,28 +297,210 @@ def _get_container_details_from_fs(cont_path):
 
     return ContainerDetails(bytes_used, object_count, obj_list, dir_list)
 
+_container_details_cache = LRUCache(CONTAINER_DETAILS_CACHE_SIZE,
+                                   CONTAINER_DETAILS_CACHE_NAMES)
+
 def get_container_details(cont_path, memcache=None):
     """
     Return object_list, object_count and bytes_used.
+
+    The object list is kept, sorted, in a per-process LRU and reused for as
+    long as the container's generation (see get_container_generation) is
+    the one it was read at. Only the counts go through memcache, via
+    get_container_stats(), so no object list is ever sent over the wire.
     """
-    mkey = ''
-    if memcache:
-        mkey = MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + cont_path
-        cd = memcache.get(mkey)
-        if cd:
-            if not cd.dir_list:
-                cd = None
-            else:
-                for (path, mtime) in cd.dir_list:
-                    if mtime != do_stat(path).st_mtime:
-                        cd = None
-    else:
-        cd = None
-    if not cd:
+    if not os_path.isdir(cont_path):
         cd = _get_container_details_from_fs(cont_path)
-        if memcache:
-            memcache.set(mkey, cd)
-    return cd.obj_list, cd.object_count, cd.bytes_used
+        return cd.obj_list, cd.object_count, cd.bytes_used
+    generation = get_container_generation(cont_path)
+    cached = _container_details_cache.get(cont_path)
+    if cached and cached[0] == generation:
+        obj_list = cached[1]
+    else:
+        obj_list = sorted(_get_container_details_from_fs(cont_path).obj_list)
+        _container_details_cache.set(cont_path, (generation, obj_list),
+                                     size=len(obj_list))
+    object_count, bytes_used = get_container_stats(cont_path, memcache,
+                                                   generation)
+    return obj_list, object_count, bytes_used
+
+
+def _stats_journal_path(cont_path):
+    drive_path, container = os.path.split(cont_path.rstrip(os.path.sep))
+    return os.path.join(drive_path, STATS_JOURNAL_DIR, container)
+
+def _read_stats_journal(fp, since=None):
+    """
+    Sum a container stats journal: an optional '= count bytes' base line
+    followed by '<count delta> <bytes delta>' lines, and '# reconcile
+    <token>' lines that mark where a reconcile started its walk.
+
+    :param since: token of a reconcile marker; only the deltas after it are
+                  summed
+    :returns: (object_count, bytes_used), or None if there is no base, or
+              no marker of since
+    """
+    fp.seek(0)
+    base = None
+    object_count = bytes_used = 0
+    for line in fp:
+        fields = line.split()
+        if len(fields) == 3 and fields[0] == '=':
+            # Only the marker of since starts the sum then: a base line
+            # means the journal was compacted, and the marker with it.
+            if since is None:
+                base = True
+                object_count, bytes_used = int(fields[1]), int(fields[2])
+        elif len(fields) == 3 and fields[0] == '#':
+            if fields[2] == since:
+                base = True
+                object_count = bytes_used = 0
+        elif len(fields) == 2:
+            object_count += int(fields[0])
+            bytes_used += int(fields[1])
+    if base is None:
+        return None
+    return object_count, bytes_used
+
+def _write_stats_base(fp, object_count, bytes_used):
+    fp.seek(0)
+    fp.truncate()
+    fp.write('= %d %d\n' % (object_count, bytes_used))
+    fp.flush()
+
+def record_container_stats(cont_path, object_delta, bytes_delta):
+    """
+    Append a change of a container's object count and bytes used to its
+    stats journal, so that the totals are known without a tree walk.
+    Containers whose journal has not been started by
+    reconcile_container_stats() are skipped; the reconciler counts them.
+
+    :param cont_path: container directory
+    :param object_delta: change in the number of objects
+    :param bytes_delta: change in the number of bytes
+    """
+    journal = _stats_journal_path(cont_path)
+    if not os_path.exists(journal):
+        return
+    try:
+        with lock_file(journal, append=True, unlink=False) as fp:
+            fp.write('%d %d\n' % (object_delta, bytes_delta))
+            fp.flush()
+            if fp.tell() > STATS_JOURNAL_COMPACT_SIZE:
+                totals = _read_stats_journal(fp)
+                if totals:
+                    _write_stats_base(fp, *totals)
+    except LockTimeout:
+        # The write itself is done; the next reconcile fixes the counts.
+        logging.warn('record_container_stats: timed out locking %s, '
+                     'skipped %d %d', journal, object_delta, bytes_delta)
+
+def _get_container_stats_from_fs(cont_path):
+    object_count = bytes_used = 0
+    for (path, dirs, files) in do_walk(cont_path):
+        object_count += len(dirs) + len(files)
+        for name in files:
+            try:
+                bytes_used += os_path.getsize(os.path.join(path, name))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+        sleep()
+    return object_count, bytes_used
+
+def reconcile_container_stats(cont_path):
+    """
+    Count a container by walking it and reset its stats journal to the
+    result. This starts the journal for a container, and repairs any drift
+    from writes that did not go through the journal.
+
+    The walk is done without the journal lock, which writers take: a marker
+    is appended first, and the deltas journaled after it are added to the
+    count of the walk. Should a writer have compacted the marker away,
+    the count of the walk is taken as it is.
+
+    :param cont_path: container directory
+    :returns: (object_count, bytes_used)
+    """
+    journal = _stats_journal_path(cont_path)
+    journal_dir = os.path.dirname(journal)
+    if not os_path.isdir(journal_dir):
+        mkdirs(journal_dir)
+    token = '%x.%x' % (os.getpid(), random.getrandbits(64))
+    with lock_file(journal, append=True, unlink=False) as fp:
+        fp.write('# reconcile %s\n' % token)
+        fp.flush()
+    object_count, bytes_used = _get_container_stats_from_fs(cont_path)
+    with lock_file(journal, append=True, unlink=False) as fp:
+        deltas = _read_stats_journal(fp, since=token)
+        if deltas:
+            object_count += deltas[0]
+            bytes_used += deltas[1]
+        _write_stats_base(fp, object_count, bytes_used)
+    return object_count, bytes_used
+
+def get_container_generation(cont_path):
+    """
+    Return a token that changes whenever the container's stats journal is
+    written, which every journaled write and every reconcile does. Starts
+    the journal if there is none.
+
+    :param cont_path: container directory
+    :returns: generation token string
+    """
+    journal = _stats_journal_path(cont_path)
+    try:
+        st = os.stat(journal)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        reconcile_container_stats(cont_path)
+        st = os.stat(journal)
+    return '%x.%x.%r' % (st.st_ino, st.st_size, st.st_mtime)
+
+def get_container_stats(cont_path, memcache=None, generation=None):
+    """
+    Return the object count and bytes used of a container from its stats
+    journal, starting the journal with a tree walk if there is none. With
+    memcache the counts are shared between processes as a small record of
+    the counts and the generation they were read at.
+
+    :param cont_path: container directory
+    :param memcache: memcache client, or None
+    :param generation: the current generation, if the caller has it
+    :returns: (object_count, bytes_used)
+    """
+    mkey = MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + cont_path
+    if memcache:
+        if generation is None:
+            generation = get_container_generation(cont_path)
+        record = memcache.get(mkey)
+        if record and record.get('generation') == generation:
+            return record['object_count'], record['bytes_used']
+    journal = _stats_journal_path(cont_path)
+    try:
+        with open(journal) as fp:
+            stats = _read_stats_journal(fp)
+    except IOError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        stats = None
+    if stats is None:
+        stats = reconcile_container_stats(cont_path)
+        generation = None
+    if memcache:
+        memcache.set(mkey, {
+            'generation': generation or get_container_generation(cont_path),
+            'object_count': stats[0], 'bytes_used': stats[1]})
+    return stats
+
+def remove_container_stats(cont_path):
+    """Drop the stats journal of a deleted container."""
+    try:
+        os.unlink(_stats_journal_path(cont_path))
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
 
 
 class AccountDetails(object):
@@ -337,6 +528,7 @@ def _get_account_details_from_fs(acc_path, acc_stats):
         for name in do_listdir(acc_path):
             if name.lower() == TEMP_DIR \
                     or name.lower() == ASYNCDIR \
+                    or name.lower() == STATS_JOURNAL_DIR \
                     or not os_path.isdir(os.path.join(acc_path, name)):
                 continue
             container_count += 1
@@ -0,0 +1,93 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Container statistics reconciler for Gluster Swift UFO """
+
+import os
+from random import random
+from time import time
+
+from eventlet import sleep, Timeout
+
+from swift.common.daemon import Daemon
+from swift.common.utils import get_logger
+from gluster.swift.common.utils import get_account_details, \
+     get_container_stats, reconcile_container_stats, os_path
+
+
+class ContainerStatsReconciler(Daemon):
+    """
+    Walks every container now and then and resets its stats journal to
+    what is actually on disk, repairing drift from writes that bypassed the
+    journal (other Gluster clients, crashes between a rename and the
+    journal append).
+
+    :param conf: The daemon configuration.
+    """
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.logger = get_logger(conf, log_route='container-stats-reconciler')
+        self.devices = conf.get('devices', '/mnt/gluster-object')
+        self.interval = int(conf.get('interval', 3600))
+        self.containers_per_second = \
+            float(conf.get('containers_per_second', 10))
+
+    def run_forever(self, *args, **kwargs):
+        sleep(random() * self.interval)
+        while True:
+            begin = time()
+            try:
+                self.run_once()
+            except (Exception, Timeout):
+                self.logger.exception(_('Exception in top-level '
+                                        'reconciler loop'))
+            elapsed = time() - begin
+            if elapsed < self.interval:
+                sleep(self.interval - elapsed)
+
+    def run_once(self, *args, **kwargs):
+        begin = time()
+        repaired = checked = 0
+        for drive in sorted(os.listdir(self.devices)):
+            drive_path = os.path.join(self.devices, drive)
+            if not os_path.isdir(drive_path):
+                continue
+            containers, _junk = get_account_details(drive_path)
+            for container in containers:
+                if self.reconcile(os.path.join(drive_path, container)):
+                    repaired += 1
+                checked += 1
+                if self.containers_per_second > 0:
+                    sleep(1.0 / self.containers_per_second)
+        self.logger.info(_('Container stats pass completed in %(time).02fs: '
+                           '%(checked)d checked, %(repaired)d repaired'),
+                         {'time': time() - begin, 'checked': checked,
+                          'repaired': repaired})
+
+    def reconcile(self, cont_path):
+        """
+        :returns: True if the journal of the container had drifted
+        """
+        before = get_container_stats(cont_path)
+        after = reconcile_container_stats(cont_path)
+        if before != after:
+            self.logger.increment('repairs')
+            self.logger.info(_('Container stats of %(path)s repaired: '
+                               '%(before)r -> %(after)r'),
+                             {'path': cont_path, 'before': before,
+                              'after': after})
+            return True
+        return False
@@ -67,6 +67,9 @@ setup(
         'bin/swift-form-signature',
         'bin/swift-get-nodes',
         'bin/swift-init',
+        'bin/swift-lfs-object-expirer',
+        'bin/swift-lfs-bench',
+        'bin/swift-lfs-posix-migrate',
         'bin/swift-object-auditor',
         'bin/swift-object-expirer',
         'bin/swift-object-info',
@@ -169,11 +169,13 @@ def get_db_connection(path, timeout=30, okay_to_create=False):
                                               'DB file created by connect?')
         conn.row_factory = sqlite3.Row
         conn.text_factory = str
-        with closing(conn.cursor()) as cur:
-            cur.execute('PRAGMA synchronous = NORMAL')
-            cur.execute('PRAGMA count_changes = OFF')
-            cur.execute('PRAGMA temp_store = MEMORY')
-            cur.execute('PRAGMA journal_mode = DELETE')
+        # Through the connection, so that they wait out a lock held by
+        # another greenthread like every other statement.
+        for pragma in ('PRAGMA synchronous = NORMAL',
+                       'PRAGMA count_changes = OFF',
+                       'PRAGMA temp_store = MEMORY',
+                       'PRAGMA journal_mode = DELETE'):
+            conn.execute(pragma).close()
         conn.create_function('chexor', 3, chexor)
     except sqlite3.DatabaseError:
         import traceback
@@ -51,6 +51,8 @@ import time
 from bisect import bisect
 from hashlib import md5
 
+from eventlet import GreenPile
+
 from swift.common.utils import json
 
 DEFAULT_MEMCACHED_PORT = 11211
@@ -62,6 +64,9 @@ JSON_FLAG = 2
 NODE_WEIGHT = 50
 PICKLE_PROTOCOL = 2
 TRY_COUNT = 3
+# Idle connections kept in the pool of each server; more are closed when
+# they are returned.
+MAX_CONNS = 20
 
 # if ERROR_LIMIT_COUNT errors occur in ERROR_LIMIT_TIME seconds, the server
 # will be considered failed for ERROR_LIMIT_DURATION seconds.
@@ -93,14 +98,28 @@ class MemcacheConnectionError(Exception):
 class MemcacheRing(object):
     """
     Simple, consistent-hashed memcache client.
+
+    get_multi() and set_multi() without a server_key send the keys of each
+    server in one pipelined request, to all the servers at once, so that
+    many keys cost a single round trip. The client keeps counts and
+    timings of the requests to each server, see get_stats().
+
+    :param max_conns: idle connections kept per server
     """
 
     def __init__(self, servers, connect_timeout=CONN_TIMEOUT,
                  io_timeout=IO_TIMEOUT, tries=TRY_COUNT,
-                 allow_pickle=False, allow_unpickle=False):
+                 allow_pickle=False, allow_unpickle=False,
+                 max_conns=MAX_CONNS):
         self._ring = {}
         self._errors = dict(((serv, []) for serv in servers))
         self._error_limited = dict(((serv, 0) for serv in servers))
+        self._stats = dict(((serv, {'requests': 0, 'errors': 0,
+                                    'timing': 0.0, 'max_timing': 0.0})
+                            for serv in servers))
+        # When each connection in use was taken from the pool.
+        self._checkouts = {}
+        self._max_conns = max_conns
         for server in sorted(servers):
             for i in xrange(NODE_WEIGHT):
                 self._ring[md5hash('%s-%s' % (server, i))] = server
@@ -120,6 +139,7 @@ class MemcacheRing(object):
         else:
             logging.exception(_("Error %(action)s to memcached: %(server)s"),
                               {'action': action, 'server': server})
+        self._checkouts.pop(sock, None)
         try:
             if fp:
                 fp.close()
@@ -132,6 +152,7 @@ class MemcacheRing(object):
                 del sock
         except Exception:
             pass
+        self._stats[server]['errors'] += 1
         now = time.time()
         self._errors[server].append(time.time())
         if len(self._errors[server]) > ERROR_LIMIT_COUNT:
@@ -141,10 +162,10 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + ERROR_LIMIT_DURATION
                 logging.error(_('Error limiting server %s'), server)
 
-    def _get_conns(self, key):
+    def _get_servers(self, key):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Yields the servers to try for "key", by a consistent hash of it,
+        leaving out those that are error limited.
         """
         pos = bisect(self._sorted, key)
         served = []
@@ -156,9 +177,18 @@ class MemcacheRing(object):
             served.append(server)
             if self._error_limited[server] > time.time():
                 continue
+            yield server
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._get_servers(key):
             sock = None
             try:
                 fp, sock = self._client_cache[server].pop()
+                self._checkouts[sock] = time.time()
                 yield server, fp, sock
             except IndexError:
                 try:
@@ -172,14 +202,94 @@ class MemcacheRing(object):
                     sock.settimeout(self._connect_timeout)
                     sock.connect((host, int(port)))
                     sock.settimeout(self._io_timeout)
+                    self._checkouts[sock] = time.time()
                     yield server, sock.makefile(), sock
                 except Exception, e:
                     self._exception_occurred(
                         server, e, action='connecting', sock=sock)
 
     def _return_conn(self, server, fp, sock):
-        """Returns a server connection to the pool."""
-        self._client_cache[server].append((fp, sock))
+        """
+        Returns a server conn to the pool, or closes it if the pool is full,
+        and counts the request made with it.
+        """
+        checkout = self._checkouts.pop(sock, None)
+        if checkout is not None:
+            elapsed = time.time() - checkout
+            stats = self._stats[server]
+            stats['requests'] += 1
+            stats['timing'] += elapsed
+            stats['max_timing'] = max(stats['max_timing'], elapsed)
+        if len(self._client_cache[server]) < self._max_conns:
+            self._client_cache[server].append((fp, sock))
+            return
+        try:
+            fp.close()
+            sock.close()
+        except Exception:
+            pass
+
+    def get_stats(self):
+        """
+        Returns the counts and timings of the requests to each server since
+        the client was made.
+
+        :returns: dict of server to a dict of 'requests' and 'errors', the
+                  numbers of successful and failed requests, 'timing', the
+                  seconds spent in the successful ones, and 'max_timing',
+                  the longest of them
+        """
+        return dict((server, dict(stats))
+                    for server, stats in self._stats.iteritems())
+
+    def _decode(self, flags, value):
+        """Unserializes a value as its flags say."""
+        if flags & PICKLE_FLAG:
+            if self._allow_unpickle:
+                return pickle.loads(value)
+            return None
+        elif flags & JSON_FLAG:
+            return json.loads(value)
+        return value
+
+    def _read_values(self, fp):
+        """
+        Reads the response to a get up to its END.
+
+        :returns: dict of hashed key to value
+        """
+        values = {}
+        line = fp.readline().strip().split()
+        while line[0].upper() != 'END':
+            if line[0].upper() == 'VALUE':
+                size = int(line[3])
+                values[line[1]] = self._decode(int(line[2]), fp.read(size))
+                fp.readline()
+            line = fp.readline().strip().split()
+        return values
+
+    def _group_by_server(self, keys):
+        """
+        Groups hashed keys by the first server to try for them.
+
+        :returns: list of lists of keys
+        """
+        groups = {}
+        for key in keys:
+            for server in self._get_servers(key):
+                groups.setdefault(server, []).append(key)
+                break
+        return groups.values()
+
+    def _serialize(self, value, serialize):
+        """
+        :returns: (flags, value) to store
+        """
+        if serialize and self._allow_pickle:
+            return PICKLE_FLAG, pickle.dumps(value, PICKLE_PROTOCOL)
+        elif serialize:
+            return JSON_FLAG, json.dumps(value)
+        return 0, value
 
     def set(self, key, value, serialize=True, timeout=0, time=0,
             min_compress_len=0):
@@ -207,13 +317,7 @@ class MemcacheRing(object):
         if timeout:
             logging.warn("parameter timeout has been deprecated, use time")
         timeout = sanitize_timeout(time or timeout)
-        flags = 0
-        if serialize and self._allow_pickle:
-            value = pickle.dumps(value, PICKLE_PROTOCOL)
-            flags |= PICKLE_FLAG
-        elif serialize:
-            value = json.dumps(value)
-            flags |= JSON_FLAG
+        flags, value = self._serialize(value, serialize)
         for (server, fp, sock) in self._get_conns(key):
             try:
                 sock.sendall('set %s %d %d %s noreply\r\n%s\r\n' %
@@ -233,24 +337,10 @@ class MemcacheRing(object):
         :returns: value of the key in memcache
         """
         key = md5hash(key)
-        value = None
         for (server, fp, sock) in self._get_conns(key):
             try:
                 sock.sendall('get %s\r\n' % key)
-                line = fp.readline().strip().split()
-                while line[0].upper() != 'END':
-                    if line[0].upper() == 'VALUE' and line[1] == key:
-                        size = int(line[3])
-                        value = fp.read(size)
-                        if int(line[2]) & PICKLE_FLAG:
-                            if self._allow_unpickle:
-                                value = pickle.loads(value)
-                            else:
-                                value = None
-                        elif int(line[2]) & JSON_FLAG:
-                            value = json.loads(value)
-                        fp.readline()
-                    line = fp.readline().strip().split()
+                value = self._read_values(fp).get(key)
                 self._return_conn(server, fp, sock)
                 return value
             except Exception, e:
@@ -345,14 +435,29 @@ class MemcacheRing(object):
             except Exception, e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
 
-    def set_multi(self, mapping, server_key, serialize=True, timeout=0,
+    def _send(self, msg, server_key):
+        """
+        Sends msg, of noreply commands, to the server of server_key.
+
+        :param server_key: hashed key
+        """
+        for (server, fp, sock) in self._get_conns(server_key):
+            try:
+                sock.sendall(msg)
+                self._return_conn(server, fp, sock)
+                return
+            except Exception, e:
+                self._exception_occurred(server, e, sock=sock, fp=fp)
+
+    def set_multi(self, mapping, server_key=None, serialize=True, timeout=0,
                   time=0, min_compress_len=0):
         """
         Sets multiple key/value pairs in memcache.
 
         :param mapping: dictonary of keys and values to be set in memcache
-        :param servery_key: key to use in determining which server in the ring
-                            is used
+        :param server_key: key to use in determining which server in the ring
+                           is used; if None, each key goes to its own server,
+                           with the keys of each server sent together
         :param serialize: if True, value is serialized with JSON before sending
                           to memcache, or with pickle if configured to use
                           pickle instead of JSON (to avoid cache poisoning)
@@ -371,65 +476,59 @@ class MemcacheRing(object):
         if timeout:
             logging.warn("parameter timeout has been deprecated, use time")
 
-        server_key = md5hash(server_key)
         timeout = sanitize_timeout(time or timeout)
-        msg = ''
+        msgs = {}
         for key, value in mapping.iteritems():
             key = md5hash(key)
-            flags = 0
-            if serialize and self._allow_pickle:
-                value = pickle.dumps(value, PICKLE_PROTOCOL)
-                flags |= PICKLE_FLAG
-            elif serialize:
-                value = json.dumps(value)
-                flags |= JSON_FLAG
-            msg += ('set %s %d %d %s noreply\r\n%s\r\n' %
-                    (key, flags, timeout, len(value), value))
+            flags, value = self._serialize(value, serialize)
+            msgs[key] = ('set %s %d %d %s noreply\r\n%s\r\n' %
+                         (key, flags, timeout, len(value), value))
+        if server_key is not None:
+            self._send(''.join(msgs.itervalues()), md5hash(server_key))
+            return
+        pile = GreenPile(len(self._client_cache))
+        for keys in self._group_by_server(msgs.keys()):
+            pile.spawn(self._send, ''.join(msgs[key] for key in keys),
+                       keys[0])
+        for _junk in pile:
+            pass
+
+    def _get_values(self, keys, server_key):
+        """
+        Gets the values of hashed keys from the server of server_key.
+
+        :param server_key: hashed key
+        :returns: dict of hashed key to value, of the keys found
+        """
         for (server, fp, sock) in self._get_conns(server_key):
             try:
-                sock.sendall(msg)
+                sock.sendall('get %s\r\n' % ' '.join(keys))
+                values = self._read_values(fp)
                 self._return_conn(server, fp, sock)
-                return
+                return values
             except Exception, e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
+        return {}
 
-    def get_multi(self, keys, server_key):
+    def get_multi(self, keys, server_key=None):
         """
         Gets multiple values from memcache for the given keys.
 
         :param keys: keys for values to be retrieved from memcache
-        :param servery_key: key to use in determining which server in the ring
-                            is used
+        :param server_key: key to use in determining which server in the ring
+                           is used; if None, each key is read from its own
+                           server, with one request to each server and all
+                           the requests in parallel
         :returns: list of values
         """
-        server_key = md5hash(server_key)
         keys = [md5hash(key) for key in keys]
-        for (server, fp, sock) in self._get_conns(server_key):
-            try:
-                sock.sendall('get %s\r\n' % ' '.join(keys))
-                line = fp.readline().strip().split()
-                responses = {}
-                while line[0].upper() != 'END':
-                    if line[0].upper() == 'VALUE':
-                        size = int(line[3])
-                        value = fp.read(size)
-                        if int(line[2]) & PICKLE_FLAG:
-                            if self._allow_unpickle:
-                                value = pickle.loads(value)
-                            else:
-                                value = None
-                        elif int(line[2]) & JSON_FLAG:
-                            value = json.loads(value)
-                        responses[line[1]] = value
-                        fp.readline()
-                    line = fp.readline().strip().split()
-                values = []
-                for key in keys:
-                    if key in responses:
-                        values.append(responses[key])
-                    else:
-                        values.append(None)
-                self._return_conn(server, fp, sock)
-                return values
-            except Exception, e:
-                self._exception_occurred(server, e, sock=sock, fp=fp)
+        if server_key is not None:
+            values = self._get_values(keys, md5hash(server_key))
+        else:
+            values = {}
+            pile = GreenPile(len(self._client_cache))
+            for server_keys in self._group_by_server(keys):
+                pile.spawn(self._get_values, server_keys, server_keys[0])
+            for server_values in pile:
+                values.update(server_values)
+        return [values.get(key) for key in keys]
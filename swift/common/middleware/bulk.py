@@ -23,7 +23,8 @@ from swift.common.swob import Request, HTTPBadGateway, \
     HTTPLengthRequired, HTTPException, HTTPServerError, wsgify
 from swift.common.utils import json, get_logger
 from swift.common.constraints import check_utf8, MAX_FILE_SIZE
-from swift.common.http import HTTP_UNAUTHORIZED, HTTP_NOT_FOUND
+from swift.common.http import HTTP_UNAUTHORIZED, HTTP_NOT_FOUND, \
+    HTTP_METHOD_NOT_ALLOWED, HTTP_PRECONDITION_FAILED
 from swift.common.constraints import MAX_OBJECT_NAME_LENGTH, \
     MAX_CONTAINER_NAME_LENGTH
 
@@ -181,6 +182,14 @@ class Bulk(object):
     proxy-logging is used the leftmost logger will not have a
     swift.source set and the content length will reflect the size of the
     payload sent to the proxy (the list of objects/containers to be deleted).
+
+    With delete_batch_size set, consecutive objects of one container are
+    deleted with a single BULK_DELETE subrequest to the container, at most
+    that many at a time, which a proxy in LFS mode carries out without a
+    subrequest per object. The body of the subrequest is a JSON list of the
+    object names and the response a JSON dict of each name to the status of
+    its delete. A proxy that does not know BULK_DELETE answers 405, and the
+    middleware goes back to one DELETE per object.
     """
 
     def __init__(self, app, conf):
@@ -193,6 +202,7 @@ class Bulk(object):
         self.max_deletes_per_request = int(
             conf.get('max_deletes_per_request', 10000))
         self.yield_frequency = int(conf.get('yield_frequency', 60))
+        self.delete_batch_size = int(conf.get('delete_batch_size', 0))
 
     def create_container(self, req, container_path):
         """
@@ -245,6 +255,103 @@ class Bulk(object):
                 raise HTTPBadRequest('Invalid File Name')
         return objs_to_delete
 
+    def delete_subrequest(self, req, delete_path, user_agent, swift_source,
+                          method='DELETE', body=None):
+        """
+        Makes a subrequest of a bulk delete.
+        :params delete_path: an unquoted path to delete
+        :returns: the swob Response
+        """
+        new_env = req.environ.copy()
+        new_env['PATH_INFO'] = delete_path
+        new_env['REQUEST_METHOD'] = method
+        del(new_env['wsgi.input'])
+        new_env['CONTENT_LENGTH'] = 0
+        if body is not None:
+            new_env['CONTENT_TYPE'] = 'application/json'
+        new_env['HTTP_USER_AGENT'] = \
+            '%s %s' % (req.environ.get('HTTP_USER_AGENT'), user_agent)
+        new_env['swift.source'] = swift_source
+        delete_obj_req = Request.blank(delete_path, new_env, body=body)
+        return delete_obj_req.get_response(self.app)
+
+    def batch_delete(self, req, container_path, batch, user_agent,
+                     swift_source):
+        """
+        Deletes objects of one container with a BULK_DELETE subrequest,
+        falling back to a DELETE of each if the proxy does not support it.
+        :params container_path: an unquoted path to the container
+        :params batch: a list of (name as requested, object name) pairs
+        :returns: a list of (name as requested, status_int, status)
+        """
+        if self.delete_batch_size:
+            resp = self.delete_subrequest(
+                req, container_path, user_agent, swift_source,
+                method='BULK_DELETE',
+                body=json.dumps([obj_name for _junk, obj_name in batch]))
+            if resp.status_int // 100 == 2:
+                statuses = dict((name.encode('utf-8'), status)
+                                for name, status in
+                                json.loads(resp.body).iteritems())
+                return [(obj_to_delete,
+                         int(statuses[obj_name].split(' ', 1)[0]),
+                         statuses[obj_name])
+                        for obj_to_delete, obj_name in batch]
+            if resp.status_int != HTTP_METHOD_NOT_ALLOWED:
+                return [(obj_to_delete, resp.status_int, resp.status)
+                        for obj_to_delete, _junk in batch]
+            self.logger.info('BULK_DELETE not supported, deleting objects '
+                             'one at a time')
+            self.delete_batch_size = 0
+        results = []
+        for obj_to_delete, obj_name in batch:
+            resp = self.delete_subrequest(
+                req, '/'.join([container_path, obj_name]), user_agent,
+                swift_source)
+            results.append((obj_to_delete, resp.status_int, resp.status))
+        return results
+
+    def iter_deletes(self, req, vrs, account, objs_to_delete, user_agent,
+                     swift_source):
+        """
+        A generator that deletes the objects and containers, batching the
+        objects of a container if delete_batch_size is set.
+        :returns: a generator of (name as requested, status_int, status)
+        """
+        batch_container = None
+        batch = []
+        for obj_to_delete in objs_to_delete:
+            obj_to_delete = obj_to_delete.strip()
+            if not obj_to_delete:
+                continue
+            delete_path = '/'.join(['', vrs, account,
+                                    obj_to_delete.lstrip('/')])
+            if not check_utf8(delete_path):
+                yield (obj_to_delete, HTTP_PRECONDITION_FAILED,
+                       HTTPPreconditionFailed().status)
+                continue
+            container, _junk, obj_name = \
+                obj_to_delete.lstrip('/').partition('/')
+            if batch and (container != batch_container or not obj_name or
+                          len(batch) >= self.delete_batch_size):
+                for result in self.batch_delete(
+                        req, '/'.join(['', vrs, account, batch_container]),
+                        batch, user_agent, swift_source):
+                    yield result
+                batch = []
+            if self.delete_batch_size and obj_name:
+                batch_container = container
+                batch.append((obj_to_delete, obj_name))
+                continue
+            resp = self.delete_subrequest(req, delete_path, user_agent,
+                                          swift_source)
+            yield obj_to_delete, resp.status_int, resp.status
+        if batch:
+            for result in self.batch_delete(
+                    req, '/'.join(['', vrs, account, batch_container]),
+                    batch, user_agent, swift_source):
+                yield result
+
     def handle_delete_iter(self, req, objs_to_delete=None,
                            user_agent='BulkDelete', swift_source='BD',
                            out_content_type='text/plain'):
@@ -288,41 +395,25 @@ class Bulk(object):
                 objs_to_delete = self.get_objs_to_delete(req)
             failed_file_response_type = HTTPBadRequest
             req.environ['eventlet.minimum_write_chunk_size'] = 0
-            for obj_to_delete in objs_to_delete:
+            for obj_to_delete, status_int, status in self.iter_deletes(
+                    req, vrs, account, objs_to_delete, user_agent,
+                    swift_source):
                 if last_yield + self.yield_frequency < time():
                     separator = '\r\n\r\n'
                     last_yield = time()
                     yield ' '
-                obj_to_delete = obj_to_delete.strip()
-                if not obj_to_delete:
-                    continue
-                delete_path = '/'.join(['', vrs, account,
-                                        obj_to_delete.lstrip('/')])
-                if not check_utf8(delete_path):
-                    failed_files.append([quote(obj_to_delete),
-                                         HTTPPreconditionFailed().status])
-                    continue
-                new_env = req.environ.copy()
-                new_env['PATH_INFO'] = delete_path
-                del(new_env['wsgi.input'])
-                new_env['CONTENT_LENGTH'] = 0
-                new_env['HTTP_USER_AGENT'] = \
-                    '%s %s' % (req.environ.get('HTTP_USER_AGENT'), user_agent)
-                new_env['swift.source'] = swift_source
-                delete_obj_req = Request.blank(delete_path, new_env)
-                resp = delete_obj_req.get_response(self.app)
-                if resp.status_int // 100 == 2:
+                if status_int // 100 == 2:
                     resp_dict['Number Deleted'] += 1
-                elif resp.status_int == HTTP_NOT_FOUND:
+                elif status_int == HTTP_NOT_FOUND:
                     resp_dict['Number Not Found'] += 1
-                elif resp.status_int == HTTP_UNAUTHORIZED:
+                elif status_int == HTTP_UNAUTHORIZED:
                     failed_files.append([quote(obj_to_delete),
                                          HTTPUnauthorized().status])
                     raise HTTPUnauthorized(request=req)
                 else:
-                    if resp.status_int // 100 == 5:
+                    if status_int // 100 == 5:
                         failed_file_response_type = HTTPBadGateway
-                    failed_files.append([quote(obj_to_delete), resp.status])
+                    failed_files.append([quote(obj_to_delete), status])
 
             if failed_files:
                 resp_dict['Response Status'] = \
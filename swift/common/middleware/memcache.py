@@ -16,7 +16,7 @@
 import os
 from ConfigParser import ConfigParser, NoSectionError, NoOptionError
 
-from swift.common.memcached import MemcacheRing
+from swift.common.memcached import MAX_CONNS, MemcacheRing
 
 
 class MemcacheMiddleware(object):
@@ -28,6 +28,7 @@ class MemcacheMiddleware(object):
         self.app = app
         self.memcache_servers = conf.get('memcache_servers')
         serialization_format = conf.get('memcache_serialization_support')
+        max_conns = conf.get('memcache_max_connections')
 
         if not self.memcache_servers or serialization_format is None:
             path = os.path.join(conf.get('swift_dir', '/etc/swift'),
@@ -47,6 +48,12 @@ class MemcacheMiddleware(object):
                                               'memcache_serialization_support')
                     except (NoSectionError, NoOptionError):
                         pass
+                if max_conns is None:
+                    try:
+                        max_conns = memcache_conf.get(
+                            'memcache', 'memcache_max_connections')
+                    except (NoSectionError, NoOptionError):
+                        pass
 
         if not self.memcache_servers:
             self.memcache_servers = '127.0.0.1:11211'
@@ -54,11 +61,16 @@ class MemcacheMiddleware(object):
             serialization_format = 2
         else:
             serialization_format = int(serialization_format)
+        if max_conns is None:
+            max_conns = MAX_CONNS
+        else:
+            max_conns = int(max_conns)
 
         self.memcache = MemcacheRing(
             [s.strip() for s in self.memcache_servers.split(',') if s.strip()],
             allow_pickle=(serialization_format == 0),
-            allow_unpickle=(serialization_format <= 1))
+            allow_unpickle=(serialization_format <= 1),
+            max_conns=max_conns)
 
     def __call__(self, env, start_response):
         env['swift.cache'] = self.memcache
@@ -16,7 +16,8 @@ import time
 import eventlet
 
 from swift.common.utils import cache_from_env, get_logger
-from swift.proxy.controllers.base import get_container_memcache_key
+from swift.proxy.controllers.base import get_container_env_key, \
+    get_container_memcache_key
 from swift.common.memcached import MemcacheConnectionError
 from swift.common.swob import Request, Response
 
@@ -96,7 +97,8 @@ class RateLimitMiddleware(object):
         return None
 
     def get_ratelimitable_key_tuples(self, req_method, account_name,
-                                     container_name=None, obj_name=None):
+                                     container_name=None, obj_name=None,
+                                     env=None):
         """
         Returns a list of key (used in memcache), ratelimit tuples. Keys
         should be checked in order.
@@ -105,6 +107,8 @@ class RateLimitMiddleware(object):
         :param account_name: account name from path
         :param container_name: container name from path
         :param obj_name: object name from path
+        :param env: WSGI environment, where the container info is shared
+                    with the proxy so that it is fetched from memcache once
         """
         keys = []
         # COPYs are not limited
@@ -117,9 +121,14 @@ class RateLimitMiddleware(object):
         if account_name and container_name and obj_name and \
                 req_method in ('PUT', 'DELETE', 'POST'):
             container_size = None
-            memcache_key = get_container_memcache_key(account_name,
-                                                      container_name)
-            container_info = self.memcache_client.get(memcache_key)
+            env_key = get_container_env_key(account_name, container_name)
+            container_info = env.get(env_key) if env is not None else None
+            if container_info is None:
+                memcache_key = get_container_memcache_key(account_name,
+                                                          container_name)
+                container_info = self.memcache_client.get(memcache_key)
+                if env is not None and isinstance(container_info, dict):
+                    env[env_key] = container_info
             if isinstance(container_info, dict):
                 container_size = container_info.get(
                     'object_count', container_info.get('container_size', 0))
@@ -189,7 +198,7 @@ class RateLimitMiddleware(object):
             return None
         for key, max_rate in self.get_ratelimitable_key_tuples(
                 req.method, account_name, container_name=container_name,
-                obj_name=obj_name):
+                obj_name=obj_name, env=req.environ):
             try:
                 need_to_sleep = self._get_sleep_time(key, max_rate)
                 if self.log_sleep_time_seconds and \
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import bisect
+import heapq
 import itertools
 import math
 import random
@@ -41,6 +42,9 @@ class RingBuilder(object):
     a rebalance request is an isolated request or due to added, changed, or
     removed devices.
 
+    The instance variable rebalance_timings lists (phase, seconds) for each
+    phase of the last rebalance, in the order the phases first ran.
+
     :param part_power: number of partitions = 2**part_power.
     :param replicas: number of replicas for each partition
     :param min_part_hours: minimum number of hours between partition changes
@@ -89,6 +93,18 @@ class RingBuilder(object):
         self._remove_devs = []
         self._ring = None
 
+        # _last_max_replicas_by_tier is what _build_max_replicas_by_tier()
+        # returned when partitions were last checked for being spread out,
+        # and _parts_to_recheck is an array of the partitions which were not
+        # spread out then or have been reassigned since. As long as no tier
+        # of a device holding partitions has had its maximum lowered or gone
+        # away, only those partitions need checking again; None for both
+        # means a full check.
+        self._last_max_replicas_by_tier = None
+        self._parts_to_recheck = None
+
+        self.rebalance_timings = []
+
     def weight_of_one_part(self):
         """
         Returns the weight of each partition as calculated from the
@@ -126,6 +142,10 @@ class RingBuilder(object):
             self._last_part_moves = builder._last_part_moves
             self._last_part_gather_start = builder._last_part_gather_start
             self._remove_devs = builder._remove_devs
+            self._last_max_replicas_by_tier = getattr(
+                builder, '_last_max_replicas_by_tier', None)
+            self._parts_to_recheck = getattr(builder, '_parts_to_recheck',
+                                             None)
         else:
             self.part_power = builder['part_power']
             self.replicas = builder['replicas']
@@ -139,6 +159,9 @@ class RingBuilder(object):
             self._last_part_moves = builder['_last_part_moves']
             self._last_part_gather_start = builder['_last_part_gather_start']
             self._remove_devs = builder['_remove_devs']
+            self._last_max_replicas_by_tier = builder.get(
+                '_last_max_replicas_by_tier')
+            self._parts_to_recheck = builder.get('_parts_to_recheck')
         self._ring = None
 
         # Old builders may not have a region defined for their devices, in
@@ -164,7 +187,9 @@ class RingBuilder(object):
                 '_last_part_moves_epoch': self._last_part_moves_epoch,
                 '_last_part_moves': self._last_part_moves,
                 '_last_part_gather_start': self._last_part_gather_start,
-                '_remove_devs': self._remove_devs}
+                '_remove_devs': self._remove_devs,
+                '_last_max_replicas_by_tier': self._last_max_replicas_by_tier,
+                '_parts_to_recheck': self._parts_to_recheck}
 
     def change_min_part_hours(self, min_part_hours):
         """
@@ -329,6 +354,10 @@ class RingBuilder(object):
         can't be balanced no matter what -- like with 3 zones of differing
         weights with replicas set to 3).
 
+        Only the partitions which may have been affected by the device
+        changes since the last rebalance are checked for being spread out;
+        the time taken by each phase is left in rebalance_timings.
+
         :returns: (number_of_partitions_altered, resulting_balance)
         """
 
@@ -336,20 +365,28 @@ class RingBuilder(object):
             random.seed(seed)
 
         self._ring = None
+        self.rebalance_timings = []
+        start = time()
         if self._last_part_moves_epoch is None:
             self._initial_balance()
+            self._record_phase('reassign', start)
             self.devs_changed = False
             return self.parts, self.get_balance()
         retval = 0
         self._update_last_part_moves()
+        start = self._record_phase('update', start)
         last_balance = 0
         new_parts, removed_part_count = self._adjust_replica2part2dev_size()
         retval += removed_part_count
+        start = self._record_phase('adjust', start)
         self._reassign_parts(new_parts)
         retval += len(new_parts)
+        start = self._record_phase('reassign', start)
         while True:
             reassign_parts = self._gather_reassign_parts()
+            start = self._record_phase('gather', start)
             self._reassign_parts(reassign_parts)
+            start = self._record_phase('reassign', start)
             retval += len(reassign_parts)
             while self._remove_devs:
                 self.devs[self._remove_devs.pop()['id']] = None
@@ -362,6 +399,21 @@ class RingBuilder(object):
         self.version += 1
         return retval, balance
 
+    def _record_phase(self, phase, start):
+        """
+        Adds the time since start to phase in rebalance_timings.
+
+        :returns: the current time, to start the next phase with
+        """
+        now = time()
+        for index, (name, seconds) in enumerate(self.rebalance_timings):
+            if name == phase:
+                self.rebalance_timings[index] = (phase, seconds + now - start)
+                break
+        else:
+            self.rebalance_timings.append((phase, now - start))
+        return now
+
     def validate(self, stats=False):
         """
         Validate the ring.
@@ -402,9 +454,12 @@ class RingBuilder(object):
                 for dev_id in part2dev:
                     dev_usage[dev_id] += 1
 
-        for part, replica in self._each_part_replica():
-            dev_id = self._replica2part2dev[replica][part]
-            if dev_id >= dev_len or not self.devs[dev_id]:
+        for replica, part2dev in enumerate(self._replica2part2dev):
+            # Each device is looked at once, rather than once per partition.
+            bad_dev_ids = [dev_id for dev_id in set(part2dev)
+                           if dev_id >= dev_len or not self.devs[dev_id]]
+            if bad_dev_ids:
+                part = min(part2dev.index(dev_id) for dev_id in bad_dev_ids)
                 raise exceptions.RingValidationError(
                     "Partition %d, replica %d was not allocated "
                     "to a device." %
@@ -470,8 +525,7 @@ class RingBuilder(object):
         255 hours ago. This can be used to force a full rebalance on the next
         call to rebalance.
         """
-        for part in xrange(self.parts):
-            self._last_part_moves[part] = 0xff
+        self._last_part_moves = array('B', [0xff]) * self.parts
 
     def get_part_devices(self, part):
         """
@@ -568,7 +622,8 @@ class RingBuilder(object):
                     # newly-added pieces assigned to devices.
                     for part in xrange(len(part2dev), desired_length):
                         to_assign[part].append(replica)
-                        part2dev.append(0)
+                    part2dev.extend(
+                        array('H', [0]) * (desired_length - len(part2dev)))
                 elif len(part2dev) > desired_length:
                     # Too long: truncate this mapping.
                     for part in xrange(desired_length, len(part2dev)):
@@ -582,7 +637,7 @@ class RingBuilder(object):
                 for part in xrange(desired_length):
                     to_assign[part].append(replica)
                 self._replica2part2dev.append(
-                    array('H', (0 for _junk in xrange(desired_length))))
+                    array('H', [0]) * desired_length)
 
         return (list(to_assign.iteritems()), removed_replicas)
 
@@ -591,7 +646,7 @@ class RingBuilder(object):
         Initial partition assignment is the same as rebalancing an
         existing ring, but with some initial setup beforehand.
         """
-        self._last_part_moves = array('B', (0 for _junk in xrange(self.parts)))
+        self._last_part_moves = array('B', [0]) * self.parts
         self._last_part_moves_epoch = int(time())
 
         self._reassign_parts(self._adjust_replica2part2dev_size()[0])
@@ -603,14 +658,15 @@ class RingBuilder(object):
         more recently than min_part_hours.
         """
         elapsed_hours = int(time() - self._last_part_moves_epoch) / 3600
-        for part in xrange(self.parts):
-            # The "min(self._last_part_moves[part] + elapsed_hours, 0xff)"
-            # which was here showed up in profiling, so it got inlined.
-            last_plus_elapsed = self._last_part_moves[part] + elapsed_hours
-            if last_plus_elapsed < 0xff:
-                self._last_part_moves[part] = last_plus_elapsed
-            else:
-                self._last_part_moves[part] = 0xff
+        if elapsed_hours >= 0xff:
+            self._last_part_moves = array('B', [0xff]) * self.parts
+        elif elapsed_hours > 0:
+            # Every partition moved the same number of hours ago maps to
+            # the same new value, so the mapping is only worked out once
+            # for each of the 256 possible ones.
+            moved = [min(last + elapsed_hours, 0xff) for last in xrange(256)]
+            self._last_part_moves = \
+                array('B', map(moved.__getitem__, self._last_part_moves))
         self._last_part_moves_epoch = int(time())
 
     def _gather_reassign_parts(self):
@@ -629,19 +685,26 @@ class RingBuilder(object):
         # choices will skip other replicas of the same partition if possible.
         removed_dev_parts = defaultdict(list)
         if self._remove_devs:
-            dev_ids = [d['id'] for d in self._remove_devs if d['parts']]
+            dev_ids = set(d['id'] for d in self._remove_devs if d['parts'])
             if dev_ids:
-                for part, replica in self._each_part_replica():
-                    dev_id = self._replica2part2dev[replica][part]
-                    if dev_id in dev_ids:
-                        self._last_part_moves[part] = 0
-                        removed_dev_parts[part].append(replica)
+                for replica, part2dev in enumerate(self._replica2part2dev):
+                    for part, dev_id in enumerate(part2dev):
+                        if dev_id in dev_ids:
+                            self._last_part_moves[part] = 0
+                            removed_dev_parts[part].append(replica)
 
         # Now we gather partitions that are "at risk" because they aren't
-        # currently sufficient spread out across the cluster.
+        # currently sufficient spread out across the cluster. Unless the
+        # tiers have changed for the worse, only the partitions which were at
+        # risk or have been reassigned since the last check can be.
         spread_out_parts = defaultdict(list)
         max_allowed_replicas = self._build_max_replicas_by_tier()
-        for part in xrange(self.parts):
+        if self._can_recheck_parts(max_allowed_replicas):
+            parts_to_check = sorted(set(self._parts_to_recheck))
+        else:
+            parts_to_check = xrange(self.parts)
+        parts_at_risk = array('I')
+        for part in parts_to_check:
             # Only move one replica at a time if possible.
             if part in removed_dev_parts:
                 continue
@@ -662,6 +725,7 @@ class RingBuilder(object):
 
             # Now, look for partitions not yet spread out enough and not
             # recently moved.
+            at_risk = False
             for replica in self._replicas_for_part(part):
                 dev = self.devs[self._replica2part2dev[replica][part]]
                 removed_replica = False
@@ -671,9 +735,10 @@ class RingBuilder(object):
                     rep_at_tier = 0
                     if tier in replicas_at_tier:
                         rep_at_tier = replicas_at_tier[tier]
-                    if (rep_at_tier > max_allowed_replicas[tier] and
-                            self._last_part_moves[part] >=
-                            self.min_part_hours):
+                    if rep_at_tier > max_allowed_replicas[tier]:
+                        if self._last_part_moves[part] < self.min_part_hours:
+                            at_risk = True
+                            continue
                         self._last_part_moves[part] = 0
                         spread_out_parts[part].append(replica)
                         dev['parts_wanted'] += 1
@@ -685,6 +750,12 @@ class RingBuilder(object):
                         tfd[dev['id']] = tiers_for_dev(dev)
                     for tier in tfd[dev['id']]:
                         replicas_at_tier[tier] -= 1
+            if at_risk:
+                parts_at_risk.append(part)
+        # The partitions reassigned from here on are added by
+        # _reassign_parts().
+        self._last_max_replicas_by_tier = max_allowed_replicas
+        self._parts_to_recheck = parts_at_risk
 
         # Last, we gather partitions from devices that are "overweight" because
         # they have more partitions than their parts_wanted.
@@ -698,7 +769,13 @@ class RingBuilder(object):
         start += random.randint(0, self.parts / 2)  # GRAH PEP8!!!
 
         self._last_part_gather_start = start
+        # The device is checked first, as few of them are overweight; once
+        # one has given away enough it is dropped from the set.
+        overweight_dev_ids = set(dev['id'] for dev in self._iter_devs()
+                                 if dev['parts_wanted'] < 0)
         for replica, part2dev in enumerate(self._replica2part2dev):
+            if not overweight_dev_ids:
+                break
             # If we've got a partial replica, start may be out of
             # range. Scale it down so that we get a similar movement
             # pattern (but scaled down) on sequential runs.
@@ -706,16 +783,20 @@ class RingBuilder(object):
 
             for part in itertools.chain(xrange(this_start, len(part2dev)),
                                         xrange(0, this_start)):
+                dev_id = part2dev[part]
+                if dev_id not in overweight_dev_ids:
+                    continue
                 if self._last_part_moves[part] < self.min_part_hours:
                     continue
                 if part in removed_dev_parts or part in spread_out_parts:
                     continue
-                dev = self.devs[part2dev[part]]
-                if dev['parts_wanted'] < 0:
-                    self._last_part_moves[part] = 0
-                    dev['parts_wanted'] += 1
-                    dev['parts'] -= 1
-                    reassign_parts[part].append(replica)
+                dev = self.devs[dev_id]
+                self._last_part_moves[part] = 0
+                dev['parts_wanted'] += 1
+                dev['parts'] -= 1
+                reassign_parts[part].append(replica)
+                if dev['parts_wanted'] >= 0:
+                    overweight_dev_ids.discard(dev_id)
 
         reassign_parts.update(spread_out_parts)
         reassign_parts.update(removed_dev_parts)
@@ -752,22 +833,34 @@ class RingBuilder(object):
                                replicas_to_replace may be shared for multiple
                                partitions, so be sure you do not modify it.
         """
+        # Sort keys are ints which end in the device id, so the device of a
+        # key is key & 0xffff. Each tier of more than one device keeps a
+        # heap of the negated sort keys of its devices, of which its
+        # hungriest device is the top once any stale keys, those no longer
+        # current for their device, have been popped off it.
+        tfd = {}
+        dev_sort_key = {}
         for dev in self._iter_devs():
-            dev['sort_key'] = self._sort_key_for(dev)
+            tfd[dev['id']] = tiers_for_dev(dev)
+            dev_sort_key[dev['id']] = self._sort_key_for(dev)
 
-        available_devs = \
-            sorted((d for d in self._iter_devs() if d['weight']),
-                   key=lambda x: x['sort_key'])
+        available_devs = [dev for dev in self._iter_devs() if dev['weight']]
 
-        tier2devs = defaultdict(list)
-        tier2sort_key = defaultdict(list)
+        tier2dev_ids = defaultdict(list)
         max_tier_depth = 0
         for dev in available_devs:
-            for tier in tiers_for_dev(dev):
-                tier2devs[tier].append(dev)  # <-- starts out sorted!
-                tier2sort_key[tier].append(dev['sort_key'])
+            for tier in tfd[dev['id']]:
+                tier2dev_ids[tier].append(dev['id'])
                 if len(tier) > max_tier_depth:
                     max_tier_depth = len(tier)
+        tier2heap = {}
+        tier2max_heap_len = {}
+        for tier, dev_ids in tier2dev_ids.iteritems():
+            heap = tier2heap[tier] = [-dev_sort_key[dev_id]
+                                      for dev_id in dev_ids]
+            heapq.heapify(heap)
+            if len(dev_ids) > 1:
+                tier2max_heap_len[tier] = 2 * len(dev_ids)
 
         tier2children_sets = build_tier_tree(available_devs)
         tier2children = defaultdict(list)
@@ -778,23 +871,24 @@ class RingBuilder(object):
             new_tiers_list = []
             for tier in tiers_list:
                 child_tiers = list(tier2children_sets[tier])
-                child_tiers.sort(key=lambda t: tier2sort_key[t][-1])
+                child_tiers.sort(key=lambda t: -tier2heap[t][0])
                 tier2children[tier] = child_tiers
-                tier2children_sort_key[tier] = map(
-                    lambda t: tier2sort_key[t][-1], child_tiers)
+                tier2children_sort_key[tier] = [-tier2heap[t][0]
+                                                for t in child_tiers]
                 new_tiers_list.extend(child_tiers)
             tiers_list = new_tiers_list
             depth += 1
 
         for part, replace_replicas in reassign_parts:
+            if self._parts_to_recheck is not None:
+                self._parts_to_recheck.append(part)
             # Gather up what other tiers (regions, zones, ip/ports, and
             # devices) the replicas not-to-be-moved are in for this part.
             other_replicas = defaultdict(int)
             unique_tiers_by_tier_len = defaultdict(set)
-            for replica in self._replicas_for_part(part):
-                if replica not in replace_replicas:
-                    dev = self.devs[self._replica2part2dev[replica][part]]
-                    for tier in tiers_for_dev(dev):
+            for replica, part2dev in enumerate(self._replica2part2dev):
+                if part < len(part2dev) and replica not in replace_replicas:
+                    for tier in tfd[part2dev[part]]:
                         other_replicas[tier] += 1
                         unique_tiers_by_tier_len[len(tier)].add(tier)
 
@@ -842,27 +936,34 @@ class RingBuilder(object):
                         tier = (t for t in reversed(candidate_tiers)
                                 if other_replicas[t] == min_count).next()
                     depth += 1
-                dev = tier2devs[tier][-1]
+                dev = self.devs[tier[-1]]
                 dev['parts_wanted'] -= 1
                 dev['parts'] += 1
-                old_sort_key = dev['sort_key']
-                new_sort_key = dev['sort_key'] = self._sort_key_for(dev)
-                for tier in tiers_for_dev(dev):
+                old_sort_key = dev_sort_key[dev['id']]
+                new_sort_key = dev_sort_key[dev['id']] = \
+                    self._sort_key_for(dev)
+                for tier in tfd[dev['id']]:
                     other_replicas[tier] += 1
                     unique_tiers_by_tier_len[len(tier)].add(tier)
 
-                    index = bisect.bisect_left(tier2sort_key[tier],
-                                               old_sort_key)
-                    tier2devs[tier].pop(index)
-                    tier2sort_key[tier].pop(index)
-
-                    new_index = bisect.bisect_left(tier2sort_key[tier],
-                                                   new_sort_key)
-                    tier2devs[tier].insert(new_index, dev)
-                    tier2sort_key[tier].insert(new_index, new_sort_key)
+                    if tier in tier2max_heap_len:
+                        heap = tier2heap[tier]
+                        heapq.heappush(heap, -new_sort_key)
+                        new_last_sort_key = -heap[0]
+                        while dev_sort_key[new_last_sort_key & 0xffff] != \
+                                new_last_sort_key:
+                            heapq.heappop(heap)
+                            new_last_sort_key = -heap[0]
+                        if len(heap) > tier2max_heap_len[tier]:
+                            # Drop the stale keys left below the top.
+                            heap = tier2heap[tier] = [
+                                -dev_sort_key[dev_id]
+                                for dev_id in tier2dev_ids[tier]]
+                            heapq.heapify(heap)
+                    else:
+                        new_last_sort_key = new_sort_key
 
                     # Now jiggle tier2children values to keep them sorted
-                    new_last_sort_key = tier2sort_key[tier][-1]
                     parent_tier = tier[0:-1]
                     index = bisect.bisect_left(
                         tier2children_sort_key[parent_tier],
@@ -879,22 +980,40 @@ class RingBuilder(object):
 
                 self._replica2part2dev[replica][part] = dev['id']
 
-        # Just to save memory and keep from accidental reuse.
-        for dev in self._iter_devs():
-            del dev['sort_key']
-
     def _sort_key_for(self, dev):
-        # The maximum value of self.parts is 2^32, which is 9 hex
-        # digits wide (0x100000000). Using a width of 16 here gives us
-        # plenty of breathing room; you'd need more than 2^28 replicas
-        # to overflow it.
-        # Since the sort key is a string and therefore an ascii sort applies,
-        # the maximum_parts_wanted + parts_wanted is used so negative
-        # parts_wanted end up sorted above positive parts_wanted.
-        return '%016x.%04x.%04x' % (
-            (self.parts * self.replicas) + dev['parts_wanted'],
-            random.randint(0, 0xFFFF),
-            dev['id'])
+        # The sort key packs, from the most significant bits down, the
+        # parts wanted, a random tie breaker and the device id, which is
+        # at most 0xffff as it has to fit the unsigned shorts of
+        # _replica2part2dev. The maximum_parts_wanted + parts_wanted is
+        # used so negative parts_wanted end up sorted above positive
+        # parts_wanted.
+        return (((int(self.parts * self.replicas) + dev['parts_wanted'])
+                 << 32) |
+                (random.randint(0, 0xFFFF) << 16) |
+                dev['id'])
+
+    def _can_recheck_parts(self, max_replicas_by_tier):
+        """
+        Returns True if only the partitions in _parts_to_recheck can be
+        at risk: no device holding partitions has moved to another tier, and
+        none of the tiers of those devices allow fewer replicas than at the
+        last check.
+
+        :param max_replicas_by_tier: from _build_max_replicas_by_tier()
+        """
+        last_max_replicas_by_tier = self._last_max_replicas_by_tier
+        if last_max_replicas_by_tier is None or \
+                self._parts_to_recheck is None:
+            return False
+        for dev in self._iter_devs():
+            if not dev['parts']:
+                continue
+            for tier in tiers_for_dev(dev):
+                if tier not in last_max_replicas_by_tier or \
+                        max_replicas_by_tier[tier] < \
+                        last_max_replicas_by_tier[tier]:
+                    return False
+        return True
 
     def _build_max_replicas_by_tier(self):
         """
@@ -974,14 +1093,6 @@ class RingBuilder(object):
                 in enumerate(self._replica2part2dev)
                 if part < len(part2dev)]
 
-    def _each_part_replica(self):
-        """
-        Generator yielding every (partition, replica) pair in the ring.
-        """
-        for replica, part2dev in enumerate(self._replica2part2dev):
-            for part in xrange(len(part2dev)):
-                yield (part, replica)
-
     @classmethod
     def load(cls, builder_file, open=open):
         """
@@ -995,6 +1106,11 @@ class RingBuilder(object):
             builder_dict = builder
             builder = RingBuilder(1, 1, 1)
             builder.copy_from(builder_dict)
+        # Older builders did not keep the partitions to recheck, so all of
+        # them are checked on their next rebalance.
+        if not hasattr(builder, '_parts_to_recheck'):
+            builder._last_max_replicas_by_tier = None
+            builder._parts_to_recheck = None
         for dev in builder.devs:
             #really old rings didn't have meta keys
             if dev and 'meta' not in dev:
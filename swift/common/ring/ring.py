@@ -15,19 +15,38 @@
 
 import array
 import cPickle as pickle
+import ctypes
+import mmap
+import sys
 from collections import defaultdict
 from gzip import GzipFile
 from os.path import getmtime
 import struct
+from tempfile import mkstemp
 from time import time
 import os
 from io import BufferedReader
 from hashlib import md5
 from itertools import chain
 
-from swift.common.utils import hash_path, validate_configuration, json
+from swift.common.utils import hash_path, validate_configuration, json, \
+    LRUCache
 from swift.common.ring.utils import tiers_for_dev
 
+RING_MAGIC = 'R1NG'
+# The sections of a version 2 ring file start on multiples of this.
+V2_ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return (offset + V2_ALIGNMENT - 1) & ~(V2_ALIGNMENT - 1)
+
+
+def _part2dev_id_string(part2dev_id):
+    if isinstance(part2dev_id, array.array):
+        return part2dev_id.tostring()
+    return array.array('H', part2dev_id).tostring()
+
 
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
@@ -53,13 +72,66 @@ class RingData(object):
         return ring_dict
 
     @classmethod
-    def load(cls, filename):
+    def deserialize_v2(cls, ring_file, use_mmap=False):
+        json_len, = struct.unpack('!I', ring_file.read(4))
+        ring_dict = json.loads(ring_file.read(json_len))
+        lengths = ring_dict.pop('replica_lengths')
+        byteorder = ring_dict.pop('byteorder')
+        offset = _aligned(10 + json_len)
+        ring_dict['replica2part2dev_id'] = []
+        if use_mmap and byteorder == sys.byteorder and any(lengths):
+            # Copy on write, which nothing does: the pages stay those of
+            # the page cache, shared by every process using the ring.
+            mapped = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_COPY)
+            for length in lengths:
+                ring_dict['replica2part2dev_id'].append(
+                    (ctypes.c_uint16 * length).from_buffer(mapped, offset))
+                offset = _aligned(offset + 2 * length)
+            return ring_dict
+        for length in lengths:
+            ring_file.seek(offset)
+            part2dev_id = array.array('H', ring_file.read(2 * length))
+            if byteorder != sys.byteorder:
+                part2dev_id.byteswap()
+            ring_dict['replica2part2dev_id'].append(part2dev_id)
+            offset = _aligned(offset + 2 * length)
+        return ring_dict
+
+    @classmethod
+    def get_format_version(cls, filename):
+        """
+        :param filename: Path to a file serialized by the save() method.
+        :returns: the format version of the file; 0 for a pickled ring
+        """
+        with open(filename, 'rb') as ring_file:
+            if ring_file.read(4) == RING_MAGIC:
+                return struct.unpack('!H', ring_file.read(2))[0]
+        gz_file = GzipFile(filename, 'rb')
+        if gz_file.read(4) == RING_MAGIC:
+            return struct.unpack('!H', gz_file.read(2))[0]
+        return 0
+
+    @classmethod
+    def load(cls, filename, use_mmap=False):
         """
         Load ring data from a file.
 
         :param filename: Path to a file serialized by the save() method.
+        :param use_mmap: if True, the partition tables of a version 2 file
+                         are mapped into memory rather than read
         :returns: A RingData instance containing the loaded data.
         """
+        with open(filename, 'rb') as ring_file:
+            if ring_file.read(4) == RING_MAGIC:
+                # Version 2 and later are not compressed.
+                version, = struct.unpack('!H', ring_file.read(2))
+                if version != 2:
+                    raise Exception('Unknown ring format version %d' %
+                                    version)
+                ring_data = cls.deserialize_v2(ring_file, use_mmap)
+                return RingData(ring_data['replica2part2dev_id'],
+                                ring_data['devs'], ring_data['part_shift'])
+
         gz_file = GzipFile(filename, 'rb')
         # Python 2.6 GzipFile doesn't support BufferedIO
         if hasattr(gz_file, '_checkReadable'):
@@ -94,26 +166,73 @@ class RingData(object):
         file_obj.write(struct.pack('!I', json_len))
         file_obj.write(json_text)
         for part2dev_id in ring['replica2part2dev_id']:
-            file_obj.write(part2dev_id.tostring())
+            file_obj.write(_part2dev_id_string(part2dev_id))
 
-    def save(self, filename):
+    def serialize_v2(self, file_obj):
+        """
+        Write the ring uncompressed, with each partition table in the byte
+        order of this host and aligned, so that it can be used in place.
+        """
+        ring = self.to_dict()
+        json_encoder = json.JSONEncoder(sort_keys=True)
+        json_text = json_encoder.encode(
+            {'devs': ring['devs'], 'part_shift': ring['part_shift'],
+             'replica_count': len(ring['replica2part2dev_id']),
+             'replica_lengths': [len(part2dev_id) for part2dev_id in
+                                 ring['replica2part2dev_id']],
+             'byteorder': sys.byteorder})
+        file_obj.write(struct.pack('!4sHI', RING_MAGIC, 2, len(json_text)))
+        file_obj.write(json_text)
+        offset = 10 + len(json_text)
+        for part2dev_id in ring['replica2part2dev_id']:
+            file_obj.write('\0' * (_aligned(offset) - offset))
+            data = _part2dev_id_string(part2dev_id)
+            file_obj.write(data)
+            offset = _aligned(offset) + len(data)
+
+    def save(self, filename, format_version=1):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
+        :param format_version: 1 for a gzipped ring, which every version of
+                               Swift reads, or 2 for one that is mapped into
+                               memory and reloads at once
         """
-        # Override the timestamp so that the same ring data creates
-        # the same bytes on disk. This makes a checksum comparison a
-        # good way to see if two rings are identical.
-        #
-        # This only works on Python 2.7; on 2.6, we always get the
-        # current time in the gzip output.
+        if format_version not in (1, 2):
+            raise ValueError('Unknown ring format version %d' %
+                             format_version)
+        # Written aside and renamed over the old file, which processes
+        # may still have mapped: truncating it would pull the pages from
+        # under them.
+        fd, tmp_path = mkstemp(dir=os.path.dirname(filename) or '.',
+                               prefix='.ring-')
         try:
-            gz_file = GzipFile(filename, 'wb', mtime=1300507380.0)
-        except TypeError:
-            gz_file = GzipFile(filename, 'wb')
-        self.serialize_v1(gz_file)
-        gz_file.close()
+            with os.fdopen(fd, 'wb') as file_obj:
+                if format_version == 2:
+                    self.serialize_v2(file_obj)
+                else:
+                    # Override the timestamp so that the same ring data
+                    # creates the same bytes on disk. This makes a checksum
+                    # comparison a good way to see if two rings are
+                    # identical.
+                    #
+                    # This only works on Python 2.7; on 2.6, we always get
+                    # the current time in the gzip output.
+                    try:
+                        gz_file = GzipFile(filename, 'wb', fileobj=file_obj,
+                                           mtime=1300507380.0)
+                    except TypeError:
+                        gz_file = GzipFile(filename, 'wb', fileobj=file_obj)
+                    self.serialize_v1(gz_file)
+                    gz_file.close()
+                file_obj.flush()
+                os.fsync(file_obj.fileno())
+            os.chmod(tmp_path, 0644)
+            os.rename(tmp_path, filename)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
 
     def to_dict(self):
         return {'devs': self.devs,
@@ -121,15 +240,46 @@ class RingData(object):
                 'part_shift': self._part_shift}
 
 
+# Partitions whose handoff sequences are kept by a Ring.
+HANDOFF_CACHE_SIZE = 1024
+
+
+class _HandoffSequence(object):
+    """
+    The handoff nodes of a partition, computed as far as they have been
+    asked for and shared by everybody who asks for them again.
+    """
+
+    def __init__(self, handoffs):
+        self.devs = []
+        self._handoffs = handoffs
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i == len(self.devs):
+                if self._handoffs is None:
+                    return
+                try:
+                    self.devs.append(next(self._handoffs))
+                except StopIteration:
+                    self._handoffs = None
+                    return
+            yield self.devs[i]
+            i += 1
+
+
 class Ring(object):
     """
     Partitioned consistent hashing ring.
 
     :param serialized_path: path to serialized RingData instance
     :param reload_time: time interval in seconds to check for a ring change
+    :param handoff_cache_size: partitions whose handoff sequences are kept
     """
 
-    def __init__(self, serialized_path, reload_time=15, ring_name=None):
+    def __init__(self, serialized_path, reload_time=15, ring_name=None,
+                 handoff_cache_size=HANDOFF_CACHE_SIZE):
         # can't use the ring unless HASH_PATH_SUFFIX is set
         validate_configuration()
         if ring_name:
@@ -138,12 +288,13 @@ class Ring(object):
         else:
             self.serialized_path = os.path.join(serialized_path)
         self.reload_time = reload_time
+        self.handoff_cache_size = handoff_cache_size
         self._reload(force=True)
 
     def _reload(self, force=False):
         self._rtime = time() + self.reload_time
         if force or self.has_changed():
-            ring_data = RingData.load(self.serialized_path)
+            ring_data = RingData.load(self.serialized_path, use_mmap=True)
             self._mtime = getmtime(self.serialized_path)
             self._devs = ring_data.devs
             # NOTE(akscram): Replication parameters like replication_ip
@@ -160,6 +311,7 @@ class Ring(object):
 
             self._replica2part2dev_id = ring_data._replica2part2dev_id
             self._part_shift = ring_data._part_shift
+            self._handoffs = LRUCache(self.handoff_cache_size)
             self._rebuild_tier_data()
 
     def _rebuild_tier_data(self):
@@ -277,6 +429,30 @@ class Ring(object):
         part = self.get_part(account, container, obj)
         return part, self._get_part_nodes(part)
 
+    def get_nodes_batch(self, paths):
+        """
+        Get the partitions and nodes for many paths at once. The ring is
+        checked for changes once, and the nodes of a partition are looked
+        up once however many of the paths map to it.
+
+        :param paths: iterable of (account, [container, [object]]) tuples
+        :returns: list of (partition, list of node dicts) tuples, in the
+                  order of paths; each list of nodes is the caller's own
+
+        See :func:`get_nodes` for a description of the node dicts.
+        """
+        if time() > self._rtime:
+            self._reload()
+        unpack = struct.unpack_from
+        part_shift = self._part_shift
+        parts = [unpack('>I', hash_path(*path, raw_digest=True))[0]
+                 >> part_shift for path in paths]
+        part_nodes = {}
+        for part in parts:
+            if part not in part_nodes:
+                part_nodes[part] = self._get_part_nodes(part)
+        return [(part, list(part_nodes[part])) for part in parts]
+
     def get_more_nodes(self, part):
         """
         Generator to get extra nodes for a partition for hinted handoff.
@@ -286,6 +462,10 @@ class Ring(object):
         will usually keep the same sequences of handoffs even with
         ring changes.
 
+        The sequences of the last handoff_cache_size partitions are kept,
+        as far as they have been walked, so a partition asked for again
+        does not cost another walk of the ring.
+
         :param part: partition to get handoff nodes for
         :returns: generator of node dicts
 
@@ -293,13 +473,26 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
+        if not self.handoff_cache_size:
+            return self._iter_handoffs(part)
+        handoffs = self._handoffs.get(part)
+        if handoffs is None:
+            handoffs = _HandoffSequence(self._iter_handoffs(part))
+            self._handoffs.set(part, handoffs)
+        return iter(handoffs)
+
+    def _iter_handoffs(self, part):
+        """Walks the ring for the handoff nodes of get_more_nodes()."""
+        # The ring as it is now, should it be reloaded during the walk.
+        replica2part2dev_id = self._replica2part2dev_id
+        devs = self._devs
         primary_nodes = self._get_part_nodes(part)
 
         used = set(d['id'] for d in primary_nodes)
         same_regions = set(d['region'] for d in primary_nodes)
         same_zones = set((d['region'], d['zone']) for d in primary_nodes)
 
-        parts = len(self._replica2part2dev_id[0])
+        parts = len(replica2part2dev_id[0])
         start = struct.unpack_from(
             '>I', md5(str(part)).digest())[0] >> self._part_shift
         inc = int(parts / 65536) or 1
@@ -308,10 +501,10 @@ class Ring(object):
         for handoff_part in chain(xrange(start, parts, inc),
                                   xrange(inc - ((parts - start) % inc),
                                          start, inc)):
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
-                    dev = self._devs[dev_id]
+                    dev = devs[dev_id]
                     region = dev['region']
                     zone = (dev['region'], dev['zone'])
                     if dev_id not in used and region not in same_regions:
@@ -323,10 +516,10 @@ class Ring(object):
         for handoff_part in chain(xrange(start, parts, inc),
                                   xrange(inc - ((parts - start) % inc),
                                          start, inc)):
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
-                    dev = self._devs[dev_id]
+                    dev = devs[dev_id]
                     zone = (dev['region'], dev['zone'])
                     if dev_id not in used and zone not in same_zones:
                         yield dev
@@ -336,9 +529,9 @@ class Ring(object):
         for handoff_part in chain(xrange(start, parts, inc),
                                   xrange(inc - ((parts - start) % inc),
                                          start, inc)):
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
                     if dev_id not in used:
-                        yield self._devs[dev_id]
+                        yield devs[dev_id]
                         used.add(dev_id)
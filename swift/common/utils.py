@@ -46,6 +46,7 @@ import glob
 from urlparse import urlparse as stdlib_urlparse, ParseResult
 import itertools
 import stat
+from collections import deque
 
 import eventlet
 import eventlet.semaphore
@@ -640,6 +641,9 @@ class StatsdClient(object):
     def timing(self, metric, timing_ms, sample_rate=None):
         return self._send(metric, timing_ms, 'ms', sample_rate)
 
+    def gauge(self, metric, value, sample_rate=None):
+        return self._send(metric, value, 'g', sample_rate)
+
     def timing_since(self, metric, orig_time, sample_rate=None):
         return self.timing(metric, (time.time() - orig_time) * 1000,
                            sample_rate)
@@ -805,6 +809,7 @@ class LogAdapter(logging.LoggerAdapter, object):
     timing = statsd_delegate('timing')
     timing_since = statsd_delegate('timing_since')
     transfer_rate = statsd_delegate('transfer_rate')
+    gauge = statsd_delegate('gauge')
 
 
 class SwiftLogFormatter(logging.Formatter):
@@ -1985,6 +1990,112 @@ class InputProxy(object):
         return line
 
 
+class LRUCache(object):
+    """
+    Bounded in-process cache that drops the least recently used entries,
+    and entries past their expiry time.
+
+    Recency is kept in a deque of (serial, key) with stale pairs left in
+    place and skipped, rather than in an OrderedDict, which Python 2.6 lacks.
+
+    :param max_entries: entries kept before the least recently used are
+                        dropped
+    :param max_size: total of the sizes given to set() that is kept, or None
+                     for no limit; a single entry larger than that is not
+                     cached
+    """
+
+    def __init__(self, max_entries, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        # key -> [serial, expires, size, value]
+        self._entries = {}
+        self._order = deque()
+        self._serial = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        """
+        :returns: the cached keys, least recently used first
+        """
+        return [key for serial, key in self._order
+                if self._is_current(serial, key)]
+
+    def expires(self, key):
+        """
+        :returns: the expiry time of key, or None
+        """
+        entry = self._entries.get(key)
+        return entry and entry[1]
+
+    def _is_current(self, serial, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == serial
+
+    def _touch(self, key, entry):
+        entry[0] = next(self._serial)
+        self._order.append((entry[0], key))
+        if len(self._order) > 2 * len(self._entries) + 16:
+            self._order = deque((entry[0], key) for key, entry in
+                                sorted(self._entries.iteritems(),
+                                       key=lambda item: item[1][0]))
+
+    def get(self, key):
+        """
+        :returns: the cached value of key, or None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self.pop(key)
+            return None
+        self._touch(key, entry)
+        return entry[3]
+
+    def set(self, key, value, expires=None, size=1):
+        """
+        Cache value for key.
+
+        :param expires: time after which the entry is dropped, if any
+        :param size: size of the entry, counted against max_size
+        :returns: True if the value was stored
+        """
+        self.pop(key)
+        if self.max_size is not None and size > self.max_size:
+            return False
+        entry = [None, expires, size, value]
+        self._entries[key] = entry
+        self.size += size
+        self._touch(key, entry)
+        while len(self._entries) > self.max_entries or \
+                (self.max_size is not None and self.size > self.max_size):
+            serial, old_key = self._order.popleft()
+            if self._is_current(serial, old_key):
+                self.pop(old_key)
+        return True
+
+    def pop(self, key):
+        """
+        Forget key.
+
+        :returns: the value that was cached for key, or None
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.size -= entry[2]
+        return entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self._order.clear()
+        self.size = 0
+
+
 def tpool_reraise(func, *args, **kwargs):
     """
     Hack to work around Eventlet's tpool not catching and reraising Timeouts.
@@ -104,6 +104,13 @@ def get_container_memcache_key(account, container):
     return cache_key
 
 
+def get_container_env_key(account, container):
+    if not container:
+        raise ValueError("container not provided")
+    cache_key, env_key = _get_cache_key(account, container)
+    return env_key
+
+
 def headers_to_account_info(headers, status_int=HTTP_OK):
     """
     Construct a cacheable dict of account info based on response headers.
@@ -267,9 +274,29 @@ def _get_cache_key(account, container):
     return cache_key, env_key
 
 
+def _get_cache_time(app, container, status_int):
+    """
+    Get the seconds that info is cached for.
+
+    :param  app: the application object
+    :param  container: the unquoted container name or None
+    :param  status_int: the status of the response the info came from
+    :returns the cache time, or None if the info is not to be cached
+    """
+    if container:
+        cache_time = app.recheck_container_existence
+    else:
+        cache_time = app.recheck_account_existence
+    if status_int == HTTP_NOT_FOUND:
+        return cache_time * 0.1
+    elif not is_success(status_int):
+        return None
+    return cache_time
+
+
 def _set_info_cache(app, env, account, container, resp):
     """
-    Cache info in both memcache and env.
+    Cache info in memcache, the in-process cache of the proxy and env.
 
     Caching is used to avoid unnecessary calls to account & container servers.
     This is a private function that is being called by GETorHEAD_base and
@@ -283,26 +310,22 @@ def _set_info_cache(app, env, account, container, resp):
     :param resp: the response received or None if info cache should be cleared
     """
 
-    if container:
-        cache_time = app.recheck_container_existence
-    else:
-        cache_time = app.recheck_account_existence
     cache_key, env_key = _get_cache_key(account, container)
 
     if resp:
-        if resp.status_int == HTTP_NOT_FOUND:
-            cache_time *= 0.1
-        elif not is_success(resp.status_int):
-            cache_time = None
+        cache_time = _get_cache_time(app, container, resp.status_int)
     else:
         cache_time = None
 
-    # Next actually set both memcache and the env chache
+    # Next actually set memcache, the in-process cache and the env chache
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    info_cache = getattr(app, 'info_cache', None)
     if not cache_time:
         env.pop(env_key, None)
         if memcache:
             memcache.delete(cache_key)
+        if info_cache:
+            info_cache.invalidate(cache_key)
         return
 
     if container:
@@ -311,12 +334,14 @@ def _set_info_cache(app, env, account, container, resp):
         info = headers_to_account_info(resp.headers, resp.status_int)
     if memcache:
         memcache.set(cache_key, info, cache_time)
+    if info_cache:
+        info_cache.set(cache_key, info, cache_time)
     env[env_key] = info
 
 
 def clear_info_cache(app, env, account, container=None):
     """
-    Clear the cached info in both memcache and env
+    Clear the cached info in memcache, the in-process cache and env
 
     :param  app: the application object
     :param  account: the account name
@@ -327,7 +352,8 @@ def clear_info_cache(app, env, account, container=None):
 
 def _get_info_cache(app, env, account, container=None):
     """
-    Get the cached info from env or memcache (if used) in that order
+    Get the cached info from env, the in-process cache of the proxy or
+    memcache (if used) in that order
     Used for both account and container info
     A private function used by get_info
 
@@ -339,11 +365,35 @@ def _get_info_cache(app, env, account, container=None):
     cache_key, env_key = _get_cache_key(account, container)
     if env_key in env:
         return env[env_key]
+    info_cache = getattr(app, 'info_cache', None)
+    if info_cache:
+        info = info_cache.get(cache_key)
+        if info:
+            env[env_key] = info
+            return info
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
     if memcache:
-        info = memcache.get(cache_key)
+        account_key, account_env_key = _get_cache_key(account, None)
+        account_info = None
+        if container and account_env_key not in env and \
+                hasattr(memcache, 'get_multi') and \
+                not (info_cache and info_cache.get(account_key)):
+            # If the container is not cached, the account is looked up
+            # next: fetch both in one round trip.
+            info, account_info = memcache.get_multi([cache_key, account_key])
+            if account_info:
+                env[account_env_key] = account_info
+        else:
+            info = memcache.get(cache_key)
         if info:
             env[env_key] = info
+        if info_cache:
+            for key, cont, found in ((cache_key, container, info),
+                                     (account_key, None, account_info)):
+                cache_time = found and _get_cache_time(
+                    app, cont, found.get('status'))
+                if cache_time:
+                    info_cache.set(key, found, cache_time)
         return info
     return None
 
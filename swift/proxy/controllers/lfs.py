@@ -14,21 +14,30 @@
 # limitations under the License.
 
 # hopefuly we will get rid of import os with a better API to LFSPlugin
+import itertools
+import mimetypes
 import os
 import pkg_resources
 import time
+from contextlib import contextmanager
+from datetime import datetime
+from random import random
+from types import GeneratorType
 from hashlib import md5
-from urllib import unquote
+from urllib import quote, unquote
+from xml.sax import saxutils
 
-from eventlet import sleep
+from eventlet import GreenPool, sleep, spawn
 from eventlet.queue import Queue
 
 from swift.common.constraints import (ACCOUNT_LISTING_LIMIT, check_mount,
-    check_object_creation, FORMAT2CONTENT_TYPE, MAX_FILE_SIZE)
+    check_object_creation, CONTAINER_LISTING_LIMIT, FORMAT2CONTENT_TYPE,
+    MAX_FILE_SIZE)
 from swift.common.exceptions import (
     ChunkReadTimeout, ChunkWriteTimeout, ConnectionTimeout,
-    DiskFileError, DiskFileNotExist,
-    ListingIterNotFound, ListingIterNotAuthorized, ListingIterError)
+    DiskFileError, DiskFileNoSpace, DiskFileNotExist,
+    ListingIterNotFound, ListingIterNotAuthorized, ListingIterError,
+    SegmentError)
 from swift.common.swob import (
     HTTPAccepted,
     HTTPBadRequest,
@@ -36,19 +45,29 @@ from swift.common.swob import (
     HTTPCreated,
     HTTPForbidden,
     HTTPInsufficientStorage,
+    HTTPMethodNotAllowed,
     HTTPNoContent,
     HTTPNotAcceptable,
     HTTPNotFound,
+    HTTPNotModified,
     HTTPPreconditionFailed,
     HTTPRequestEntityTooLarge,
-    Response)
-from swift.common.utils import (ContextPool, get_param, json,
-    normalize_timestamp, public)
+    multi_range_iterator,
+    Request,
+    Response,
+    UTC)
+from swift.common.http import HTTP_MULTIPLE_CHOICES, HTTP_NOT_FOUND, HTTP_OK
+from swift.common.request_helpers import get_param
+from swift.common.utils import (config_true_value, ContextPool, json,
+    normalize_timestamp, public, ThreadPool)
 from swift.proxy.controllers.base import Controller
-from swift.proxy.controllers.obj import SegmentedIterable
 
 
 import swift.proxy.lfs_posix
+from swift.proxy.lfs_cache import cache_key
+from swift.proxy.lfs_checksum import CHECKSUM_HEADER, format_checksum
+from swift.proxy.lfs_expirer import is_expired
+from swift.proxy.lfs_writer import lfs_writer
 
 gluster_shortcut = True
 try:
@@ -56,8 +75,40 @@ try:
 except ImportError:
     gluster_shortcut = False
 
-# raise Exception("LFS unknown %s" % str(self.app.lfs_mode))
+# Methods every plugin must implement, see LFSPlugin at the bottom.
+LFS_REQUIRED_METHODS = (
+    'exists', 'initialize', 'get_info', 'update_metadata',
+    'update_put_timestamp', 'list_containers_iter', 'list_objects_iter',
+    'put_container', 'mkstemp', 'put', 'put_metadata', '__iter__', 'close',
+    'unlinkold', 'get_data_file_size', 'quarantine')
+
+# Optional parts of the plugin contract. A plugin has the capability when
+# it implements the method; controllers check the flag instead of hasattr.
+LFS_OPTIONAL_METHODS = {
+    'ranges': 'app_iter_ranges',
+    'delete_object': 'delete_object',
+    'listing_stream': 'iter_objects',
+    'bulk_metadata': 'get_objects_metadata',
+    'zero_copy': 'iter_file',
+    'writer': 'writer',
+    'stats_update': 'update_stats',
+    'copy': 'copy',
+    'delete': 'delete',
+    'bulk_delete': 'delete_objects',
+}
+# Objects handed to one delete_objects() call of a BULK_DELETE.
+LFS_DELETE_BATCH = 100
+
+
 def load_the_plugin(selector):
+    """
+    Resolve the plugin class for an lfs_mode selector. This may scan the
+    entry points, so call it through LFSPluginRegistry, not per request.
+
+    :param selector: the lfs_mode value, e.g. 'posix' or 'gluster'
+    :returns: the plugin class
+    :raises ValueError: if no plugin is known under the selector
+    """
     # Special-case a local plugin - primarily for testing
     if selector == 'posix':
         return swift.proxy.lfs_posix.LFSPluginPosix
@@ -66,9 +117,653 @@ def load_the_plugin(selector):
         return gluster.swift.common.lfs_plugin.LFSPluginGluster
     group = 'swift.lfs_plugin.%s' % selector
     name = 'plugin_class'
-    entry_point = pkg_resources.iter_entry_points(group, name=name)[0]
-    plugin_class = entry_point.load()
-    return plugin_class
+    for entry_point in pkg_resources.iter_entry_points(group, name=name):
+        return entry_point.load()
+    raise ValueError('Unknown lfs_mode %r' % selector)
+
+
+class LFSPluginRegistry(object):
+    """
+    Resolves LFS plugin classes once per Application and remembers what
+    each of them can do. The proxy calls load() at startup, so requests
+    only do a dict lookup; a new configuration comes with new workers.
+    """
+
+    def __init__(self):
+        self._plugins = {}
+        self._capabilities = {}
+
+    def load(self, selector):
+        """
+        Resolve and validate a plugin, caching the result.
+
+        :param selector: the lfs_mode value
+        :returns: the plugin class
+        :raises ValueError: if the plugin is unknown or does not implement
+                            the required methods
+        """
+        plugin_class = load_the_plugin(selector)
+        missing = [m for m in LFS_REQUIRED_METHODS
+                   if not callable(getattr(plugin_class, m, None))]
+        if missing:
+            raise ValueError('LFS plugin %r is missing required methods: %s' %
+                             (selector, ', '.join(missing)))
+        self._capabilities[selector] = dict(
+            (cap, callable(getattr(plugin_class, method, None)))
+            for cap, method in LFS_OPTIONAL_METHODS.iteritems())
+        self._plugins[selector] = plugin_class
+        return plugin_class
+
+    def get(self, selector):
+        """
+        :returns: the plugin class for selector, loading it if needed
+        """
+        try:
+            return self._plugins[selector]
+        except KeyError:
+            return self.load(selector)
+
+    def capabilities(self, selector):
+        """
+        :returns: dict of capability name to True/False for the plugin
+        """
+        if selector not in self._capabilities:
+            self.load(selector)
+        return self._capabilities[selector]
+
+    def has(self, selector, capability):
+        """
+        :returns: True if the plugin implements the optional capability
+        """
+        return self.capabilities(selector).get(capability, False)
+
+
+# Generators handed out by plugins are advanced in the thread pool this
+# many items at a time, so a listing does not pay a thread hop per row.
+LFS_THREADED_ITER_BATCH = 100
+# Plugin methods that return object data; these go one chunk at a time.
+LFS_DATA_ITER_METHODS = ('iter_file', 'app_iter_range', 'app_iter_ranges')
+
+
+class LFSThreadPools(object):
+    """
+    Thread pools for the blocking filesystem calls of LFS plugins, one per
+    mount, like the object server keeps one per disk. A slow stat or xattr
+    call then only holds up the requests for that mount instead of the whole
+    eventlet hub.
+
+    :param threads_per_mount: threads in each pool; 0 runs the calls in the
+                              calling greenthread
+    :param logger: logger for the queue statistics
+    :param report_interval: seconds between reports of the queue depths as
+                            gauges; 0 for none
+    """
+
+    def __init__(self, threads_per_mount, logger, report_interval=0):
+        self.threads_per_mount = threads_per_mount
+        self.logger = logger
+        self.report_interval = report_interval
+        self.pools = {}
+        self.depth = {}
+        self.max_depth = {}
+        self.queued = {}
+        self.reporter = None
+
+    def get(self, mount):
+        """
+        :returns: the ThreadPool for mount, creating it if needed
+        """
+        try:
+            return self.pools[mount]
+        except KeyError:
+            pool = ThreadPool(nthreads=self.threads_per_mount)
+            self.pools[mount] = pool
+            self.depth[mount] = self.max_depth[mount] = self.queued[mount] = 0
+            # Started on first use, so that each forked worker gets its own.
+            if self.report_interval > 0 and self.reporter is None:
+                self.reporter = spawn(self._run)
+            return pool
+
+    def run_in_thread(self, mount, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in the pool of mount, keeping track of how
+        many calls are waiting for it.
+
+        :returns: result of calling func
+        :raises: whatever func raises
+        """
+        pool = self.get(mount)
+        self.depth[mount] += 1
+        depth = self.depth[mount]
+        if depth > self.max_depth[mount]:
+            self.max_depth[mount] = depth
+        if 0 < self.threads_per_mount < depth:
+            # Every thread is busy, so this call sits in the queue.
+            self.queued[mount] += 1
+            self.logger.increment('lfs.threadpool.queued')
+        start = time.time()
+        try:
+            return pool.run_in_thread(func, *args, **kwargs)
+        finally:
+            self.depth[mount] -= 1
+            self.logger.timing_since('lfs.threadpool.timing', start)
+
+    def stats(self, mount):
+        """
+        :returns: dict with the threads, current queue depth, highest queue
+                  depth and number of calls that had to queue for mount
+        """
+        self.get(mount)
+        return {'threads': self.threads_per_mount,
+                'depth': self.depth[mount],
+                'max_depth': self.max_depth[mount],
+                'queued': self.queued[mount]}
+
+    def report(self):
+        """
+        Send the calls now waiting on all the mounts, and the most that
+        waited on any one mount since the last report, as gauges.
+        """
+        if not self.pools:
+            return
+        self.logger.gauge('lfs.threadpool.depth', sum(self.depth.values()))
+        self.logger.gauge('lfs.threadpool.max_depth',
+                          max(self.max_depth.values()))
+        for mount, depth in self.depth.iteritems():
+            self.max_depth[mount] = depth
+
+    def _run(self):
+        while True:
+            sleep(self.report_interval)
+            try:
+                self.report()
+            except Exception:
+                self.logger.exception(_('ERROR reporting LFS thread pools'))
+
+
+class LFSThreadedBroker(object):
+    """
+    Wraps a plugin broker so that its methods run in an LFS thread pool.
+    Attributes such as metadata pass through; generators that the plugin
+    returns, including the object body, are advanced in the pool too.
+
+    :param pbroker: the plugin broker
+    :param threadpools: the application's LFSThreadPools
+    :param mount: the mount the broker lives on
+    """
+
+    def __init__(self, pbroker, threadpools, mount):
+        self.pbroker = pbroker
+        self.threadpools = threadpools
+        self.mount = mount
+
+    def __getattr__(self, name):
+        attr = getattr(self.pbroker, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def run(*args, **kwargs):
+            result = self.threadpools.run_in_thread(self.mount, attr,
+                                                    *args, **kwargs)
+            if isinstance(result, GeneratorType):
+                if name in LFS_DATA_ITER_METHODS:
+                    return self._iter_in_thread(result, 1)
+                return self._iter_in_thread(result, LFS_THREADED_ITER_BATCH)
+            return result
+        return run
+
+    def _iter_in_thread(self, iterator, batch):
+        def next_batch():
+            return list(itertools.islice(iterator, batch))
+        while True:
+            items = self.threadpools.run_in_thread(self.mount, next_batch)
+            if not items:
+                return
+            for item in items:
+                yield item
+
+    def __iter__(self):
+        # One chunk at a time: chunks are large and go to the client as
+        # soon as they are read.
+        return self._iter_in_thread(iter(self.pbroker), 1)
+
+
+# Chunks a PUT may have read ahead of the disk: one being written and one
+# waiting, so the next network read overlaps the current write.
+LFS_WRITE_QUEUE_DEPTH = 2
+
+
+class LFSPipelinedWriter(object):
+    """
+    Feeds the chunks of a PUT to a plugin writer (see lfs_writer) from a
+    separate greenthread, which hashes and writes them and does the
+    periodic fdatasync in the thread pool of the mount. The request
+    greenthread only queues each chunk and goes back to reading the client;
+    it waits once LFS_WRITE_QUEUE_DEPTH chunks are in flight, so memory
+    stays bounded when the disk is the slower side.
+
+    :param writer: the LFSWriter of the plugin
+    :param threadpools: the application's LFSThreadPools
+    :param mount: the mount the writer lives on
+    :param bytes_per_sync: bytes between fdatasync calls
+    :param checksum_engine: (name, factory) of the extra checksum, see
+                            lfs_checksum.get_checksum_engine()
+    """
+
+    def __init__(self, writer, threadpools, mount, bytes_per_sync,
+                 checksum_engine=(None, None)):
+        self.writer = writer
+        self.threadpools = threadpools
+        self.mount = mount
+        self.bytes_per_sync = bytes_per_sync
+        self.etag = md5()
+        self.checksum_name, factory = checksum_engine
+        self.checksum = factory() if factory else None
+        self.error = None
+        self.aborted = False
+        # The chunk in the hands of the drainer is the other buffer.
+        self.queue = Queue(LFS_WRITE_QUEUE_DEPTH - 1)
+        self.pool = GreenPool(1)
+        self.pool.spawn_n(self._drain)
+
+    def _drain(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.aborted or self.error is not None:
+                # Keep emptying the queue so that write() never blocks.
+                continue
+            try:
+                self.threadpools.run_in_thread(self.mount, self._write, chunk)
+                # For large files sync every 512MB (by default) written
+                if self.writer.upload_size - self.writer.last_sync >= \
+                        self.bytes_per_sync:
+                    self.threadpools.get(self.mount).force_run_in_thread(
+                        self.writer.sync)
+            except Exception as err:
+                self.error = err
+
+    def _write(self, chunk):
+        # Hashing here keeps it off the request greenthread; hashlib lets
+        # go of the GIL for large chunks.
+        self.etag.update(chunk)
+        if self.checksum:
+            self.checksum.update(chunk)
+        self.writer.write(chunk)
+
+    def write(self, chunk):
+        """
+        Queue a chunk for hashing and writing, waiting while the queue is full.
+
+        :raises: whatever an earlier write raised
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(chunk)
+
+    def close(self):
+        """
+        Wait until every queued chunk is written.
+
+        :raises: whatever a write raised
+        """
+        if self.pool.running():
+            self.queue.put(None)
+            self.pool.waitall()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """Stop writing, dropping whatever is still queued."""
+        if self.pool.running():
+            self.aborted = True
+            self.queue.put(None)
+            self.pool.waitall()
+
+    def checksum_header(self):
+        """
+        :returns: the CHECKSUM_HEADER value for the data written, or None
+                  without a checksum engine; call after close()
+        """
+        if not self.checksum:
+            return None
+        return format_checksum(self.checksum_name, self.checksum)
+
+    def put(self, metadata):
+        """
+        Finish the writes and finalize the object with metadata.
+        """
+        self.close()
+        self.threadpools.get(self.mount).force_run_in_thread(
+            self.writer.put, metadata)
+
+
+@contextmanager
+def lfs_pipelined_writer(app, pbroker, size, bytes_per_sync):
+    """
+    Open the writer of a plugin broker and wrap it in an LFSPipelinedWriter.
+    Plugins without a writer of their own get the generic one built from
+    their mkstemp() and put().
+
+    :param size: expected size of the object, for preallocation
+    :raises DiskFileNoSpace: if the preallocation fails
+    """
+    if app.lfs_plugins.has(app.lfs_mode, 'writer'):
+        writer = pbroker.writer(size)
+    else:
+        # The pipeline threads the calls itself, so use the bare broker.
+        writer = lfs_writer(pbroker.pbroker.mkstemp, pbroker.pbroker.put,
+                            size)
+    with writer as writer:
+        pipe = LFSPipelinedWriter(writer, app.lfs_threadpools, app.lfs_root,
+                                  bytes_per_sync, app.lfs_checksum)
+        try:
+            yield pipe
+        finally:
+            pipe.abort()
+
+
+def get_pbroker(app, plugin_class, account, container, obj, keep_data_fp):
+    """
+    Create a plugin broker in the thread pool of the LFS mount, and wrap
+    it so that its calls run there as well.
+    """
+    pbroker = app.lfs_threadpools.run_in_thread(
+        app.lfs_root, plugin_class, app, account, container, obj,
+        keep_data_fp)
+    return LFSThreadedBroker(pbroker, app.lfs_threadpools, app.lfs_root)
+
+
+def _info_memcache(app):
+    return app.memcache if app.lfs_cache_memcache else None
+
+
+def get_container_info(app, plugin_class, account, container):
+    """
+    Look up the existence and ACLs of a container, through app.lfs_cache.
+    Only containers that exist are cached: one that another worker creates
+    has to be seen at once.
+
+    :returns: a dict like that of Controller.container_info(), without
+              partition and nodes, which make no sense in LFS
+    """
+    key = cache_key(account, container)
+    memcache = _info_memcache(app)
+    info = app.lfs_cache.get(key, memcache)
+    if info is not None:
+        return info
+    generation = app.lfs_cache.generation(key)
+    info = {'status': HTTP_NOT_FOUND, 'read_acl': None, 'write_acl': None,
+            'sync_key': None, 'count': None, 'bytes': None,
+            'versions': None}
+    pbroker = get_pbroker(app, plugin_class, account, container, None, False)
+    if pbroker.exists():
+        # Container metadata is kept as (value, timestamp).
+        metadata = dict((key.lower(), value[0]) for key, value in
+                        pbroker.metadata.iteritems()
+                        if isinstance(value, (list, tuple)))
+        info.update(status=HTTP_OK,
+                    read_acl=metadata.get('x-container-read') or None,
+                    write_acl=metadata.get('x-container-write') or None,
+                    sync_key=metadata.get('x-container-sync-key') or None,
+                    versions=metadata.get('x-versions-location') or None)
+        app.lfs_cache.set(key, info, generation, memcache)
+    return info
+
+
+def clear_container_info(app, account, container):
+    """Drop the cached info of a container that this worker changed."""
+    app.lfs_cache.invalidate(cache_key(account, container),
+                             _info_memcache(app))
+
+
+def check_metadata_utf8(req, target_type):
+    """
+    Refuse metadata that the plugins cannot store: they keep it as JSON,
+    which only carries UTF-8.
+
+    :param req: request object
+    :param target_type: str: account or container
+    :returns: HTTPBadRequest with bad metadata otherwise None
+    """
+    prefix = 'x-%s-meta-' % target_type.lower()
+    for key, value in req.headers.iteritems():
+        if not key.lower().startswith(prefix):
+            continue
+        try:
+            key.decode('utf-8')
+            value.decode('utf-8')
+        except UnicodeError:
+            return HTTPBadRequest(body='Metadata must be valid UTF-8',
+                                  request=req, content_type='text/plain')
+    return None
+
+
+def list_segments(app, plugin_class, account, container, prefix):
+    """
+    List the segments of a dynamic large object straight from the plugin,
+    a page of CONTAINER_LISTING_LIMIT names per call.
+
+    :returns: list of (name, created_at, size, content_type, etag) rows, in
+              name order
+    :raises ListingIterNotFound: if the segment container does not exist
+    """
+    pbroker = get_pbroker(app, plugin_class, account, container, None, False)
+    if not pbroker.exists():
+        raise ListingIterNotFound()
+    if app.lfs_plugins.has(app.lfs_mode, 'listing_stream'):
+        list_objects = pbroker.iter_objects
+    else:
+        list_objects = pbroker.list_objects_iter
+    segments = []
+    marker = ''
+    while True:
+        page = list(list_objects(CONTAINER_LISTING_LIMIT, marker, '', prefix,
+                                 None, None))
+        segments.extend(page)
+        if len(page) < CONTAINER_LISTING_LIMIT:
+            return segments
+        marker = page[-1][0]
+
+
+class LFSSegmentedIterable(object):
+    """
+    Iterable that returns the contents of a dynamic large object in LFS,
+    the counterpart of SegmentedIterable. The segments are on the same
+    filesystem, so each is read through a plugin broker rather than a
+    sub-request, and the next lfs_segment_readahead segments are opened
+    while the current one is sent.
+
+    If there's a failure that cuts the transfer short, the response's
+    `status_int` will be updated (again, just for logging since the original
+    status would have already been sent to the client).
+
+    :param controller: The LFSObjectController instance to work with.
+    :param container: The container the object segments are within.
+    :param listing: list of (name, size) of the segments, in order
+    :param response: The swob.Response this iterable is associated with, if
+                     any (default: None)
+    :param max_lo_time: Defaults to 86400. The connection for the
+                        LFSSegmentedIterable will drop after that many
+                        seconds.
+    """
+
+    def __init__(self, controller, container, listing, response=None,
+                 max_lo_time=86400):
+        self.controller = controller
+        self.app = controller.app
+        self.container = container
+        self.listing = listing
+        self.max_lo_time = max_lo_time
+        self.response = response
+        if not self.response:
+            self.response = Response()
+
+    def _open_segment(self, name):
+        """
+        Open a segment; this runs in a greenthread of its own.
+
+        :returns: the plugin broker of the segment, or the exception that
+                  prevented opening it
+        """
+        try:
+            pbroker = get_pbroker(self.app, self.controller.plugin_class,
+                                  self.controller.account_name,
+                                  self.container, name, True)
+            try:
+                pbroker.get_data_file_size()
+            except (DiskFileError, DiskFileNotExist):
+                pbroker.close(verify_file=False)
+                raise SegmentError(_('Could not load object segment '
+                                     '/%(acc)s/%(cont)s/%(obj)s') %
+                                   {'acc': self.controller.account_name,
+                                    'cont': self.container, 'obj': name})
+            return pbroker
+        except Exception, err:
+            return err
+
+    def _iter_parts(self, parts):
+        """
+        Send the given parts of the segments.
+
+        :param parts: list of (name, start, stop, size) of the segments
+        """
+        start_time = time.time()
+        opening = []
+        parts = iter(parts)
+
+        def open_next():
+            for name, start, stop, size in parts:
+                opening.append((spawn(self._open_segment, name), start,
+                                stop, size))
+                return
+
+        try:
+            for _junk in xrange(self.app.lfs_segment_readahead + 1):
+                open_next()
+            while opening:
+                if time.time() - start_time > self.max_lo_time:
+                    raise SegmentError(
+                        _('Max LO GET time of %s exceeded.') %
+                        self.max_lo_time)
+                opener, start, stop, size = opening.pop(0)
+                pbroker = opener.wait()
+                if isinstance(pbroker, Exception):
+                    raise pbroker
+                open_next()
+                try:
+                    if start == 0 and stop == size:
+                        chunks = pbroker
+                    else:
+                        chunks = pbroker.app_iter_range(start, stop)
+                    for chunk in chunks:
+                        yield chunk
+                finally:
+                    pbroker.close()
+        except (Exception, GeneratorExit), err:
+            if not isinstance(err, GeneratorExit):
+                self.app.logger.exception(_(
+                    'ERROR: While processing manifest '
+                    '/%(acc)s/%(cont)s/%(obj)s'),
+                    {'acc': self.controller.account_name,
+                     'cont': self.controller.container_name,
+                     'obj': self.controller.object_name})
+                self.response.status_int = 503
+            raise
+        finally:
+            for opener, _junk, _junk, _junk in opening:
+                pbroker = opener.wait()
+                if not isinstance(pbroker, Exception):
+                    pbroker.close(verify_file=False)
+
+    def __iter__(self):
+        return self.app_iter_range(None, None)
+
+    def app_iter_range(self, start, stop):
+        """
+        Returns an iterator over the data for range (start, stop). Only the
+        segments that overlap the range are opened.
+        """
+        start = start or 0
+        parts = []
+        offset = 0
+        for name, size in self.listing:
+            seg_start = max(start - offset, 0)
+            seg_stop = size
+            if stop is not None:
+                seg_stop = min(stop - offset, size)
+            offset += size
+            if seg_start < seg_stop:
+                parts.append((name, seg_start, seg_stop, size))
+            if stop is not None and offset >= stop:
+                break
+        return self._iter_parts(parts)
+
+    def app_iter_ranges(self, ranges, content_type, boundary, size):
+        """Returns an iterator over the data for a set of ranges"""
+        return multi_range_iterator(ranges, content_type, boundary, size,
+                                    self.app_iter_range)
+
+
+def _listing_timestamp(created_at):
+    created_at = datetime.utcfromtimestamp(float(created_at)).isoformat()
+    # python isoformat() doesn't include msecs when zero
+    if len(created_at) < len("1970-01-01T00:00:00.000000"):
+        created_at += ".000000"
+    return created_at
+
+
+def container_listing_json_iter(rows):
+    """
+    Render container listing rows as a JSON array, one row at a time.
+
+    :param rows: iterable of (name, created_at, size, content_type, etag)
+    """
+    yield '['
+    sep = ''
+    for (name, created_at, size, content_type, etag) in rows:
+        if content_type is None:
+            item = {'subdir': name}
+        else:
+            item = {'last_modified': _listing_timestamp(created_at),
+                    'bytes': size, 'content_type': content_type,
+                    'hash': etag, 'name': name}
+        yield sep + json.dumps(item)
+        sep = ', '
+    yield ']'
+
+
+def container_listing_xml_iter(container, rows):
+    """
+    Render container listing rows as XML, one row at a time.
+
+    :param container: container name for the enclosing element
+    :param rows: iterable of (name, created_at, size, content_type, etag)
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<container name=%s>' % saxutils.quoteattr(container)
+    for (name, created_at, size, content_type, etag) in rows:
+        name = saxutils.escape(name)
+        if content_type is None:
+            yield '<subdir name="%s"><name>%s</name></subdir>' % (name, name)
+        else:
+            yield '<object><name>%s</name><hash>%s</hash>' \
+                  '<bytes>%d</bytes><content_type>%s</content_type>' \
+                  '<last_modified>%s</last_modified></object>' % \
+                  (name, etag, size, saxutils.escape(content_type),
+                   _listing_timestamp(created_at))
+    yield '</container>'
+
+
+def container_listing_plain_iter(rows):
+    """
+    Render container listing rows as newline terminated names.
+
+    :param rows: iterable of (name, created_at, size, content_type, etag)
+    """
+    for row in rows:
+        yield row[0] + '\n'
 
 
 # account_stat table contains
@@ -108,8 +803,7 @@ class LFSAccountController(Controller):
         # XXX the config problem XXX
         self.auto_create_account_prefix = "."
 
-        # XXX this loads the class on every request
-        self.plugin_class = load_the_plugin(self.app.lfs_mode)
+        self.plugin_class = self.app.lfs_plugins.get(self.app.lfs_mode)
 
     @public
     def HEAD(self, req):
@@ -117,8 +811,8 @@ class LFSAccountController(Controller):
         # XXX Wait, this can't be right. We mount on the root, right?
         #if not check_mount(self.app.lfs_root, drive):
         #    return HTTPInsufficientStorage(drive=drive, request=req)
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    None, None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              None, None, False)
         created = False
         if not pbroker.exists():
             # XXX see, if only initialize() returned an error...
@@ -155,8 +849,8 @@ class LFSAccountController(Controller):
         """Handler for HTTP GET requests."""
         #if not check_mount(self.app.lfs_root, self.ufo_drive):
         #    return HTTPInsufficientStorage(request=req)
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    None, None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              None, None, False)
         # XXX Why does it work to assign these variables to Gluster?
         # The DiskDir.py and friends do not seem to contain any code
         # to make this work or delegate to stock Swift.
@@ -246,8 +940,11 @@ class LFSAccountController(Controller):
         """Handler for HTTP PUT request."""
         #if not check_mount(self.app.lfs_root, self.ufo_drive):
         #    return HTTPInsufficientStorage(request=req)
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    None, None, False)
+        error_response = check_metadata_utf8(req, 'account')
+        if error_response:
+            return error_response
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              None, None, False)
 
         timestamp = normalize_timestamp(time.time())
         if not pbroker.exists():
@@ -288,9 +985,12 @@ class LFSAccountController(Controller):
         #error_response = check_metadata(req, 'account')
         #if error_response:
         #    return error_response
+        error_response = check_metadata_utf8(req, 'account')
+        if error_response:
+            return error_response
         timestamp = normalize_timestamp(time.time())
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    None, None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              None, None, False)
         #if self.app.memcache:
         #    self.app.memcache.delete(
         #        get_account_memcache_key(self.account_name))
@@ -312,8 +1012,6 @@ class LFSAccountController(Controller):
             pbroker.update_metadata(metadata)
         return HTTPNoContent(request=req)
 
-    # @public
-    # def DELETE(self, req):
 
 class LFSContainerController(Controller):
     """WSGI controller for container requests"""
@@ -333,8 +1031,7 @@ class LFSContainerController(Controller):
         #    app.conf.get('auto_create_account_prefix') or '.'
         self.auto_create_account_prefix = "."
 
-        # XXX this loads the class on every request
-        self.plugin_class = load_the_plugin(self.app.lfs_mode)
+        self.plugin_class = self.app.lfs_plugins.get(self.app.lfs_mode)
 
     # clean_acls is taken verbatim from ContainerController
     def clean_acls(self, req):
@@ -372,7 +1069,8 @@ class LFSContainerController(Controller):
         #if req.headers.get('x-account-override-deleted', 'no').lower() == \
         #        'yes':
         #    account_headers['x-account-override-deleted'] = 'yes'
-        account_pbroker = self.plugin_class(self.app, account, None,None, False)
+        account_pbroker = get_pbroker(self.app, self.plugin_class, account,
+                                      None, None, False)
         #if account_headers.get('x-account-override-deleted', 'no').lower() != \
         #        'yes' and account_broker.is_deleted():
         #    return HTTPNotFound(request=req)
@@ -409,9 +1107,8 @@ class LFSContainerController(Controller):
         #if self.mount_check and not check_mount(self.root, drive):
         #    return HTTPInsufficientStorage(drive=drive, request=req)
 
-        pbroker = self.plugin_class(self.app,
-                                    self.account_name, self.container_name,
-                                    None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
         if not pbroker.exists():
             return HTTPNotFound(request=req)
         info = pbroker.get_info()
@@ -470,9 +1167,8 @@ class LFSContainerController(Controller):
         #if self.mount_check and not check_mount(self.root, drive):
         #    return HTTPInsufficientStorage(drive=drive, request=req)
 
-        pbroker = self.plugin_class(self.app,
-                                    self.account_name, self.container_name,
-                                    None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
         if not pbroker.exists():
             return HTTPNotFound(request=req)
         info = pbroker.get_info()
@@ -515,52 +1211,32 @@ class LFSContainerController(Controller):
             ['text/plain', 'application/json', 'application/xml', 'text/xml'])
         if not out_content_type:
             return HTTPNotAcceptable(request=req)
-        container_list = pbroker.list_objects_iter(limit, marker, end_marker,
-                                                   prefix, delimiter, path)
+        # Plugins that can generate the listing lazily get it streamed out
+        # as it is produced; the rest are rendered the same way from a list.
+        if self.app.lfs_plugins.has(self.app.lfs_mode, 'listing_stream'):
+            rows = pbroker.iter_objects(limit, marker, end_marker,
+                                        prefix, delimiter, path)
+        else:
+            rows = pbroker.list_objects_iter(limit, marker, end_marker,
+                                             prefix, delimiter, path)
+        rows = iter(rows)
+        try:
+            first_row = rows.next()
+        except StopIteration:
+            first_row = None
+        if first_row is not None:
+            rows = itertools.chain([first_row], rows)
         if out_content_type == 'application/json':
-            data = []
-            for (name, created_at, size, content_type, etag) in container_list:
-                if content_type is None:
-                    data.append({"subdir": name})
-                else:
-                    created_at = datetime.utcfromtimestamp(
-                        float(created_at)).isoformat()
-                    # python isoformat() doesn't include msecs when zero
-                    if len(created_at) < len("1970-01-01T00:00:00.000000"):
-                        created_at += ".000000"
-                    data.append({'last_modified': created_at, 'bytes': size,
-                                'content_type': content_type, 'hash': etag,
-                                'name': name})
-            container_list = json.dumps(data)
+            container_iter = container_listing_json_iter(rows)
         elif out_content_type.endswith('/xml'):
-            xml_output = []
-            for (name, created_at, size, content_type, etag) in container_list:
-                # escape name and format date here
-                name = saxutils.escape(name)
-                created_at = datetime.utcfromtimestamp(
-                    float(created_at)).isoformat()
-                # python isoformat() doesn't include msecs when zero
-                if len(created_at) < len("1970-01-01T00:00:00.000000"):
-                    created_at += ".000000"
-                if content_type is None:
-                    xml_output.append('<subdir name="%s"><name>%s</name>'
-                                      '</subdir>' % (name, name))
-                else:
-                    content_type = saxutils.escape(content_type)
-                    xml_output.append(
-                        '<object><name>%s</name><hash>%s</hash>'
-                        '<bytes>%d</bytes><content_type>%s</content_type>'
-                        '<last_modified>%s</last_modified></object>' %
-                        (name, etag, size, content_type, created_at))
-            container_list = ''.join([
-                '<?xml version="1.0" encoding="UTF-8"?>\n',
-                '<container name=%s>' % saxutils.quoteattr(container),
-                ''.join(xml_output), '</container>'])
+            container_iter = container_listing_xml_iter(self.container_name,
+                                                        rows)
         else:
-            if not container_list:
+            if first_row is None:
                 return HTTPNoContent(request=req, headers=resp_headers)
-            container_list = '\n'.join(r[0] for r in container_list) + '\n'
-        resp = Response(body=container_list, request=req, headers=resp_headers)
+            container_iter = container_listing_plain_iter(rows)
+        resp = Response(app_iter=container_iter, request=req,
+                        headers=resp_headers)
         resp.content_type = out_content_type
         resp.charset = 'utf-8'
 
@@ -605,11 +1281,13 @@ class LFSContainerController(Controller):
         #    return resp
         #if not accounts:
         #    return HTTPNotFound(request=req)
+        error_response = check_metadata_utf8(req, 'container')
+        if error_response:
+            return error_response
 
         timestamp = normalize_timestamp(time.time())
-        pbroker = self.plugin_class(self.app,
-                                    self.account_name, self.container_name,
-                                    None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
 
         if not pbroker.exists():
             pbroker.initialize(timestamp)
@@ -633,6 +1311,7 @@ class LFSContainerController(Controller):
             key.lower().startswith('x-container-meta-'))
         if metadata:
             pbroker.update_metadata(metadata)
+        clear_container_info(self.app, self.account_name, self.container_name)
         resp = self._account_update(req, self.account_name, self.container_name,
                                     pbroker)
         if resp:
@@ -648,7 +1327,8 @@ class LFSContainerController(Controller):
         """HTTP POST request handler."""
         #error_response = \
         #    self.clean_acls(req) or check_metadata(req, 'container')
-        error_response = self.clean_acls(req)
+        error_response = self.clean_acls(req) or \
+            check_metadata_utf8(req, 'container')
         if error_response:
             return error_response
         timestamp =  normalize_timestamp(time.time())
@@ -658,9 +1338,8 @@ class LFSContainerController(Controller):
         #                      autocreate=self.app.account_autocreate)
         #if not accounts:
         #    return HTTPNotFound(request=req)
-        pbroker = self.plugin_class(self.app,
-                                    self.account_name, self.container_name,
-                                    None, False)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
         if not pbroker.exists():
             pbroker.initialize(timestamp)
             created = True
@@ -694,8 +1373,93 @@ class LFSContainerController(Controller):
             #            pbroker.metadata['X-Container-Sync-To'][0]:
             #        pbroker.set_x_container_sync_points(-1, -1)
             pbroker.update_metadata(metadata)
+        clear_container_info(self.app, self.account_name, self.container_name)
+        return HTTPNoContent(request=req)
+
+    @public
+    def DELETE(self, req):
+        """HTTP DELETE request handler."""
+        if not self.app.lfs_plugins.has(self.app.lfs_mode, 'delete'):
+            return HTTPMethodNotAllowed(request=req)
+        # Only the account owner may delete a container, as in Swift.
+        if 'swift.authorize' in req.environ:
+            aresp = req.environ['swift.authorize'](req)
+            if aresp:
+                return aresp
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
+        if not pbroker.exists():
+            return HTTPNotFound(request=req)
+        if pbroker.list_objects_iter(1, '', '', None, None, None):
+            return HTTPConflict(request=req)
+        pbroker.delete(normalize_timestamp(time.time()))
+        clear_container_info(self.app, self.account_name, self.container_name)
         return HTTPNoContent(request=req)
 
+    def _delete_objects(self, pbroker, names, timestamp):
+        results = pbroker.delete_objects(names, timestamp)
+        object_delta = bytes_delta = 0
+        for name, metadata in results.iteritems():
+            if not metadata:
+                continue
+            object_delta -= 1
+            bytes_delta -= int(metadata.get('Content-Length') or 0)
+            delete_at = int(metadata.get('X-Delete-At') or 0)
+            if delete_at:
+                self.app.lfs_threadpools.run_in_thread(
+                    self.app.lfs_root, self.app.lfs_expiry.unschedule,
+                    delete_at, self.account_name, self.container_name, name)
+        if self.app.lfs_stats:
+            self.app.lfs_stats.record(self.account_name, self.container_name,
+                                      object_delta, bytes_delta)
+        return results
+
+    @public
+    def BULK_DELETE(self, req):
+        """
+        Delete many objects of the container at once, for the bulk
+        middleware. The body is a JSON list of object names, the response a
+        JSON dict of each name to the status of its delete. The names are
+        split in batches that the plugin deletes in parallel, each in a
+        single call to its thread pool.
+        """
+        if not self.app.lfs_plugins.has(self.app.lfs_mode, 'bulk_delete'):
+            return HTTPMethodNotAllowed(request=req)
+        # The same authorization as that of a DELETE of each object.
+        req.acl = get_container_info(self.app, self.plugin_class,
+                                     self.account_name,
+                                     self.container_name)['write_acl']
+        if 'swift.authorize' in req.environ:
+            aresp = req.environ['swift.authorize'](req)
+            if aresp:
+                return aresp
+        try:
+            names = json.loads(req.body)
+            if not isinstance(names, list):
+                raise ValueError()
+            names = [name.encode('utf-8') for name in names]
+        except (ValueError, AttributeError):
+            return HTTPBadRequest(request=req, content_type='text/plain',
+                                  body='Expected a JSON list of names')
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, None, False)
+        if not pbroker.exists():
+            return HTTPNotFound(request=req)
+        timestamp = normalize_timestamp(time.time())
+        pool = GreenPool(max(self.app.lfs_threadpools.threads_per_mount, 1))
+        results = {}
+        for batch_results in pool.imap(
+                lambda batch: self._delete_objects(pbroker, batch, timestamp),
+                [names[i:i + LFS_DELETE_BATCH]
+                 for i in xrange(0, len(names), LFS_DELETE_BATCH)]):
+            results.update(batch_results)
+        statuses = dict(
+            (name, HTTPNoContent().status if metadata
+             else HTTPNotFound().status)
+            for name, metadata in results.iteritems())
+        return Response(request=req, body=json.dumps(statuses),
+                        content_type='application/json; charset=utf-8')
+
 
 class LFSObjectController(Controller):
     """WSGI controller for object requests."""
@@ -723,10 +1487,10 @@ class LFSObjectController(Controller):
         self.retained_meta_keys = set([
             'Content-Type',
             'Content-Length',
-            'ETag'])
+            'ETag',
+            CHECKSUM_HEADER])
 
-        # XXX this loads the class on every request
-        self.plugin_class = load_the_plugin(self.app.lfs_mode)
+        self.plugin_class = self.app.lfs_plugins.get(self.app.lfs_mode)
 
     #def _listing_iter(self, lcontainer, lprefix, env):
     #    for page in self._listing_pages_iter(lcontainer, lprefix, env):
@@ -792,12 +1556,9 @@ class LFSObjectController(Controller):
     # Originally this was GET in object server, now transplanted
     def _get_or_head(self, request):
 
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    self.container_name, self.object_name,
-                                    True)
-        # XXX Expired - this needs to be processed correctly
-        # if file.is_deleted() or file.is_expired():
-        if not pbroker.exists():
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, self.object_name, True)
+        if not pbroker.exists() or is_expired(pbroker.metadata):
             if request.headers.get('if-match') == '*':
                 return HTTPPreconditionFailed(request=request)
             else:
@@ -848,7 +1609,16 @@ class LFSObjectController(Controller):
             response = Response(status=204,
                                 request=request, conditional_response=True)
         else:
-            response = Response(app_iter=pbroker,
+            app_iter = pbroker
+            # A whole-object read that nobody wants verified can skip
+            # hashing and go out through the server's wsgi.file_wrapper.
+            if not request.range and \
+                    self.app.lfs_plugins.has(self.app.lfs_mode,
+                                             'zero_copy') and \
+                    random() >= self.app.lfs_etag_verify_rate:
+                app_iter = pbroker.iter_file(
+                    request.environ.get('wsgi.file_wrapper'))
+            response = Response(app_iter=app_iter,
                                 request=request, conditional_response=True)
         response.headers['Content-Type'] = pbroker.metadata.get(
             'Content-Type', 'application/octet-stream')
@@ -857,6 +1627,9 @@ class LFSObjectController(Controller):
                     key.lower() in self.allowed_headers:
                 response.headers[key] = value
         response.etag = pbroker.metadata['ETag']
+        if CHECKSUM_HEADER in pbroker.metadata:
+            response.headers[CHECKSUM_HEADER] = \
+                pbroker.metadata[CHECKSUM_HEADER]
         response.last_modified = float(pbroker.metadata['X-Timestamp'])
         response.content_length = file_size
 
@@ -903,76 +1676,62 @@ class LFSObjectController(Controller):
         #        res.content_type = source.getheader('Content-Type')
         #    return res
 
-        # XXX Manifest handling is ripe for a factoring (below is verbatim cc)
         if 'x-object-manifest' in resp.headers:
-            lcontainer, lprefix = \
-                resp.headers['x-object-manifest'].split('/', 1)
-            lcontainer = unquote(lcontainer)
-            lprefix = unquote(lprefix)
-            try:
-                pages_iter = iter(self._listing_pages_iter(lcontainer, lprefix,
-                                                           req.environ))
-                listing_page1 = pages_iter.next()
-                listing = itertools.chain(listing_page1,
-                                          self._remaining_items(pages_iter))
-            except ListingIterNotFound:
-                return HTTPNotFound(request=req)
-            except ListingIterNotAuthorized, err:
-                return err.aresp
-            except ListingIterError:
-                return HTTPServerError(request=req)
-            except StopIteration:
-                listing_page1 = listing = ()
-
-            if len(listing_page1) >= CONTAINER_LISTING_LIMIT:
-                resp = Response(headers=resp.headers, request=req,
-                                conditional_response=True)
-                if req.method == 'HEAD':
-                    # These shenanigans are because swob translates the HEAD
-                    # request into a swob EmptyResponse for the body, which
-                    # has a len, which eventlet translates as needing a
-                    # content-length header added. So we call the original
-                    # swob resp for the headers but return an empty iterator
-                    # for the body.
-
-                    def head_response(environ, start_response):
-                        resp(environ, start_response)
-                        return iter([])
-
-                    head_response.status_int = resp.status_int
-                    return head_response
-                else:
-                    resp.app_iter = SegmentedIterable(
-                        self, lcontainer, listing, resp)
+            return self._get_or_head_manifest(req, resp)
+        return resp
 
-            else:
-                # For objects with a reasonable number of segments, we'll serve
-                # them with a set content-length and computed etag.
-                if listing:
-                    listing = list(listing)
-                    content_length = sum(o['bytes'] for o in listing)
-                    last_modified = max(o['last_modified'] for o in listing)
-                    last_modified = datetime(*map(int, re.split('[^\d]',
-                                             last_modified)[:-1]))
-                    etag = md5(
-                        ''.join(o['hash'] for o in listing)).hexdigest()
-                else:
-                    content_length = 0
-                    last_modified = resp.last_modified
-                    etag = md5().hexdigest()
-                resp = Response(headers=resp.headers, request=req,
-                                conditional_response=True)
-                resp.app_iter = SegmentedIterable(self, lcontainer, listing,
-                                                  resp)
-                resp.content_length = content_length
-                resp.last_modified = last_modified
-                resp.etag = etag
-            resp.headers['accept-ranges'] = 'bytes'
-            # In case of a manifest file of nonzero length, the
-            # backend may have sent back a Content-Range header for
-            # the manifest. It's wrong for the client, though.
-            resp.content_range = None
+    def _get_or_head_manifest(self, req, resp):
+        """
+        Turn the response for a dynamic large object manifest into one for
+        the concatenated segments, listed in one plugin call and read with
+        LFSSegmentedIterable.
+        """
+        if hasattr(resp.app_iter, 'close'):
+            resp.app_iter.close()
+        lcontainer, lprefix = \
+            resp.headers['x-object-manifest'].split('/', 1)
+        lcontainer = unquote(lcontainer)
+        lprefix = unquote(lprefix)
+        if 'swift.authorize' in req.environ:
+            lreq = Request.blank('i will be overridden by env',
+                                 environ=req.environ)
+            # Don't quote PATH_INFO, by WSGI spec
+            lreq.environ['PATH_INFO'] = \
+                '/v1/%s/%s' % (self.account_name, lcontainer)
+            lreq.environ['REQUEST_METHOD'] = 'GET'
+            lreq.acl = self._container_info(self.account_name,
+                                            lcontainer)['read_acl']
+            aresp = req.environ['swift.authorize'](lreq)
+            if aresp:
+                return aresp
+        try:
+            listing = list_segments(self.app, self.plugin_class,
+                                    self.account_name, lcontainer, lprefix)
+        except ListingIterNotFound:
+            return HTTPNotFound(request=req)
 
+        # The whole listing is at hand, so even objects with many segments
+        # get a content-length and computed etag.
+        last_modified = resp.last_modified
+        resp = Response(headers=resp.headers, request=req,
+                        conditional_response=True)
+        if req.method != 'HEAD':
+            resp.app_iter = LFSSegmentedIterable(
+                self, lcontainer, [(row[0], row[2]) for row in listing],
+                resp, max_lo_time=self.app.max_large_object_get_time)
+        if listing:
+            resp.content_length = sum(row[2] for row in listing)
+            resp.last_modified = max(float(row[1]) for row in listing)
+            resp.etag = md5(''.join(row[4] for row in listing)).hexdigest()
+        else:
+            resp.content_length = 0
+            resp.last_modified = last_modified
+            resp.etag = md5().hexdigest()
+        resp.headers['accept-ranges'] = 'bytes'
+        # In case of a manifest file of nonzero length, the
+        # backend may have sent back a Content-Range header for
+        # the manifest. It's wrong for the client, though.
+        resp.content_range = None
         return resp
 
     #@public
@@ -991,16 +1750,24 @@ class LFSObjectController(Controller):
         """Handler for HTTP HEAD requests."""
         return self.GETorHEAD(req)
 
+    def delete_at_update(self, op, delete_at):
+        """
+        Add the object to the LFS expiry index, or take it out, which the
+        object server does with the hidden expiring_objects account.
+
+        :param op: 'PUT' to schedule the deletion, 'DELETE' to cancel it
+        :param delete_at: the X-Delete-At of the object
+        """
+        expiry = self.app.lfs_expiry
+        func = expiry.schedule if op == 'PUT' else expiry.unschedule
+        self.app.lfs_threadpools.run_in_thread(
+            self.app.lfs_root, func, delete_at, self.account_name,
+            self.container_name, self.object_name)
+
     # Almost same protocol as Controller.container_info(), but for LFS.
-    # We do not return partition or nodes, as they make no sense in LFS.
-    # XXX Maybe get rid of this altogether? Just find a place for ACLs.
-    # XXX We need 'versions', too.
     def _container_info(self, account, container, account_autocreate=False):
-        container_info = {'status': 0, 'read_acl': None,
-                          'write_acl': None, 'sync_key': None,
-                          'count': None, 'bytes': None,
-                          'versions': None}
-        return container_info
+        return get_container_info(self.app, self.plugin_class, account,
+                                  container)
 
     # This is not much different from _send_file, but different enough.
     # Returns a Response() with error code and etag packed in, ready for use.
@@ -1027,11 +1794,14 @@ class LFSObjectController(Controller):
             return HTTPBadRequest(body='X-Delete-At in past', request=req,
                                   content_type='text/plain')
         orig_timestamp = pbroker.metadata.get('X-Timestamp')
+        orig_size = int(pbroker.metadata.get('Content-Length') or 0)
         upload_expiration = time.time() + self.max_upload_time
-        etag = md5()
         upload_size = 0
-        last_sync = 0
-        with pbroker.mkstemp() as fd:
+        size = None
+        if not chunked and 'content-length' in req.headers:
+            size = int(req.headers['content-length'])
+        with lfs_pipelined_writer(self.app, pbroker, size,
+                                  self.bytes_per_sync) as pipe:
             while True:
                 with ChunkReadTimeout(self.app.client_timeout):
                     try:
@@ -1044,51 +1814,21 @@ class LFSObjectController(Controller):
                 if time.time() > upload_expiration:
                     self.logger.increment('PUT.timeouts')
                     return HTTPRequestTimeout(request=req)
-                etag.update(chunk)
-                while chunk:
-                    written = os.write(fd, chunk)
-                    chunk = chunk[written:]
-                # For large files sync every 512MB (by default) written
-                if upload_size - last_sync >= self.bytes_per_sync:
-                    tpool.execute(fsync, fd)
-                    drop_buffer_cache(fd, last_sync, upload_size - last_sync)
-                    last_sync = upload_size
+                pipe.write(chunk)
                 sleep()
             if 'content-length' in req.headers and \
                     int(req.headers['content-length']) != upload_size:
                 return HTTPClientDisconnect(request=req)
-            etag = etag.hexdigest()
+            pipe.close()
+            etag = pipe.etag.hexdigest()
             if 'etag' in req.headers and \
                     req.headers['etag'].lower() != etag:
                 return HTTPUnprocessableEntity(request=req)
-            # Well, 'created_at' does not work: DiskFile has no get_info().
-            # info = pbroker.get_info()
-            # 'X-Timestamp': info['created_at'],
-            metadata = {
-                'X-Timestamp': req.headers['X-Timestamp'],
-                'Content-Type': req.headers['content-type'],
-                'ETag': etag,
-                'Content-Length': str(upload_size),
-            }
-            metadata.update(val for val in req.headers.iteritems()
-                            if val[0].lower().startswith('x-object-meta-') and
-                            len(val[0]) > 14)
-            for header_key in self.allowed_headers:
-                if header_key in req.headers:
-                    header_caps = header_key.title()
-                    metadata[header_caps] = req.headers[header_key]
-            # XXX Implement this.
-            #old_delete_at = int(pbroker.metadata.get('X-Delete-At') or 0)
-            #if old_delete_at != new_delete_at:
-            #    if new_delete_at:
-            #        self.delete_at_update(
-            #            'PUT', new_delete_at, account, container, obj,
-            #            req.headers, device)
-            #    if old_delete_at:
-            #        self.delete_at_update(
-            #            'DELETE', old_delete_at, account, container, obj,
-            #            req.headers, device)
-            pbroker.put(fd, metadata)
+            metadata = self._object_metadata(req, etag, upload_size)
+            if pipe.checksum:
+                metadata[CHECKSUM_HEADER] = pipe.checksum_header()
+            self._update_delete_at(pbroker.metadata, new_delete_at)
+            pipe.put(metadata)
 
         #except ChunkReadTimeout, err:
         #    self.app.logger.warn(
@@ -1106,21 +1846,110 @@ class LFSObjectController(Controller):
         #    self.app.logger.increment('client_disconnects')
         #    return HTTPClientDisconnect(request=req)
 
-        pbroker.unlinkold(metadata['X-Timestamp'])
-        # XXX Dude, implement this. So close!
-        #if not orig_timestamp or \
-        #        orig_timestamp < req.headers['x-timestamp']:
-        #    self.container_update(
-        #        'PUT', account, container, obj, req.headers,
-        #        {'x-size': pbroker.metadata['Content-Length'],
-        #         'x-content-type': pbroker.metadata['Content-Type'],
-        #         'x-timestamp': pbroker.metadata['X-Timestamp'],
-        #         'x-etag': pbroker.metadata['ETag'],
-        #         'x-trans-id': req.headers.get('x-trans-id', '-')},
-        #        device)
+        self._put_done(pbroker, metadata, orig_timestamp, orig_size)
         resp = HTTPCreated(request=req, etag=etag)
         return resp
 
+    def _object_metadata(self, req, etag, size):
+        """
+        :returns: the metadata to store for an object PUT with req
+        """
+        # Well, 'created_at' does not work: DiskFile has no get_info().
+        # info = pbroker.get_info()
+        # 'X-Timestamp': info['created_at'],
+        metadata = {
+            'X-Timestamp': req.headers['X-Timestamp'],
+            'Content-Type': req.headers['content-type'],
+            'ETag': etag,
+            'Content-Length': str(size),
+        }
+        metadata.update(val for val in req.headers.iteritems()
+                        if val[0].lower().startswith('x-object-meta-') and
+                        len(val[0]) > 14)
+        for header_key in self.allowed_headers:
+            if header_key in req.headers:
+                header_caps = header_key.title()
+                metadata[header_caps] = req.headers[header_key]
+        return metadata
+
+    def _update_delete_at(self, orig_metadata, new_delete_at):
+        old_delete_at = int(orig_metadata.get('X-Delete-At') or 0)
+        if old_delete_at != new_delete_at:
+            if new_delete_at:
+                self.delete_at_update('PUT', new_delete_at)
+            if old_delete_at:
+                self.delete_at_update('DELETE', old_delete_at)
+
+    def _put_done(self, pbroker, metadata, orig_timestamp, orig_size):
+        pbroker.unlinkold(metadata['X-Timestamp'])
+        if self.app.lfs_stats:
+            # The container and account catch up in the next flush.
+            self.app.lfs_stats.record(
+                self.account_name, self.container_name,
+                0 if orig_timestamp else 1,
+                int(metadata['Content-Length']) - orig_size)
+
+    def _copy_object(self, pbroker, req, src_container_name, src_obj_name,
+                     content_type_manually_set):
+        """
+        Serve a PUT with X-Copy-From by having the plugin copy the source
+        object on the filesystem, instead of reading it through the proxy
+        and writing it back.
+
+        :returns: the response, or None if the source has to be read after
+                  all, as the concatenated segments of a manifest are
+        """
+        source_req = req.copy_get()
+        source_req.path_info = '/%s/%s/%s' % (
+            self.account_name, src_container_name, src_obj_name)
+        source_req.acl = self._container_info(
+            self.account_name, src_container_name)['read_acl']
+        if 'swift.authorize' in req.environ:
+            aresp = req.environ['swift.authorize'](source_req)
+            if aresp:
+                return aresp
+        source = get_pbroker(self.app, self.plugin_class, self.account_name,
+                             src_container_name, src_obj_name, False)
+        if not source.exists() or is_expired(source.metadata):
+            return HTTPNotFound(request=req)
+        try:
+            size = source.get_data_file_size()
+        except (DiskFileError, DiskFileNotExist):
+            return HTTPNotFound(request=req)
+        if 'X-Object-Manifest' in source.metadata:
+            return None
+
+        if not content_type_manually_set:
+            req.headers['Content-Type'] = source.metadata.get(
+                'Content-Type', 'application/octet-stream')
+        if not config_true_value(req.headers.get('x-fresh-metadata',
+                                                 'false')):
+            for key, value in source.metadata.iteritems():
+                if key.lower().startswith('x-object-meta-') and \
+                        key not in req.headers:
+                    req.headers[key] = value
+        metadata = self._object_metadata(req, source.metadata['ETag'], size)
+        if CHECKSUM_HEADER in source.metadata:
+            metadata[CHECKSUM_HEADER] = source.metadata[CHECKSUM_HEADER]
+        orig_timestamp = pbroker.metadata.get('X-Timestamp')
+        orig_size = int(pbroker.metadata.get('Content-Length') or 0)
+        self._update_delete_at(pbroker.metadata,
+                               int(req.headers.get('X-Delete-At') or 0))
+        pbroker.copy(source.pbroker, metadata)
+        self._put_done(pbroker, metadata, orig_timestamp, orig_size)
+
+        resp = HTTPCreated(request=req, etag=metadata['ETag'])
+        resp.headers['X-Copied-From'] = quote('%s/%s' % (src_container_name,
+                                                         src_obj_name))
+        resp.headers['X-Copied-From-Last-Modified'] = time.strftime(
+            '%a, %d %b %Y %H:%M:%S GMT',
+            time.gmtime(float(source.metadata['X-Timestamp'])))
+        for key, value in req.headers.items():
+            if key.lower().startswith('x-object-meta-'):
+                resp.headers[key] = value
+        resp.last_modified = float(req.headers['X-Timestamp'])
+        return resp
+
     #@public
     #@cors_validation
     #@delay_denial
@@ -1137,13 +1966,10 @@ class LFSObjectController(Controller):
             aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
-        # XXX This is a check if container exists. Needed?
-        #containers = container_info['nodes']
-        #if not containers:
-        #    return HTTPNotFound(request=req)
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    self.container_name, self.object_name,
-                                    False)
+        if container_info['status'] == HTTP_NOT_FOUND:
+            return HTTPNotFound(request=req)
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, self.object_name, False)
 
         if 'x-delete-after' in req.headers:
             try:
@@ -1252,6 +2078,12 @@ class LFSObjectController(Controller):
                     request=req,
                     body='X-Copy-From header must be of the form'
                          '<container name>/<object name>')
+            if self.app.lfs_plugins.has(self.app.lfs_mode, 'copy'):
+                resp = self._copy_object(pbroker, req, src_container_name,
+                                         src_obj_name,
+                                         content_type_manually_set)
+                if resp is not None:
+                    return resp
             source_req = req.copy_get()
             source_req.path_info = source_header
             source_req.headers['X-Newest'] = 'true'
@@ -1291,7 +2123,10 @@ class LFSObjectController(Controller):
             req = new_req
 
         chunked = req.headers.get('transfer-encoding')
-        resp = self._put_pipe(pbroker, data_source, chunked, req)
+        try:
+            resp = self._put_pipe(pbroker, data_source, chunked, req)
+        except DiskFileNoSpace:
+            return HTTPInsufficientStorage(request=req)
         if source_header:
             resp.headers['X-Copied-From'] = quote(
                 source_header.split('/', 2)[2])
@@ -1304,6 +2139,38 @@ class LFSObjectController(Controller):
         resp.last_modified = float(req.headers['X-Timestamp'])
         return resp
 
+    #@public
+    #@cors_validation
+    #@delay_denial
+    @public
+    def COPY(self, req):
+        """HTTP COPY request handler."""
+        dest = req.headers.get('Destination')
+        if not dest:
+            return HTTPPreconditionFailed(request=req,
+                                          body='Destination header required')
+        dest = unquote(dest)
+        if not dest.startswith('/'):
+            dest = '/' + dest
+        try:
+            _junk, dest_container, dest_object = dest.split('/', 2)
+        except ValueError:
+            return HTTPPreconditionFailed(
+                request=req,
+                body='Destination header must be of the form '
+                     '<container name>/<object name>')
+        source = '/' + self.container_name + '/' + self.object_name
+        self.container_name = dest_container
+        self.object_name = dest_object
+        # re-write the existing request as a PUT instead of creating a new one
+        # since this one is already attached to the posthooklogger
+        req.method = 'PUT'
+        req.path_info = '/' + self.account_name + dest
+        req.headers['Content-Length'] = 0
+        req.headers['X-Copy-From'] = quote(source)
+        del req.headers['Destination']
+        return self.PUT(req)
+
     #@public
     #@cors_validation
     #@delay_denial
@@ -1378,10 +2245,9 @@ class LFSObjectController(Controller):
                                   content_type='text/plain')
         #if self.mount_check and not check_mount(self.devices, device):
         #    return HTTPInsufficientStorage(drive=device, request=req)
-        pbroker = self.plugin_class(self.app, self.account_name,
-                                    self.container_name, self.object_name,
-                                    False)
-        if not pbroker.exists():
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, self.object_name, False)
+        if not pbroker.exists() or is_expired(pbroker.metadata):
             return HTTPNotFound(request=req)
         try:
             pbroker.get_data_file_size()
@@ -1399,17 +2265,12 @@ class LFSObjectController(Controller):
             if header_key in req.headers:
                 header_caps = header_key.title()
                 metadata[header_caps] = req.headers[header_key]
-        # XXX Implement this.
-        #old_delete_at = int(pbroker.metadata.get('X-Delete-At') or 0)
-        #if old_delete_at != new_delete_at:
-        #    if new_delete_at:
-        #        self.delete_at_update('PUT', new_delete_at,
-        #                              self.account_name, self.container_name,
-        #                              self.object_name, req.headers, device)
-        #    if old_delete_at:
-        #        self.delete_at_update('DELETE', old_delete_at,
-        #                              self.account_name, self.container_name,
-        #                              self.object_name, req.headers, device)
+        old_delete_at = int(pbroker.metadata.get('X-Delete-At') or 0)
+        if old_delete_at != new_delete_at:
+            if new_delete_at:
+                self.delete_at_update('PUT', new_delete_at)
+            if old_delete_at:
+                self.delete_at_update('DELETE', old_delete_at)
 
         # 4.3.6. Update Object Metadata
         #    A POST request will delete all existing metadata added with
@@ -1419,133 +2280,54 @@ class LFSObjectController(Controller):
         pbroker.put_metadata(metadata)
         return HTTPAccepted(request=req)
 
-    #API
-    #@public
-    #@cors_validation
-    #@delay_denial
-    #def DELETE(self, req):
-    #    """HTTP DELETE request handler."""
-    #    container_info = self._container_info(self.account_name,
-    #                                         self.container_name)
-    #    container_partition = container_info['partition']
-    #    containers = container_info['nodes']
-    #    req.acl = container_info['write_acl']
-    #    req.environ['swift_sync_key'] = container_info['sync_key']
-    #    object_versions = container_info['versions']
-    #    if object_versions:
-    #        # this is a version manifest and needs to be handled differently
-    #        lcontainer = object_versions.split('/')[0]
-    #        prefix_len = '%03x' % len(self.object_name)
-    #        lprefix = prefix_len + self.object_name + '/'
-    #        last_item = None
-    #        try:
-    #            for last_item in self._listing_iter(lcontainer, lprefix,
-    #                                                req.environ):
-    #                pass
-    #        except ListingIterNotFound:
-    #            # no worries, last_item is None
-    #            pass
-    #        except ListingIterNotAuthorized, err:
-    #            return err.aresp
-    #        except ListingIterError:
-    #            return HTTPServerError(request=req)
-    #        if last_item:
-    #            # there are older versions so copy the previous version to the
-    #            # current object and delete the previous version
-    #            orig_container = self.container_name
-    #            orig_obj = self.object_name
-    #            self.container_name = lcontainer
-    #            self.object_name = last_item['name']
-    #            copy_path = '/' + self.account_name + '/' + \
-    #                        self.container_name + '/' + self.object_name
-    #            copy_headers = {'X-Newest': 'True',
-    #                            'Destination': orig_container + '/' + orig_obj
-    #                            }
-    #            copy_environ = {'REQUEST_METHOD': 'COPY',
-    #                            'swift_versioned_copy': True
-    #                            }
-    #            creq = Request.blank(copy_path, headers=copy_headers,
-    #                                 environ=copy_environ)
-    #            copy_resp = self.COPY(creq)
-    #            if is_client_error(copy_resp.status_int):
-    #                # some user error, maybe permissions
-    #                return HTTPPreconditionFailed(request=req)
-    #            elif not is_success(copy_resp.status_int):
-    #                # could not copy the data, bail
-    #                return HTTPServiceUnavailable(request=req)
-    #            # reset these because the COPY changed them
-    #            self.container_name = lcontainer
-    #            self.object_name = last_item['name']
-    #            new_del_req = Request.blank(copy_path, environ=req.environ)
-    #            container_info = self._container_info(self.account_name,
-    #                                                 self.container_name)
-    #            container_partition = container_info['partition']
-    #            containers = container_info['nodes']
-    #            new_del_req.acl = container_info['write_acl']
-    #            new_del_req.path_info = copy_path
-    #            req = new_del_req
-    #            # remove 'X-If-Delete-At', since it is not for the older copy
-    #            if 'X-If-Delete-At' in req.headers:
-    #                del req.headers['X-If-Delete-At']
-    #    if 'swift.authorize' in req.environ:
-    #        aresp = req.environ['swift.authorize'](req)
-    #        if aresp:
-    #            return aresp
-    #    if not containers:
-    #        return HTTPNotFound(request=req)
-    #    partition, nodes = self.app.object_ring.get_nodes(
-    #        self.account_name, self.container_name, self.object_name)
-    #    # Used by container sync feature
-    #    if 'x-timestamp' in req.headers:
-    #        try:
-    #            req.headers['X-Timestamp'] = \
-    #                normalize_timestamp(float(req.headers['x-timestamp']))
-    #        except ValueError:
-    #            return HTTPBadRequest(
-    #                request=req, content_type='text/plain',
-    #                body='X-Timestamp should be a UNIX timestamp float value; '
-    #                     'was %r' % req.headers['x-timestamp'])
-    #    else:
-    #        req.headers['X-Timestamp'] = normalize_timestamp(time.time())
-
-    #    headers = self._backend_requests(
-    #        req, len(nodes), container_partition, containers)
-    #    resp = self.make_requests(req, self.app.object_ring,
-    #                              partition, 'DELETE', req.path_info, headers)
-    #    return resp
-
-    #API
-    #this is needed to PUT, BTW
     #@public
     #@cors_validation
     #@delay_denial
-    #def COPY(self, req):
-    #    """HTTP COPY request handler."""
-    #    dest = req.headers.get('Destination')
-    #    if not dest:
-    #        return HTTPPreconditionFailed(request=req,
-    #                                      body='Destination header required')
-    #    dest = unquote(dest)
-    #    if not dest.startswith('/'):
-    #        dest = '/' + dest
-    #    try:
-    #        _junk, dest_container, dest_object = dest.split('/', 2)
-    #    except ValueError:
-    #        return HTTPPreconditionFailed(
-    #            request=req,
-    #            body='Destination header must be of the form '
-    #                 '<container name>/<object name>')
-    #    source = '/' + self.container_name + '/' + self.object_name
-    #    self.container_name = dest_container
-    #    self.object_name = dest_object
-    #    # re-write the existing request as a PUT instead of creating a new one
-    #    # since this one is already attached to the posthooklogger
-    #    req.method = 'PUT'
-    #    req.path_info = '/' + self.account_name + dest
-    #    req.headers['Content-Length'] = 0
-    #    req.headers['X-Copy-From'] = quote(source)
-    #    del req.headers['Destination']
-    #    return self.PUT(req)
+    @public
+    def DELETE(self, req):
+        """HTTP DELETE request handler."""
+        container_info = self._container_info(self.account_name,
+                                              self.container_name)
+        req.acl = container_info['write_acl']
+        if 'swift.authorize' in req.environ:
+            aresp = req.environ['swift.authorize'](req)
+            if aresp:
+                return aresp
+        # Used by container sync feature
+        if 'x-timestamp' in req.headers:
+            try:
+                req.headers['X-Timestamp'] = \
+                    normalize_timestamp(float(req.headers['x-timestamp']))
+            except ValueError:
+                return HTTPBadRequest(
+                    request=req, content_type='text/plain',
+                    body='X-Timestamp should be a UNIX timestamp float value; '
+                         'was %r' % req.headers['x-timestamp'])
+        else:
+            req.headers['X-Timestamp'] = normalize_timestamp(time.time())
+        pbroker = get_pbroker(self.app, self.plugin_class, self.account_name,
+                              self.container_name, self.object_name, False)
+        if 'x-if-delete-at' in req.headers and \
+                int(req.headers['x-if-delete-at']) != \
+                int(pbroker.metadata.get('X-Delete-At') or 0):
+            return HTTPPreconditionFailed(
+                request=req,
+                body='X-If-Delete-At and X-Delete-At do not match')
+        if not pbroker.exists():
+            return HTTPNotFound(request=req)
+        # An expired object is deleted all the same, but was not there.
+        response_class = HTTPNotFound if is_expired(pbroker.metadata) \
+            else HTTPNoContent
+        orig_size = int(pbroker.metadata.get('Content-Length') or 0)
+        self._update_delete_at(pbroker.metadata, 0)
+        if self.app.lfs_plugins.has(self.app.lfs_mode, 'delete'):
+            pbroker.delete(req.headers['X-Timestamp'])
+        else:
+            pbroker.unlinkold(req.headers['X-Timestamp'])
+        if self.app.lfs_stats:
+            self.app.lfs_stats.record(self.account_name, self.container_name,
+                                      -1, -orig_size)
+        return response_class(request=req)
 
     #... IMPLEMENTATION in object server
     #class ObjectController(object):
@@ -1945,55 +2727,6 @@ class LFSObjectController(Controller):
     #        response.content_encoding = file.metadata['Content-Encoding']
     #    return response
 
-    #tbd
-    #@public
-    #@timing_stats
-    #def DELETE(self, request):
-    #    """Handle HTTP DELETE requests for the Swift Object Server."""
-    #    try:
-    #        device, partition, account, container, obj = \
-    #            split_path(unquote(request.path), 5, 5, True)
-    #        validate_device_partition(device, partition)
-    #    except ValueError, e:
-    #        return HTTPBadRequest(body=str(e), request=request,
-    #                              content_type='text/plain')
-    #    if 'x-timestamp' not in request.headers or \
-    #            not check_float(request.headers['x-timestamp']):
-    #        return HTTPBadRequest(body='Missing timestamp', request=request,
-    #                              content_type='text/plain')
-    #    if self.mount_check and not check_mount(self.devices, device):
-    #        return HTTPInsufficientStorage(drive=device, request=request)
-    #    response_class = HTTPNoContent
-    #    file = DiskFile(self.devices, device, partition, account, container,
-    #                    obj, self.logger, disk_chunk_size=self.disk_chunk_size)
-    #    if 'x-if-delete-at' in request.headers and \
-    #            int(request.headers['x-if-delete-at']) != \
-    #            int(file.metadata.get('X-Delete-At') or 0):
-    #        return HTTPPreconditionFailed(
-    #            request=request,
-    #            body='X-If-Delete-At and X-Delete-At do not match')
-    #    orig_timestamp = file.metadata.get('X-Timestamp')
-    #    if file.is_deleted() or file.is_expired():
-    #        response_class = HTTPNotFound
-    #    metadata = {
-    #        'X-Timestamp': request.headers['X-Timestamp'], 'deleted': True,
-    #    }
-    #    old_delete_at = int(file.metadata.get('X-Delete-At') or 0)
-    #    if old_delete_at:
-    #        self.delete_at_update('DELETE', old_delete_at, account,
-    #                              container, obj, request.headers, device)
-    #    file.put_metadata(metadata, tombstone=True)
-    #    file.unlinkold(metadata['X-Timestamp'])
-    #    if not orig_timestamp or \
-    #            orig_timestamp < request.headers['x-timestamp']:
-    #        self.container_update(
-    #            'DELETE', account, container, obj, request.headers,
-    #            {'x-timestamp': metadata['X-Timestamp'],
-    #             'x-trans-id': request.headers.get('x-trans-id', '-')},
-    #            device)
-    #    resp = response_class(request=request)
-    #    return resp
-
 # XXX Not sure if it even makes sense to inherit if we get plugins loaded
 # from files eventually. Maybe organize some kind of lfs_utils.py instead?
 # XXX Calling this "plugin" doesn't feel right. Maybe "entity"?
@@ -2039,9 +2772,26 @@ class LFSPlugin(object):
     #    XXX os.write() seems like an unnecessary visibility into plugin
     #  put(self, fd, metadata)
     #    Aping DiskFile again. May change API when we get rid of fd.
+    #  #writer(self, size=None)
+    #    Context manager yielding an LFSWriter for a new temporary file,
+    #    preallocated to size; see swift.proxy.lfs_writer.lfs_writer().
     #  put_metadata(self, metadata)
     #    Like put(), only not changing the body of the object.
+    #  #copy(self, source, metadata)
+    #    Make the object a copy of the source plugin broker on the same mount,
+    #    with new metadata; see swift.proxy.lfs_copy.
+    #  #update_stats(self, object_delta, bytes_delta)
+    #    Add to the object count and bytes used of a container or account,
+    #    see swift.proxy.lfs_updater.
     #  unlinkold(self, timestamp)
+    #  #delete(self, timestamp)
+    #    Delete an object, leaving a tombstone if the plugin keeps them, or
+    #    a container that the caller has found empty. Without it objects are
+    #    deleted with unlinkold() and containers cannot be.
+    #  #delete_objects(self, names, timestamp)
+    #    Container only: delete many objects in one call, for BULK_DELETE.
+    #    Returns a dict of each name to the metadata of the deleted object,
+    #    or None if there was none.
     #  get_data_file_size(self)
     #  quarantine(self)
     # Properties that plugins implement
@@ -0,0 +1,75 @@
+# Copyright (c) 2010-2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An in-process cache of account and container info in each proxy worker,
+in front of memcache. The info of a request is kept in its WSGI env; this
+keeps it across requests, so that the hot containers of a worker are not
+read from memcache on every request.
+
+Entries live for at most the TTL of the cache and at most as long as
+memcache keeps them, which is shorter for the info of missing accounts and
+containers. Expiry times are jittered, so that entries made together are
+not refetched together. A change made through the worker clears its entry
+at once; a change made through another worker is seen within the TTL.
+"""
+
+import random
+import time
+
+from swift.common.utils import LRUCache
+
+
+class InfoCache(object):
+    """
+    Bounded LRU of info dicts, keyed by their memcache key.
+
+    :param ttl: seconds an entry is good for at most; 0 disables the cache
+    :param max_entries: entries kept before the least recently used are
+                        dropped
+    :param jitter: fraction of the time to live taken off at random
+    """
+
+    def __init__(self, ttl, max_entries=10000, jitter=0.1):
+        self.ttl = ttl
+        self.jitter = jitter
+        self.entries = LRUCache(max_entries)
+
+    def get(self, key):
+        """
+        :returns: the cached info of key, or None
+        """
+        if not self.ttl:
+            return None
+        return self.entries.get(key)
+
+    def set(self, key, info, ttl=None):
+        """
+        Cache info for key.
+
+        :param ttl: seconds memcache keeps the info, if shorter than the
+                    TTL of the cache
+        """
+        if not self.ttl:
+            return
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        self.entries.set(
+            key, info,
+            time.time() + ttl * (1 - self.jitter * random.random()))
+
+    def invalidate(self, key):
+        """Forget key, after a change to what it describes."""
+        self.entries.pop(key)
@@ -0,0 +1,247 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process benchmark of LFS mode. Unlike swift.common.bench, which drives
+the HTTP API of a running cluster, LFSBench hands swob requests straight
+to a proxy Application in LFS mode, so the account, container and object
+controllers and the plugin underneath are all that is measured. Point
+lfs_root at a tmpfs to leave the disk out as well.
+
+Each scenario is one object size and one container cardinality: a fresh
+container is filled with that many objects, which are then read with
+HEAD and GET, listed, and deleted. Every phase reports operations per
+second and the p50 and p99 latency, and can be run under cProfile.
+"""
+
+import cProfile
+import os
+import time
+
+from eventlet import GreenPool
+
+from swift.common.memcached import MemcacheRing
+from swift.common.swob import Request
+from swift.common.utils import get_logger
+
+# Phases of a scenario, in the order they run.
+PHASES = ('PUT', 'HEAD', 'GET', 'LIST', 'DELETE')
+SIZE_SUFFIXES = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+
+
+class NoRing(object):
+    """Stands in for the rings, which LFS mode never consults."""
+
+    def get_nodes(self, *args, **kwargs):
+        raise NotImplementedError('no rings in LFS mode')
+
+    get_part_nodes = get_more_nodes = get_nodes
+
+
+class NoCache(object):
+    """Stands in for memcache when the benchmark is given no servers."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, serialize=True, timeout=0, time=0):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+def parse_size(value):
+    """
+    :returns: the number of bytes of a size such as '512', '64k' or '1m'
+    """
+    value = value.strip().lower()
+    if value and value[-1] in SIZE_SUFFIXES:
+        return int(value[:-1]) * SIZE_SUFFIXES[value[-1]]
+    return int(value)
+
+
+def percentile(latencies, fraction):
+    """
+    :param latencies: sorted list of latencies
+    :returns: the latency below which fraction of them fall
+    """
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * fraction),
+                         len(latencies) - 1)]
+
+
+class LFSBenchResult(object):
+    """
+    Timings of one phase of a scenario.
+
+    :param phase: one of PHASES
+    :param size: object size in bytes
+    :param objects: number of objects in the container
+    """
+
+    def __init__(self, phase, size, objects):
+        self.phase = phase
+        self.size = size
+        self.objects = objects
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def ops(self):
+        return len(self.latencies)
+
+    @property
+    def ops_per_sec(self):
+        if not self.elapsed:
+            return 0.0
+        return self.ops / self.elapsed
+
+    @property
+    def p50(self):
+        return percentile(self.latencies, 0.5)
+
+    @property
+    def p99(self):
+        return percentile(self.latencies, 0.99)
+
+    def __str__(self):
+        return '%-6s %10d %8d %8d %6d %10.1f %9.3f %9.3f' % (
+            self.phase, self.size, self.objects, self.ops, self.errors,
+            self.ops_per_sec, self.p50 * 1000, self.p99 * 1000)
+
+    @staticmethod
+    def header():
+        return '%-6s %10s %8s %8s %6s %10s %9s %9s' % (
+            'phase', 'size', 'objects', 'ops', 'errors', 'ops/s',
+            'p50 ms', 'p99 ms')
+
+
+class LFSBench(object):
+    """
+    Runs benchmark scenarios against a proxy Application in LFS mode.
+
+    :param conf: proxy configuration; lfs_mode and lfs_root are required,
+                 memcache_servers is used if given
+    :param concurrency: requests in flight at a time
+    :param profile_dir: directory for a cProfile dump of every phase
+    :param logger: logger for the proxy
+    """
+
+    def __init__(self, conf, concurrency=1, profile_dir=None, logger=None):
+        self.conf = conf
+        self.concurrency = concurrency
+        self.profile_dir = profile_dir
+        if logger is None:
+            logger = get_logger(conf, log_route='lfs-bench')
+        self.app = _make_app(conf, logger)
+        self.account = conf.get('bench_account', 'bench')
+
+    def request(self, path, method='GET', headers=None, body=None):
+        """
+        Send one request to the proxy and read the whole response.
+
+        :returns: (latency in seconds, status_int)
+        """
+        req = Request.blank('/v1/%s%s' % (self.account, path),
+                            environ={'REQUEST_METHOD': method},
+                            headers=headers, body=body)
+        start = time.time()
+        resp = req.get_response(self.app)
+        # A GET is not done until its data has gone out.
+        for _junk in resp.app_iter:
+            pass
+        if hasattr(resp.app_iter, 'close'):
+            resp.app_iter.close()
+        return time.time() - start, resp.status_int
+
+    def _run_phase(self, result, requests):
+        pool = GreenPool(self.concurrency)
+        profiler = cProfile.Profile() if self.profile_dir else None
+        start = time.time()
+        if profiler:
+            profiler.enable()
+        for latency, status in pool.imap(
+                lambda args: self.request(*args), requests):
+            if status // 100 == 2:
+                result.latencies.append(latency)
+            else:
+                result.errors += 1
+        if profiler:
+            profiler.disable()
+        result.elapsed = time.time() - start
+        result.latencies.sort()
+        if profiler:
+            profiler.dump_stats(os.path.join(
+                self.profile_dir, '%s-%s-%d-%d.prof' % (
+                    self.conf['lfs_mode'], result.phase, result.size,
+                    result.objects)))
+        return result
+
+    def run_scenario(self, size, objects, lists=10):
+        """
+        Fill a new container with objects of size bytes, then read, list
+        and delete them.
+
+        :param lists: number of container listings to time
+        :returns: list of LFSBenchResult, one per phase
+        """
+        container = '/bench_%d_%d_%d' % (size, objects, time.time() * 1000)
+        self.request('', 'HEAD')
+        status = self.request(container, 'PUT')[1]
+        if status // 100 != 2:
+            raise Exception('Cannot create container %s: %d' %
+                            (container, status))
+        body = '0' * size
+        paths = ['%s/obj_%08d' % (container, i) for i in xrange(objects)]
+        phases = {
+            'PUT': [(path, 'PUT', {'Content-Type': 'application/octet-stream'},
+                     body) for path in paths],
+            'HEAD': [(path, 'HEAD') for path in paths],
+            'GET': [(path, 'GET') for path in paths],
+            'LIST': [(container + '?format=json', 'GET')] * lists,
+            'DELETE': [(path, 'DELETE') for path in paths],
+        }
+        results = [self._run_phase(LFSBenchResult(phase, size, objects),
+                                   phases[phase])
+                   for phase in PHASES]
+        self.request(container, 'DELETE')
+        return results
+
+    def run(self, sizes, cardinalities, lists=10):
+        """
+        Run a scenario for every object size and container cardinality.
+
+        :returns: generator of LFSBenchResult
+        """
+        for size in sizes:
+            for objects in cardinalities:
+                for result in self.run_scenario(size, objects, lists):
+                    yield result
+
+
+def _make_app(conf, logger):
+    # Imported here, the proxy server imports the LFS modules.
+    from swift.proxy.server import Application
+    if conf.get('memcache_servers'):
+        memcache = MemcacheRing([server.strip() for server in
+                                 conf['memcache_servers'].split(',')])
+    else:
+        memcache = NoCache()
+    return Application(conf, memcache=memcache, logger=logger,
+                       account_ring=NoRing(),
+                       container_ring=NoRing(), object_ring=NoRing())
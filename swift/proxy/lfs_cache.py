@@ -0,0 +1,105 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A short-lived cache of LFS lookups in the proxy worker, standing in for the
+container info that stock Swift keeps in memcache. Each object request
+needs the existence and ACLs of its container; with the cache a worker
+reads them from the plugin once per TTL instead of on every request.
+
+Every key has a generation, bumped when the worker itself changes the
+entry. A lookup takes the generation before it reads the plugin and the
+result is only stored if it is still current, so a read that raced a
+write never brings back what the write replaced. Other workers see their
+changes after at most the TTL; with memcache, their deletes of the shared
+entry take effect at once for the workers that have no local copy.
+"""
+
+import time
+
+from swift.common.utils import LRUCache
+
+# Prefix of the memcache keys, apart from those of stock container info.
+MEMCACHE_PREFIX = 'lfs/'
+
+
+def cache_key(account, container=None, obj=None):
+    """
+    :returns: the cache key of an account, container or object path
+    """
+    return '/'.join(part for part in (account, container, obj)
+                    if part is not None)
+
+
+class LFSInfoCache(object):
+    """
+    Per-worker cache of path lookups with a TTL and generations.
+
+    :param ttl: seconds an entry is good for; 0 disables the cache
+    :param max_entries: entries kept before the oldest are dropped
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.entries = LRUCache(max_entries)
+        self.generations = {}
+
+    def generation(self, key):
+        """
+        :returns: the current generation of key, to hand to set()
+        """
+        return self.generations.get(key, 0)
+
+    def get(self, key, memcache=None):
+        """
+        :param memcache: memcache client shared by the workers, if any
+        :returns: the cached value of key, or None
+        """
+        if not self.ttl:
+            return None
+        value = self.entries.get(key)
+        if value is not None:
+            return value
+        if memcache is not None:
+            value = memcache.get(MEMCACHE_PREFIX + key)
+            if value is not None:
+                self._store(key, value)
+            return value
+        return None
+
+    def _store(self, key, value):
+        self.entries.set(key, value, time.time() + self.ttl)
+
+    def set(self, key, value, generation, memcache=None):
+        """
+        Cache value for key, unless key was invalidated since generation
+        was taken.
+
+        :returns: True if the value was stored
+        """
+        if not self.ttl or generation != self.generation(key):
+            return False
+        self._store(key, value)
+        if memcache is not None:
+            memcache.set(MEMCACHE_PREFIX + key, value,
+                         time=max(int(self.ttl), 1))
+        return True
+
+    def invalidate(self, key, memcache=None):
+        """Forget key, after a change to what it was read from."""
+        self.generations[key] = self.generation(key) + 1
+        self.entries.pop(key)
+        if memcache is not None:
+            memcache.delete(MEMCACHE_PREFIX + key)
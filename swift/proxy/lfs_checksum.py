@@ -0,0 +1,104 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Checksum engines for LFS uploads. The ETag is always the MD5 of the body;
+an engine named by lfs_checksum computes an additional integrity checksum
+in the same pass, which is stored with the object as CHECKSUM_HEADER.
+
+Every engine follows the hashlib interface: a factory taking no arguments
+returns an object with update(data) and hexdigest().
+"""
+
+import zlib
+from hashlib import md5
+
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+CHECKSUM_HEADER = 'X-Object-Checksum'
+# Engine used when the configured one needs a module that is not installed.
+FALLBACK_ENGINE = 'crc32'
+
+
+class ZlibCRC32(object):
+    """CRC-32 from zlib, available everywhere."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % (self.value & 0xffffffff)
+
+
+class CRC32C(object):
+    """CRC-32C (Castagnoli) from the crc32c module, hardware assisted."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = crc32c.crc32c(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % (self.value & 0xffffffff)
+
+
+CHECKSUM_ENGINES = {
+    'md5': md5,
+    'crc32': ZlibCRC32,
+    'crc32c': CRC32C if crc32c else None,
+    'xxhash': xxhash.xxh64 if xxhash else None,
+}
+
+
+def get_checksum_engine(name, logger=None):
+    """
+    Resolve a checksum engine by name.
+
+    :param name: engine name, one of CHECKSUM_ENGINES; '' or 'none' for no
+                 engine
+    :param logger: logger for the fallback warning
+    :returns: (name, factory) of the engine actually used, or (None, None)
+    :raises ValueError: if the name is not a known engine
+    """
+    if not name or name.lower() == 'none':
+        return None, None
+    name = name.lower()
+    if name not in CHECKSUM_ENGINES:
+        raise ValueError('Unknown lfs_checksum %r' % name)
+    if CHECKSUM_ENGINES[name] is None:
+        if logger:
+            logger.warning(
+                _('lfs_checksum %(name)s is not available, using %(used)s'),
+                {'name': name, 'used': FALLBACK_ENGINE})
+        name = FALLBACK_ENGINE
+    return name, CHECKSUM_ENGINES[name]
+
+
+def format_checksum(name, checksum):
+    """
+    :returns: the CHECKSUM_HEADER value for a finished checksum object
+    """
+    return '%s:%s' % (name, checksum.hexdigest())
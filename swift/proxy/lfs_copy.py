@@ -0,0 +1,151 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Server-side copies for LFS plugins. A plugin's copy(source, metadata)
+makes its object a copy of another one on the same mount without the data
+going through the proxy; these helpers do the data part as cheaply as the
+filesystem allows: a hard link, a reflink, copy_file_range(2) and, failing
+all of those, a plain chunked copy.
+"""
+
+import ctypes
+import errno
+import fcntl
+import os
+
+from swift.common.utils import load_libc_function, noop_libc_function
+
+# ioctl(dest_fd, FICLONE, src_fd) from linux/fs.h
+FICLONE = 0x40049409
+# Bytes asked of one copy_file_range() call, or read in the chunked copy.
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Errors that mean "not here", so the next way of copying is tried.
+_UNSUPPORTED = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+                errno.ENOTTY, errno.EPERM, errno.EMLINK, errno.EBADF)
+
+_copy_file_range = None
+
+
+def _get_copy_file_range():
+    global _copy_file_range
+    if _copy_file_range is None:
+        func = load_libc_function('copy_file_range', log_error=False)
+        if func is not noop_libc_function:
+            func.restype = ctypes.c_ssize_t
+            func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                             ctypes.c_void_p, ctypes.c_size_t,
+                             ctypes.c_uint]
+        _copy_file_range = func
+    return _copy_file_range
+
+
+def reflink(src_fd, dst_fd):
+    """
+    Share the extents of src_fd with dst_fd.
+
+    :returns: False if the filesystem cannot do it
+    """
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except IOError as err:
+        if err.errno not in _UNSUPPORTED:
+            raise
+        return False
+    return True
+
+
+def copy_range(src_fd, dst_fd, size):
+    """
+    Copy size bytes from the position of src_fd to that of dst_fd in the
+    kernel with copy_file_range(2).
+
+    :returns: False if the kernel, libc or filesystem cannot do it; nothing
+              has been copied then
+    :raises OSError: if fewer than size bytes could be copied
+    """
+    func = _get_copy_file_range()
+    if func is noop_libc_function:
+        return False
+    copied = 0
+    while copied < size:
+        count = func(src_fd, None, dst_fd, None,
+                     min(size - copied, COPY_CHUNK_SIZE), 0)
+        if count < 0:
+            err = ctypes.get_errno()
+            if not copied and err in _UNSUPPORTED:
+                return False
+            raise OSError(err, os.strerror(err))
+        if count == 0:
+            # Some filesystems say they have nothing to copy rather than
+            # refuse; past the start it means the source got shorter.
+            if not copied:
+                return False
+            raise OSError(errno.EIO, 'copy_file_range stopped at %d of %d '
+                          'bytes' % (copied, size))
+        copied += count
+    return True
+
+
+def copy_chunked(src_fd, dst_fd):
+    """Copy from the position of src_fd to that of dst_fd by reading."""
+    while True:
+        chunk = os.read(src_fd, COPY_CHUNK_SIZE)
+        if not chunk:
+            return
+        while chunk:
+            chunk = chunk[os.write(dst_fd, chunk):]
+
+
+def copy_fd(src_fd, dst_fd):
+    """
+    Copy the whole of src_fd into dst_fd, which is empty.
+
+    :returns: how the data was copied: 'reflink', 'copy_file_range' or
+              'copy'
+    """
+    if reflink(src_fd, dst_fd):
+        return 'reflink'
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    if copy_range(src_fd, dst_fd, os.fstat(src_fd).st_size):
+        return 'copy_file_range'
+    copy_chunked(src_fd, dst_fd)
+    return 'copy'
+
+
+def copy_file(src_path, dst_path, dst_fd, link=False):
+    """
+    Make the temporary file dst_path, open as dst_fd, a copy of src_path.
+
+    :param link: True if src_path is never changed in place, so that a hard
+                 link to it will do; dst_path is then replaced by the link
+                 and dst_fd no longer refers to it
+    :returns: how the data was copied: 'link' or one of those of copy_fd()
+    """
+    if link:
+        link_path = dst_path + '.link'
+        try:
+            os.link(src_path, link_path)
+        except OSError as err:
+            if err.errno not in _UNSUPPORTED:
+                raise
+        else:
+            os.rename(link_path, dst_path)
+            return 'link'
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        return copy_fd(src_fd, dst_fd)
+    finally:
+        os.close(src_fd)
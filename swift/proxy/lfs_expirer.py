@@ -0,0 +1,269 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Expiring objects (X-Delete-At) for LFS. There is no container ring to keep
+the hidden expiring_objects account in, so the proxy records pending
+deletions in a local index under the LFS root instead: one directory per
+expiring_objects_container_divisor seconds, each with a sorted LFSNameIndex
+of '<delete_at>-<account>/<container>/<object>' names, the same names the
+object expirer finds in its containers. LFSObjectExpirer drains the due
+buckets and deletes the objects through the LFS plugin.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+from time import time
+
+from eventlet import Timeout
+from eventlet.greenpool import GreenPool
+
+from swift.common.utils import get_logger, mkdirs, normalize_timestamp
+from swift.obj.expirer import ObjectExpirer
+from swift.proxy.lfs_index import LFSNameIndex
+from swift.proxy.lfs_updater import LFSStatsUpdater
+
+EXPIRY_DIR = '.expiring_objects'
+# Due names are read from a bucket this many at a time.
+EXPIRY_BATCH = 1000
+
+
+def is_expired(metadata):
+    """
+    :returns: True if the object metadata has an X-Delete-At that has passed
+    """
+    return ('X-Delete-At' in metadata and
+            int(metadata['X-Delete-At']) <= time())
+
+
+class LFSExpiryIndex(object):
+    """
+    Time-bucketed index of the objects scheduled for deletion.
+
+    :param lfs_root: the LFS root directory
+    :param divisor: seconds covered by one bucket
+    """
+
+    def __init__(self, lfs_root, divisor=86400):
+        self.root = os.path.join(lfs_root, EXPIRY_DIR)
+        self.divisor = divisor
+
+    def _index(self, bucket):
+        return LFSNameIndex(os.path.join(self.root, '%010d' % bucket))
+
+    def bucket(self, delete_at):
+        return int(delete_at) // self.divisor * self.divisor
+
+    def schedule(self, delete_at, account, container, obj):
+        """Record that the object is to be deleted at delete_at."""
+        index = self._index(self.bucket(delete_at))
+        if not index.exists():
+            mkdirs(index.datadir)
+            index.initialize()
+        index.add('%010d-%s/%s/%s' % (int(delete_at), account, container,
+                                      obj))
+
+    def unschedule(self, delete_at, account, container, obj):
+        """Forget a deletion recorded by schedule()."""
+        index = self._index(self.bucket(delete_at))
+        if index.exists():
+            index.remove('%010d-%s/%s/%s' % (int(delete_at), account,
+                                             container, obj))
+
+    def buckets(self):
+        """
+        :returns: sorted list of the buckets, as the time each starts at
+        """
+        try:
+            return sorted(int(name) for name in os.listdir(self.root)
+                          if name.isdigit())
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+
+    def iter_due(self, bucket, now):
+        """
+        Generate the deletions of a bucket that are due at now.
+
+        :returns: generator of (delete_at, '<account>/<container>/<object>',
+                  index name)
+        """
+        index = self._index(bucket)
+        if not index.exists():
+            return
+        end_marker = '%010d' % (int(now) + 1)
+        marker = ''
+        while True:
+            names = [name for name, _junk in index.iter_names(
+                EXPIRY_BATCH, marker, end_marker, None, None)]
+            for name in names:
+                delete_at, actual_obj = name.split('-', 1)
+                yield int(delete_at), actual_obj, name
+            if len(names) < EXPIRY_BATCH:
+                return
+            marker = names[-1]
+
+    def remove(self, bucket, name):
+        index = self._index(bucket)
+        if index.exists():
+            index.remove(name)
+
+    def prune(self, bucket, now):
+        """
+        Remove a bucket that is over and has been drained.
+
+        :returns: True if the bucket was removed
+        """
+        index = self._index(bucket)
+        if bucket + self.divisor > now or \
+                (index.exists() and index.count()):
+            return False
+        shutil.rmtree(index.datadir, ignore_errors=True)
+        return True
+
+
+class LFSObjectExpirer(ObjectExpirer):
+    """
+    Daemon that drains the LFS expiry index, deleting the objects whose
+    X-Delete-At has come. It reads the proxy's lfs_mode and lfs_root and
+    talks to the LFS plugin directly, so it runs on the LFS node itself.
+
+    :param conf: The daemon configuration.
+    """
+
+    def __init__(self, conf):
+        # Imported here: the controllers import this module.
+        from swift.proxy.controllers.lfs import LFSPluginRegistry, \
+            LFSThreadPools
+        self.conf = conf
+        self.logger = get_logger(conf, log_route='lfs-object-expirer')
+        self.interval = int(conf.get('interval') or 300)
+        self.lfs_mode = conf.get('lfs_mode', 'posix')
+        self.lfs_root = conf['lfs_root']
+        registry = LFSPluginRegistry()
+        self.plugin_class = registry.load(self.lfs_mode)
+        # Stats changes are flushed at the end of each pass.
+        self.lfs_stats = None
+        self.plugin_delete = registry.has(self.lfs_mode, 'delete')
+        if registry.has(self.lfs_mode, 'stats_update'):
+            self.lfs_stats = LFSStatsUpdater(self, self.plugin_class, 0)
+        self.lfs_threadpools = LFSThreadPools(
+            int(conf.get('lfs_threads_per_mount', '0')), self.logger)
+        self.expiry = LFSExpiryIndex(
+            self.lfs_root,
+            int(conf.get('expiring_objects_container_divisor') or 86400))
+        self.report_interval = int(conf.get('report_interval') or 300)
+        self.report_first_time = self.report_last_time = time()
+        self.report_objects = 0
+        self.recon_cache_path = conf.get('recon_cache_path',
+                                         '/var/cache/swift')
+        self.rcache = os.path.join(self.recon_cache_path, 'object.recon')
+        self.concurrency = int(conf.get('concurrency', 1))
+        if self.concurrency < 1:
+            raise ValueError("concurrency must be set to at least 1")
+        self.processes = int(self.conf.get('processes', 0))
+        self.process = int(self.conf.get('process', 0))
+
+    def run_once(self, *args, **kwargs):
+        """
+        Executes a single pass, deleting the objects that are due.
+
+        :param args: Extra args to fulfill the Daemon interface; this daemon
+                     has no additional args.
+        :param kwargs: Extra keyword args to fulfill the Daemon interface; this
+                       daemon accepts processes and process keyword args.
+                       These will override the values from the config file if
+                       provided.
+        """
+        processes, process = self.get_process_values(kwargs)
+        pool = GreenPool(self.concurrency)
+        self.report_first_time = self.report_last_time = time()
+        self.report_objects = 0
+        try:
+            self.logger.debug(_('Run begin'))
+            now = int(time())
+            due_buckets = [b for b in self.expiry.buckets() if b <= now]
+            self.logger.info(_('Pass beginning; %s possible buckets') %
+                             len(due_buckets))
+            for bucket in due_buckets:
+                for delete_at, actual_obj, name in \
+                        self.expiry.iter_due(bucket, now):
+                    if processes > 0:
+                        obj_process = int(
+                            hashlib.md5('%s/%s' % (bucket, name)).
+                            hexdigest(), 16)
+                        if obj_process % processes != process:
+                            continue
+                    pool.spawn_n(self.delete_object, actual_obj, delete_at,
+                                 bucket, name)
+            pool.waitall()
+            if self.lfs_stats:
+                self.lfs_stats.flush()
+            for bucket in due_buckets:
+                try:
+                    self.expiry.prune(bucket, now)
+                except (Exception, Timeout), err:
+                    self.logger.exception(
+                        _('Exception while pruning bucket %s %s') %
+                        (bucket, str(err)))
+            self.logger.debug(_('Run end'))
+            self.report(final=True)
+        except (Exception, Timeout):
+            self.logger.exception(_('Unhandled exception'))
+
+    def delete_object(self, actual_obj, timestamp, bucket, name):
+        start_time = time()
+        try:
+            self.delete_actual_object(actual_obj, timestamp)
+            self.lfs_threadpools.run_in_thread(
+                self.lfs_root, self.expiry.remove, bucket, name)
+            self.report_objects += 1
+            self.logger.increment('objects')
+        except (Exception, Timeout), err:
+            self.logger.increment('errors')
+            self.logger.exception(
+                _('Exception while deleting object %s %s %s') %
+                (bucket, name, str(err)))
+        self.logger.timing_since('timing', start_time)
+        self.report()
+
+    def delete_actual_object(self, actual_obj, timestamp):
+        """
+        Deletes the end-user object indicated by the actual object name given
+        '<account>/<container>/<object>' if and only if the X-Delete-At value
+        of the object is exactly the timestamp given.
+
+        :param actual_obj: The name of the end-user object to delete:
+                           '<account>/<container>/<object>'
+        :param timestamp: The timestamp the X-Delete-At value must match to
+                          perform the actual delete.
+        """
+        from swift.proxy.controllers.lfs import get_pbroker
+        account, container, obj = actual_obj.split('/', 2)
+        pbroker = get_pbroker(self, self.plugin_class, account, container,
+                              obj, False)
+        if not pbroker.exists() or \
+                int(pbroker.metadata.get('X-Delete-At') or 0) != timestamp:
+            return
+        size = int(pbroker.metadata.get('Content-Length') or 0)
+        if self.plugin_delete:
+            pbroker.delete(normalize_timestamp(time()))
+        else:
+            pbroker.unlinkold(normalize_timestamp(time()))
+        if self.lfs_stats:
+            self.lfs_stats.record(account, container, -1, -size)
@@ -0,0 +1,269 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sorted name index for LFS plugins that keep their entities in a plain
+directory tree. Every account and container directory gets a small SQLite
+database next to its entries, so that listings are a seek to the marker
+plus a bounded scan instead of a listdir and sort of the whole directory.
+
+For objects the index doubles as a metadata summary: the listing columns
+(timestamp, size, content type and etag) are kept with the name, so a page
+of a listing is served without opening the metadata of each object.
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+
+from swift.common.db import BROKER_TIMEOUT, get_db_connection
+
+INDEX_NAME = '.lfs_index.db'
+# SQLite refuses statements with more than 999 parameters.
+MAX_QUERY_NAMES = 500
+
+
+class LFSNameIndex(object):
+    """
+    Sorted set of names for one account or container directory.
+
+    :param datadir: the account or container directory
+    :param timeout: timeout for acquiring the database lock
+    """
+
+    def __init__(self, datadir, timeout=BROKER_TIMEOUT):
+        self.datadir = datadir
+        self.db_file = os.path.join(datadir, INDEX_NAME)
+        self.timeout = timeout
+
+    def exists(self):
+        return os.path.exists(self.db_file)
+
+    def _connect(self, okay_to_create=False):
+        return get_db_connection(self.db_file, timeout=self.timeout,
+                                 okay_to_create=okay_to_create)
+
+    def initialize(self, names=()):
+        """
+        Create the index, populating it with names. An existing index is
+        replaced, so this doubles as a rebuild from a directory scan. The
+        metadata summary of the names is left empty and is filled in by
+        :func:`set_metadata` as it is found.
+
+        :param names: iterable of names to start with
+        """
+        with closing(self._connect(okay_to_create=True)) as conn:
+            conn.execute('DROP TABLE IF EXISTS name')
+            conn.execute("""
+                CREATE TABLE name (
+                    name TEXT PRIMARY KEY,
+                    created_at TEXT,
+                    size INTEGER,
+                    content_type TEXT,
+                    etag TEXT
+                )""")
+            conn.executemany('INSERT OR IGNORE INTO name (name) VALUES (?)',
+                             ((n,) for n in names))
+            conn.commit()
+
+    def _add_metadata_columns(self, conn):
+        # Indexes made before the metadata summary only had the name.
+        for column in ('created_at TEXT', 'size INTEGER',
+                       'content_type TEXT', 'etag TEXT'):
+            conn.execute('ALTER TABLE name ADD COLUMN %s' % column)
+
+    def add(self, name, created_at=None, size=None, content_type=None,
+            etag=None):
+        """
+        Add a name, replacing its metadata summary if it is present.
+
+        :param name: name to add
+        :param created_at: timestamp of the object
+        :param size: size of the object in bytes
+        :param content_type: content type of the object
+        :param etag: etag of the object
+        """
+        with closing(self._connect()) as conn:
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO name
+                        (name, created_at, size, content_type, etag)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (name, created_at, size, content_type, etag))
+            except sqlite3.OperationalError, err:
+                if 'no column named created_at' not in str(err):
+                    raise
+                self._add_metadata_columns(conn)
+                conn.execute("""
+                    INSERT OR REPLACE INTO name
+                        (name, created_at, size, content_type, etag)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (name, created_at, size, content_type, etag))
+            conn.commit()
+
+    def remove(self, name):
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM name WHERE name = ?', (name,))
+            conn.commit()
+
+    def remove_many(self, names):
+        """Remove many names in one transaction."""
+        if not names:
+            return
+        with closing(self._connect()) as conn:
+            conn.executemany('DELETE FROM name WHERE name = ?',
+                             ((name,) for name in names))
+            conn.commit()
+
+    def get_metadata(self, names):
+        """
+        Get the metadata summary of many names at once.
+
+        :param names: list of names to look up
+        :returns: dict mapping name to a (created_at, size, content_type,
+                  etag) tuple; names that are not indexed or have no
+                  summary yet are left out
+        """
+        results = {}
+        with closing(self._connect()) as conn:
+            for offset in xrange(0, len(names), MAX_QUERY_NAMES):
+                chunk = names[offset:offset + MAX_QUERY_NAMES]
+                try:
+                    rows = conn.execute("""
+                        SELECT name, created_at, size, content_type, etag
+                        FROM name
+                        WHERE created_at IS NOT NULL AND name IN (%s)
+                    """ % ','.join('?' * len(chunk)), chunk).fetchall()
+                except sqlite3.OperationalError, err:
+                    if 'no such column: created_at' not in str(err):
+                        raise
+                    return results
+                for name, created_at, size, content_type, etag in rows:
+                    results[name] = (created_at, size, content_type, etag)
+        return results
+
+    def set_metadata(self, items):
+        """
+        Fill in the metadata summary of names already in the index.
+
+        :param items: list of (name, created_at, size, content_type, etag)
+        """
+        if not items:
+            return
+        query = """
+            UPDATE name SET created_at = ?, size = ?, content_type = ?,
+                etag = ?
+            WHERE name = ?
+        """
+        args = [item[1:] + (item[0],) for item in items]
+        with closing(self._connect()) as conn:
+            try:
+                conn.executemany(query, args)
+            except sqlite3.OperationalError, err:
+                if 'no such column: created_at' not in str(err):
+                    raise
+                self._add_metadata_columns(conn)
+                conn.executemany(query, args)
+            conn.commit()
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM name').fetchone()[0]
+
+    def iter_names(self, limit, marker, end_marker, prefix, delimiter,
+                   path=None):
+        """
+        Generate names sorted from marker onward, up to limit entries. This
+        follows ContainerBroker.list_objects_iter: entries begin with the
+        prefix, and names with the delimiter after the prefix are rolled up
+        into a single subdirectory entry.
+
+        :param limit: maximum number of entries to get
+        :param marker: marker query
+        :param end_marker: end marker query
+        :param prefix: prefix query
+        :param delimiter: delimiter for query
+        :param path: if defined, will set the prefix and delimter based on
+                     the path
+
+        :returns: generator of (name, is_subdir)
+        """
+        delim_force_gte = False
+        if path is not None:
+            prefix = path
+            if path:
+                prefix = path = path.rstrip('/') + '/'
+            delimiter = '/'
+        elif delimiter and not prefix:
+            prefix = ''
+        orig_marker = marker
+        count = 0
+        with closing(self._connect()) as conn:
+            while count < limit:
+                query = 'SELECT name FROM name WHERE'
+                query_args = []
+                if end_marker:
+                    query += ' name < ? AND'
+                    query_args.append(end_marker)
+                if delim_force_gte:
+                    query += ' name >= ? AND'
+                    query_args.append(marker)
+                    # Always set back to False
+                    delim_force_gte = False
+                elif marker and marker >= (prefix or ''):
+                    query += ' name > ? AND'
+                    query_args.append(marker)
+                elif prefix:
+                    query += ' name >= ? AND'
+                    query_args.append(prefix)
+                query += ' 1 ORDER BY name LIMIT ?'
+                query_args.append(limit - count)
+                # Fetch a page at a time, so no cursor stays open while the
+                # caller is busy with the rows we yielded.
+                rows = conn.execute(query, query_args).fetchall()
+
+                if not delimiter:
+                    for (name,) in rows:
+                        if prefix and not name.startswith(prefix):
+                            return
+                        yield name, False
+                    return
+
+                if not rows:
+                    return
+                for (name,) in rows:
+                    marker = name
+                    if not name.startswith(prefix):
+                        return
+                    end = name.find(delimiter, len(prefix))
+                    if path is not None:
+                        if name == path:
+                            continue
+                        if end >= 0 and len(name) > end + len(delimiter):
+                            marker = name[:end] + chr(ord(delimiter) + 1)
+                            break
+                    elif end > 0:
+                        marker = name[:end] + chr(ord(delimiter) + 1)
+                        # we want result to be inclusinve of delim+1
+                        delim_force_gte = True
+                        dir_name = name[:end + 1]
+                        if dir_name != orig_marker:
+                            yield dir_name, True
+                            count += 1
+                        break
+                    yield name, False
+                    count += 1
+                    if count >= limit:
+                        return
@@ -15,30 +15,94 @@
 
 import cPickle as pickle
 import errno
+import fcntl
 import os
+import shutil
+import traceback
 import xattr
 
 from contextlib import contextmanager
 from hashlib import md5
 from tempfile import mkstemp
+from uuid import uuid4
+
+from eventlet import Timeout
 
 # XXX get rid of exceptions or find a way to define them for LFS plugins
 from swift.common.exceptions import (DiskFileError, DiskFileNotExist)
-from swift.common.utils import (mkdirs, normalize_timestamp, renamer)
+from swift.common.swob import multi_range_iterator
+from swift.common.utils import (json, lock_path, mkdirs, normalize_timestamp,
+                                renamer)
+from swift.proxy.lfs_copy import copy_file
+from swift.proxy.lfs_index import INDEX_NAME, LFSNameIndex
+from swift.proxy.lfs_writer import lfs_writer
 
 DISALLOWED_HEADERS = set('content-length content-type deleted etag'.split())
 X_CONTENT_LENGTH = 'Content-Length'
+X_CONTENT_TYPE = 'Content-Type'
+X_ETAG = 'ETag'
+X_TIMESTAMP = 'X-Timestamp'
 
 
 METADATA_KEY = 'user.swift.metadata'
+# Compact metadata: JSON, prefixed with the number of xattrs it spans.
+METADATA2_KEY = 'user.swift.metadata.v2'
 #STATUS_KEY = 'user.swift.status'
 CONTCNT_KEY = 'user.swift.container_count'
+# Object count and bytes used of a container or account, "count bytes".
+STATS_KEY = 'user.swift.stats'
+# Seconds update_stats() waits for the stats lock when it runs in the hub.
+STATS_LOCK_TIMEOUT = 10
 PICKLE_PROTOCOL = 2
-#MAX_XATTR_SIZE = 65536
+
+# Object layouts of a container, recorded in its LAYOUT_FILE: objects at
+# <container>/<name>, or under two levels of hashed fan-out directories.
+LAYOUT_FILE = '.layout'
+LAYOUT_FLAT = 'flat'
+LAYOUT_HASHED = 'hashed'
+LAYOUT_MIGRATING = 'migrating'
+# Names read from the index at a time by a migration.
+MIGRATE_BATCH = 1000
+# Chunk size for filesystems that refuse the metadata in one xattr; this
+# fits the single block that ext4 has for the xattrs of an inode.
+METADATA_CHUNK_SIZE = 3072
+
+def _utf8(value):
+    # JSON hands back unicode and lists where we stored str and tuples.
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return tuple(_utf8(v) for v in value)
+    if isinstance(value, dict):
+        return dict((_utf8(k), _utf8(v)) for k, v in value.iteritems())
+    return value
+
+def _metadata2_key(index):
+    if not index:
+        return METADATA2_KEY
+    return '%s.%d' % (METADATA2_KEY, index)
+
+def read_metadata(path):
+    """
+    Read the metadata of an account or container directory. The compact
+    format tells how many xattrs to read, so the usual cost is one
+    getxattr. Metadata in the old chunked pickle format is still read.
+    """
+    try:
+        metastr = xattr.getxattr(path, METADATA2_KEY)
+    except IOError as err:
+        if err.errno != errno.ENODATA:
+            raise
+        return read_legacy_metadata(path)
+    count, metastr = metastr.split(':', 1)
+    chunks = [metastr]
+    for key in xrange(1, int(count)):
+        chunks.append(xattr.getxattr(path, _metadata2_key(key)))
+    return _utf8(json.loads(''.join(chunks)))
 
 # Using the same metadata protocol as the object server normally uses.
 # XXX Gluster has a more elaborate verion with gradual unpickling. Why?
-def read_metadata(path):
+def read_legacy_metadata(path):
     metadata = ''
     key = 0
     try:
@@ -62,12 +126,23 @@ def read_meta_file(path):
     return pickle.loads(metadata)
 
 def write_metadata(path, metadata):
-    metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
-    key = 0
-    while metastr:
-        xattr.setxattr(path, '%s%s' % (METADATA_KEY, key or ''), metastr[:254])
-        metastr = metastr[254:]
-        key += 1
+    """
+    Write the metadata of an account or container directory in the compact
+    format, as a single xattr unless the filesystem refuses one that large.
+    """
+    metastr = json.dumps(metadata, separators=(',', ':'))
+    try:
+        xattr.setxattr(path, METADATA2_KEY, '1:' + metastr)
+        return
+    except IOError as err:
+        if err.errno not in (errno.E2BIG, errno.ENOSPC, errno.ERANGE):
+            raise
+    chunks = [metastr[i:i + METADATA_CHUNK_SIZE]
+              for i in xrange(0, len(metastr), METADATA_CHUNK_SIZE)]
+    # The first chunk goes last: it carries the count that readers trust.
+    for key in xrange(len(chunks) - 1, 0, -1):
+        xattr.setxattr(path, _metadata2_key(key), chunks[key])
+    xattr.setxattr(path, METADATA2_KEY, '%d:%s' % (len(chunks), chunks[0]))
 
 def write_meta_file(path, metadata):
     metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
@@ -76,7 +151,12 @@ def write_meta_file(path, metadata):
 
 # N.B. This can return an object type metadata if tombstone is found.
 def load_meta_file(obj_path):
-    files = sorted(os.listdir(obj_path), reverse=True)
+    try:
+        files = sorted(os.listdir(obj_path), reverse=True)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return None
     meta_file = None
     data_file = None
     for file in files:
@@ -84,20 +164,204 @@ def load_meta_file(obj_path):
             metadata = {'deleted': True}
             return metadata
         if file.endswith('.meta') and not meta_file:
-            meta_file = os.path.join(self.datadir, file)
+            meta_file = os.path.join(obj_path, file)
         if file.endswith('.data') and not data_file:
-            data_file = os.path.join(self.datadir, file)
-        if meta_file and self.data_file:
+            data_file = os.path.join(obj_path, file)
+        if meta_file and data_file:
             break
     if not meta_file:
         return None
     return read_meta_file(meta_file)
 
+def listing_summary(metadata):
+    """
+    Return the (created_at, size, content_type, etag) that a container
+    listing shows for an object with the given metadata.
+    """
+    return (metadata[X_TIMESTAMP], int(metadata[X_CONTENT_LENGTH]),
+            metadata[X_CONTENT_TYPE], metadata[X_ETAG])
+
+def do_unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+def scan_object_names(cont_path):
+    """
+    Find the objects of a container by walking its directory, for building
+    the name index of a tree that was written without one. An object is a
+    directory holding a .data file; names may contain slashes. In a hashed
+    container the name is the one recorded in the metadata.
+    """
+    names = []
+    for path, dirs, files in os.walk(cont_path):
+        if path != cont_path and \
+                [f for f in files if f.endswith('.data')]:
+            metadata = load_meta_file(path) or {}
+            names.append(metadata.get('name') or
+                         os.path.relpath(path, cont_path))
+    return names
+
+def scan_container_names(acc_path):
+    return [name for name in os.listdir(acc_path)
+            if name != INDEX_NAME and
+            os.path.isdir(os.path.join(acc_path, name))]
+
+def hashed_object_path(cont_path, obj):
+    """
+    Return the directory of an object in a hashed container: two levels of
+    fan-out by the MD5 of the name, so that no directory grows with the
+    number of objects.
+    """
+    name_hash = md5(obj).hexdigest()
+    return os.path.join(cont_path, name_hash[:2], name_hash[2:4], name_hash)
+
+def read_layout(cont_path):
+    """
+    Return the layout of a container: LAYOUT_FLAT unless its LAYOUT_FILE
+    says otherwise.
+    """
+    try:
+        with open(os.path.join(cont_path, LAYOUT_FILE)) as fp:
+            layout = fp.read().strip()
+    except IOError as err:
+        if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return LAYOUT_FLAT
+    return layout
+
+def write_layout(cont_path, layout):
+    tmp_path = os.path.join(cont_path, LAYOUT_FILE + '.tmp')
+    with open(tmp_path, 'w') as fp:
+        fp.write(layout + '\n')
+    os.rename(tmp_path, os.path.join(cont_path, LAYOUT_FILE))
+
+def object_path(cont_path, obj):
+    """
+    Return the directory of an object, by the layout of its container. While
+    a container migrates, an object stays at its flat path until moved.
+    """
+    layout = read_layout(cont_path)
+    if layout == LAYOUT_FLAT:
+        return os.path.join(cont_path, obj)
+    path = hashed_object_path(cont_path, obj)
+    if layout == LAYOUT_MIGRATING and not os.path.isdir(path):
+        flat_path = os.path.join(cont_path, obj)
+        if os.path.isdir(flat_path):
+            return flat_path
+    return path
+
+def _object_files(path):
+    try:
+        return [f for f in os.listdir(path)
+                if f.endswith(('.data', '.meta', '.ts'))]
+    except OSError as err:
+        if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return []
+
+def _remove_empty_dirs(path, stop_path):
+    while path != stop_path:
+        try:
+            os.rmdir(path)
+        except OSError as err:
+            if err.errno not in (errno.ENOTEMPTY, errno.EEXIST,
+                                 errno.ENOENT):
+                raise
+            return
+        path = os.path.dirname(path)
+
+def migrate_object(cont_path, obj):
+    """
+    Move an object of a migrating container from its flat path to its hashed
+    one. The files are hard linked into a new directory that is renamed into
+    place, so readers see either the flat or the complete hashed object;
+    files written to the flat path meanwhile are merged into the hashed
+    directory by a later call, the newest timestamp winning as usual.
+
+    :returns: True if anything was moved
+    """
+    flat_path = os.path.join(cont_path, obj)
+    files = _object_files(flat_path)
+    if not files:
+        return False
+    for name in files:
+        if name.endswith('.meta'):
+            # Hashed paths do not give the name back; index rebuilds read it.
+            meta_path = os.path.join(flat_path, name)
+            metadata = read_meta_file(meta_path)
+            if metadata.get('name') != obj:
+                metadata['name'] = obj
+                write_meta_file(meta_path, metadata)
+    hashed_path = hashed_object_path(cont_path, obj)
+    # As put() does: the metadata goes in before the data.
+    files.sort(key=lambda name: not name.endswith('.meta'))
+    if os.path.isdir(hashed_path):
+        for name in files:
+            try:
+                os.link(os.path.join(flat_path, name),
+                        os.path.join(hashed_path, name))
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+    else:
+        mkdirs(os.path.dirname(hashed_path))
+        tmp_path = '%s.%s' % (hashed_path, uuid4().hex)
+        os.mkdir(tmp_path)
+        for name in files:
+            os.link(os.path.join(flat_path, name),
+                    os.path.join(tmp_path, name))
+        os.rename(tmp_path, hashed_path)
+    for name in files:
+        do_unlink(os.path.join(flat_path, name))
+    _remove_empty_dirs(flat_path, cont_path)
+    return True
+
+def _migrate_objects(cont_path, index):
+    moved = 0
+    marker = ''
+    while True:
+        names = [name for name, _junk in
+                 index.iter_names(MIGRATE_BATCH, marker, '', None, None)]
+        for name in names:
+            if migrate_object(cont_path, name):
+                moved += 1
+        if len(names) < MIGRATE_BATCH:
+            return moved
+        marker = names[-1]
+
+def migrate_container(cont_path):
+    """
+    Convert a flat container to the hashed layout while it stays in use.
+    The container is marked migrating, which has new objects written hashed
+    and existing ones looked up at either path, then every object in its
+    name index is moved. Once it is marked hashed, a second pass picks up
+    what was written to flat paths during the first.
+
+    :returns: number of objects moved
+    """
+    layout = read_layout(cont_path)
+    if layout == LAYOUT_HASHED:
+        return 0
+    index = LFSNameIndex(cont_path)
+    if not index.exists():
+        index.initialize(scan_object_names(cont_path))
+    if layout == LAYOUT_FLAT:
+        write_layout(cont_path, LAYOUT_MIGRATING)
+    moved = _migrate_objects(cont_path, index)
+    write_layout(cont_path, LAYOUT_HASHED)
+    return moved + _migrate_objects(cont_path, index)
+
 # XXX How about implementing a POSIX pbroker that does not use xattr?
 class LFSPluginPosix():
     def __init__(self, app, account, container, obj, keep_data_fp):
+        self.account_path = os.path.join(app.lfs_root, account)
+        if container:
+            self.container_path = os.path.join(self.account_path, container)
         if obj:
-            path = os.path.join(app.lfs_root, account, container, obj)
+            path = object_path(self.container_path, obj)
             self._type = 0 # like port 6010
         elif container:
             path = os.path.join(app.lfs_root, account, container)
@@ -105,11 +369,16 @@ class LFSPluginPosix():
         else:
             path = os.path.join(app.lfs_root, account)
             self._type = 2 # like port 6012
+        self.app = app
+        self.account = account
+        self.container = container
+        self.obj = obj
         # P3
         fp = open("/tmp/dump","a")
         print >>fp, "posix __init__ type", self._type, "path", path
         fp.close()
         self.datadir = path
+        self.logger = app.logger
         self.tmpdir = os.path.join(app.lfs_root, "tmp")
         self.tmppath = None
         self.data_file = None
@@ -122,14 +391,9 @@ class LFSPluginPosix():
         self.disk_chunk_size = 128*1024
         self.metadata = {}
 
-        if not os.path.exists(self.datadir):
-            # P3
-            fp = open("/tmp/dump","a")
-            print >>fp, "posix __init__ not exist"
-            fp.close()
-            return
-
         if self._type == 1 or self._type == 2:
+            if not os.path.exists(self.datadir):
+                return
             self.metadata = read_metadata(self.datadir)
             # P3
             fp = open("/tmp/dump","a")
@@ -138,7 +402,13 @@ class LFSPluginPosix():
             return
 
         # XXX use a common load_meta_file() here - when P3's are gone
-        files = sorted(os.listdir(self.datadir), reverse=True)
+        # No stat first: the listing fails the same for a missing object.
+        try:
+            files = sorted(os.listdir(self.datadir), reverse=True)
+        except OSError as err:
+            if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            return
         for file in files:
             if file.endswith('.ts'):
                 self.data_file = self.meta_file = None
@@ -181,6 +451,9 @@ class LFSPluginPosix():
         # and one that was initialized in the broker, doing complex checks
         # such as put_timestamp, delete_timestamp comparison. We omit that.
         # For now.
+        if self._type == 0:
+            # The directory of an object outlives it, holding a tombstone.
+            return self.data_file is not None
         return os.path.exists(self.datadir)
 
     def initialize(self, timestamp):
@@ -191,42 +464,70 @@ class LFSPluginPosix():
         fp = open("/tmp/dump","a")
         print >>fp, "posix initialize path", self.datadir, "ts", timestamp
         fp.close()
-        os.makedirs(self.datadir)
+        # An object directory may be left over from a deleted object.
+        mkdirs(self.datadir)
         #xattr.setxattr(self.datadir, STATUS_KEY, 'OK')
         # Keeping stats counts in EA must be ridiculously inefficient. XXX
         if self._type == 2:
             xattr.setxattr(self.datadir, CONTCNT_KEY, str(0))
             write_metadata(self.datadir, self.metadata)
+            LFSNameIndex(self.datadir).initialize()
         elif self._type == 1:
             write_metadata(self.datadir, self.metadata)
+            LFSNameIndex(self.datadir).initialize()
+            if getattr(self.app, 'lfs_posix_layout', LAYOUT_FLAT) == \
+                    LAYOUT_HASHED:
+                write_layout(self.datadir, LAYOUT_HASHED)
+            self._name_index(self.account_path,
+                             scan_container_names).add(self.container)
         else:
             pass
         ts = int(float(timestamp))
         os.utime(self.datadir, (ts, ts))
 
+    def _name_index(self, path, scan):
+        """
+        Return the name index of an account or container directory, building
+        it from a scan of the directory if the tree predates the index.
+        """
+        index = LFSNameIndex(path)
+        if not index.exists():
+            index.initialize(scan(path))
+        return index
+
     # All the status machinery is not intended in p-broker. Maybe never.
     #def is_status_deleted(self):
     #    # underlying account is marked as deleted
     #    status = xattr.getxattr(self.datadir, STATUS_KEY)
     #    return status == 'DELETED'
 
+    def _read_stats(self):
+        try:
+            object_count, bytes_used = \
+                xattr.getxattr(self.datadir, STATS_KEY).split()
+        except IOError as err:
+            if err.errno != errno.ENODATA:
+                raise
+            return 0, 0
+        return int(object_count), int(bytes_used)
+
     def get_info(self):
         name = os.path.basename(self.datadir)
         st = os.stat(self.datadir)
+        object_count, bytes_used = self._read_stats()
         if self._type == 2:
             cont_cnt_str = xattr.getxattr(self.datadir, CONTCNT_KEY)
             try:
                 container_count = int(cont_cnt_str)
             except ValueError:
                 cont_cnt_str = "0"
-            # XXX object_count, bytes_used
             return {'account': name,
                 'created_at': normalize_timestamp(st.st_ctime),
                 'put_timestamp': normalize_timestamp(st.st_mtime),
                 'delete_timestamp': '0',
                 'container_count': cont_cnt_str,
-                'object_count': '0',
-                'bytes_used': '0',
+                'object_count': str(object_count),
+                'bytes_used': str(bytes_used),
                 'hash': '-',
                 'id': ''}
         else:
@@ -235,74 +536,116 @@ class LFSPluginPosix():
                 'created_at': normalize_timestamp(st.st_ctime),
                 'put_timestamp': normalize_timestamp(st.st_mtime),
                 'delete_timestamp': '0',
-                'object_count': '0',
-                'bytes_used': '0',
+                'object_count': str(object_count),
+                'bytes_used': str(bytes_used),
                 'hash': '-',
                 'id': ''}
 
-    # This is called a something_iter, but it is not actually an iterator.
-    def list_containers_iter(self, limit,marker,end_marker,prefix,delimiter):
-        # XXX implement delimeter; consult CF devguide
+    def update_stats(self, object_delta, bytes_delta):
+        """
+        Add to the object count and bytes used of a container or account.
+        Several proxy workers flush to the same directories, so the update
+        is done under an flock of a .lock file in it.
+
+        :param object_delta: change in the number of objects
+        :param bytes_delta: change in the number of bytes
+        :raises LockTimeout: if the lock is not had in STATS_LOCK_TIMEOUT
+                             seconds; only without an LFS thread pool
+        """
+        assert self._type != 0
+        with self._stats_lock():
+            object_count, bytes_used = self._read_stats()
+            object_count += object_delta
+            bytes_used += bytes_delta
+            if object_count < 0 or bytes_used < 0:
+                self.logger.warning(
+                    _('Stats of %(path)s went negative (%(count)d objects, '
+                      '%(bytes)d bytes); clamping to zero'),
+                    {'path': self.datadir, 'count': object_count,
+                     'bytes': bytes_used})
+            xattr.setxattr(self.datadir, STATS_KEY, '%d %d' % (
+                max(object_count, 0), max(bytes_used, 0)))
 
-        containers = os.listdir(self.datadir)
-        containers.sort()
-        containers.reverse()
+    @contextmanager
+    def _stats_lock(self):
+        if self.app.lfs_threadpools.threads_per_mount <= 0:
+            # Called in the hub: poll the lock with green sleeps, and give up
+            # with a LockTimeout; the updater keeps the change for later.
+            with lock_path(self.datadir, STATS_LOCK_TIMEOUT):
+                yield
+            return
+        fd = os.open(os.path.join(self.datadir, '.lock'),
+                     os.O_WRONLY | os.O_CREAT)
+        try:
+            # A blocking flock: this runs in a worker thread, where the
+            # eventlet timeouts of lock_path() do not work.
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
 
+    # This is called a something_iter, but it is not actually an iterator.
+    def list_containers_iter(self, limit,marker,end_marker,prefix,delimiter):
+        index = self._name_index(self.datadir, scan_container_names)
         results = []
-        count = 0
-        for cont in containers:
-            if prefix:
-                if not cont.startswith(prefix):
-                    continue
-            if marker:
-                if cont == marker:
-                    marker = None
-                continue
-            if count < limit:
-                # XXX (name, object_count, bytes_used, is_subdir)
-                # XXX Should we encode in UTF-8 here or later?
-                results.append([cont, 0, 0, 1])
-                count += 1
+        for name, is_subdir in index.iter_names(limit, marker, end_marker,
+                                                prefix, delimiter):
+            # XXX (name, object_count, bytes_used, is_subdir)
+            # XXX Should we encode in UTF-8 here or later?
+            results.append([name, 0, 0, int(is_subdir)])
         return results
 
     def list_objects_iter(self, limit, marker, end_marker, prefix, delim, path):
-        # XXX implement delimeter; consult CF devguide
+        return list(self.iter_objects(limit, marker, end_marker, prefix,
+                                      delim, path))
 
-        objects = os.listdir(self.datadir)
-        objects.sort()
-        objects.reverse()
+    def iter_objects(self, limit, marker, end_marker, prefix, delim, path):
+        """
+        Generate the container listing one row at a time, in name order.
+        Metadata is only read for the rows that are actually yielded, so
+        the caller can start sending before the listing is complete.
 
-        results = []
-        count = 0
-        for obj in objects:
-            if prefix:
-                if not obj.startswith(prefix):
-                    continue
-            if marker:
-                if obj == marker:
-                    marker = None
-                continue
-            if count < limit:
-                # XXX (name, object_count, bytes_used, is_subdir)
+        :returns: generator of (name, created_at, size, content_type, etag)
+        """
+        index = self._name_index(self.datadir, scan_object_names)
+        entries = list(index.iter_names(limit, marker, end_marker, prefix,
+                                        delim, path))
+        summaries = self.get_objects_metadata(
+            [obj for obj, is_subdir in entries if not is_subdir])
+        for obj, is_subdir in entries:
+            if is_subdir:
+                yield (obj, '0', 0, None, '')
+            elif obj in summaries:
                 # XXX Should we encode in UTF-8 here or later?
-                results.append([cont, 0, 0, 1])
-
-                list_item = []
-                list_item.append(obj)
-                obj_path = os.path.join(self.datadir, obj)
-                # XXX aww brother this is gonna hurt... a lot (file read * N)
-                # We're taking it in the pants even worse than Gluster, because
-                # they just fetch the xattr and we must find the .meta file.
-                metadata = load_meta_file(obj_path)
-                if metadata:
-                    list_item.append(metadata[X_TIMESTAMP])
-                    list_item.append(int(metadata[X_CONTENT_LENGTH]))
-                    list_item.append(metadata[X_CONTENT_TYPE])
-                    list_item.append(metadata[X_ETAG])
-                results.append(list_item)
-
-                count += 1
-        return results
+                yield (obj,) + summaries[obj]
+
+    def get_objects_metadata(self, names):
+        """
+        Get the listing metadata of a page of objects in one call.
+
+        The summary is served from the container's name index; only objects
+        that it does not know yet (a rebuilt or pre-existing index) have their
+        .meta file read, and the index is filled in with the result.
+
+        :param names: list of object names in this container
+        :returns: dict mapping object name to a (created_at, size,
+                  content_type, etag) tuple; deleted objects and objects
+                  without metadata are left out
+        """
+        assert self._type == 1
+        index = self._name_index(self.datadir, scan_object_names)
+        summaries = index.get_metadata(names)
+        found = []
+        for obj in names:
+            if obj in summaries:
+                continue
+            metadata = load_meta_file(object_path(self.datadir, obj))
+            if not metadata or 'deleted' in metadata:
+                continue
+            summaries[obj] = listing_summary(metadata)
+            found.append((obj,) + summaries[obj])
+        index.set_metadata(found)
+        return summaries
 
     def update_metadata(self, metadata):
         if self._type != 0:
@@ -356,6 +699,13 @@ class LFSPluginPosix():
             except OSError:
                 pass
 
+    def writer(self, size=None):
+        """
+        Contextmanager yielding an LFSWriter for a temporary file, which is
+        preallocated to size bytes if given.
+        """
+        return lfs_writer(self.mkstemp, self.put, size)
+
     # In our case we don't actually use fd for anything.
     # We do not have the "extension" parameter for LFS to allow for meta file.
     def put(self, fd, metadata):
@@ -369,8 +719,8 @@ class LFSPluginPosix():
         """
         assert self.tmppath is not None
         assert self._type == 0
-        # wait, what?
-        #metadata['name'] = self.name
+        # Hashed paths do not give the name back, see scan_object_names().
+        metadata['name'] = self.obj
         timestamp = normalize_timestamp(metadata['X-Timestamp'])
         base_path = os.path.join(self.datadir, timestamp)
         # P3
@@ -385,6 +735,25 @@ class LFSPluginPosix():
         renamer(self.tmppath, base_path + ".data")
         # but not setting self.data_file here, is this right?
         self.metadata = metadata
+        self._name_index(self.container_path,
+                         scan_object_names).add(self.obj,
+                                                *listing_summary(metadata))
+
+    def copy(self, source, metadata):
+        """
+        Make this object a copy of another one, with new metadata. Data
+        files are never changed once in place, so where the filesystem
+        allows it the copy is a hard link to the data file of the source.
+
+        :param source: plugin broker of the source object
+        :param metadata: dictionary of metadata of the copy
+        :returns: how the data was copied, see lfs_copy.copy_file()
+        """
+        assert self._type == 0
+        with self.mkstemp() as fd:
+            how = copy_file(source.data_file, self.tmppath, fd, link=True)
+            self.put(fd, metadata)
+        return how
 
     def put_metadata(self, metadata):
         assert self._type == 0
@@ -394,9 +763,13 @@ class LFSPluginPosix():
         fp = open("/tmp/dump","a")
         print >>fp, "posix put_meta", self.meta_file
         fp.close()
+        metadata['name'] = self.obj
         write_meta_file(self.meta_file, metadata)
         # XXX os.fsync maybe?
         self.metadata = metadata
+        self._name_index(self.container_path,
+                         scan_object_names).add(self.obj,
+                                                *listing_summary(metadata))
 
     def _handle_close_quarantine(self):
         """Check if file needs to be quarantined"""
@@ -445,6 +818,63 @@ class LFSPluginPosix():
         #        self.close()
             pass
 
+    def app_iter_range(self, start, stop):
+        """Returns an iterator over the data file for range (start, stop)"""
+        if start or start == 0:
+            self.fp.seek(start)
+        if stop is not None:
+            length = stop - start
+        else:
+            length = None
+        for chunk in self:
+            if length is not None:
+                length -= len(chunk)
+                if length < 0:
+                    # Chop off the extra:
+                    yield chunk[:length]
+                    break
+            yield chunk
+
+    def app_iter_ranges(self, ranges, content_type, boundary, size):
+        """Returns an iterator over the data file for a set of ranges"""
+        if not ranges:
+            yield ''
+        else:
+            try:
+                for chunk in multi_range_iterator(
+                        ranges, content_type, boundary, size,
+                        self.app_iter_range):
+                    yield chunk
+            finally:
+                self.close()
+
+    def iter_file(self, file_wrapper=None):
+        """
+        Returns an iterator over the whole data file that does not hash it,
+        so the file is not checked against its ETag when it is closed.
+
+        :param file_wrapper: the wsgi.file_wrapper of the server, if any;
+                             servers that have one can send the file with
+                             sendfile() instead of copying it through Python
+        """
+        self.iter_etag = None
+        self.fp.seek(0)
+        if file_wrapper:
+            fp, self.fp = self.fp, None
+            return file_wrapper(fp, self.disk_chunk_size)
+        return self._iter_file()
+
+    def _iter_file(self):
+        try:
+            while True:
+                chunk = self.fp.read(self.disk_chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.fp.close()
+            self.fp = None
+
     def close(self, verify_file=True):
         """
         Close the file. Will handle quarantining file if necessary.
@@ -483,11 +913,80 @@ class LFSPluginPosix():
         # XXX Scan the datadir and actually delete all old versions per docstr
         do_unlink(self.data_file)
         do_unlink(self.meta_file)
+        if not [f for f in os.listdir(self.datadir) if f.endswith('.data')]:
+            self._name_index(self.container_path,
+                             scan_object_names).remove(self.obj)
 
         self.metadata = {}
         self.data_file = None
         self.meta_file = None
 
+    def _tombstone(self, timestamp):
+        """
+        Leave a <timestamp>.ts file in the object directory and remove the
+        files older than it.
+
+        :returns: False if the object is newer than timestamp
+        """
+        timestamp = normalize_timestamp(timestamp)
+        if self.metadata.get('X-Timestamp', '') >= timestamp:
+            return False
+        open(os.path.join(self.datadir, timestamp + '.ts'), 'w').close()
+        for name in os.listdir(self.datadir):
+            if name < timestamp and \
+                    name.endswith(('.data', '.meta', '.ts')):
+                do_unlink(os.path.join(self.datadir, name))
+        self.metadata = {'deleted': True}
+        self.data_file = None
+        self.meta_file = None
+        return True
+
+    def delete(self, timestamp):
+        """
+        Delete the object, leaving a tombstone, or the container, which
+        the caller has found empty, with all of its directory tree.
+
+        :param timestamp: timestamp of the deletion
+        """
+        if self._type == 0:
+            if self._tombstone(timestamp):
+                self._name_index(self.container_path,
+                                 scan_object_names).remove(self.obj)
+        elif self._type == 1:
+            # Out of sight first, so that the container is gone at once
+            # however long the tree takes to remove.
+            trash = os.path.join(self.tmpdir, 'deleted-' + uuid4().hex)
+            mkdirs(self.tmpdir)
+            os.rename(self.datadir, trash)
+            self._name_index(self.account_path,
+                             scan_container_names).remove(self.container)
+            shutil.rmtree(trash, ignore_errors=True)
+            self.metadata = {}
+
+    def delete_objects(self, names, timestamp):
+        """
+        Delete many objects of this container in one call, leaving
+        tombstones, with a single update of the name index.
+
+        :param names: list of object names in this container
+        :param timestamp: timestamp of the deletion
+        :returns: dict mapping each name to the metadata of the object that
+                  was deleted, or None if there was no such object
+        """
+        assert self._type == 1
+        results = {}
+        for name in names:
+            obj = LFSPluginPosix(self.app, self.account, self.container,
+                                 name, False)
+            metadata = obj.metadata
+            if obj.exists() and obj._tombstone(timestamp):
+                results[name] = metadata
+            else:
+                results[name] = None
+        self._name_index(self.datadir, scan_object_names).remove_many(
+            [name for name, metadata in results.iteritems() if metadata])
+        return results
+
     def get_data_file_size(self):
         """
         Returns the os.path.getsize for the file.  Raises an exception if this
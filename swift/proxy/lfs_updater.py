@@ -0,0 +1,227 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Asynchronous container and account stats for LFS, the counterpart of the
+async_pending updates that the object server leaves for the object updater.
+Object writes record their change of object count and bytes in memory,
+where the changes to one container add up, and in a small journal. Every
+flush interval the sums are handed to the plugin's update_stats() of each
+container and account, so the cost of the accounting does not depend on
+the number of writes.
+
+The journal of an updater is <lfs_root>/.async_pending/<host>-<pid>-<id>,
+with a JSON line per record, and is held under an flock while the updater
+lives. An updater that finds the journal of a dead one replays it.
+"""
+
+import errno
+import fcntl
+import os
+import socket
+
+from eventlet import sleep, spawn
+
+from swift.common.utils import json, mkdirs
+
+ASYNC_PENDING_DIR = '.async_pending'
+
+
+class LFSStatsUpdater(object):
+    """
+    Coalesces object count and bytes used changes per container and
+    applies them in batches.
+
+    :param app: the proxy Application, for its LFS settings
+    :param plugin_class: the LFS plugin class
+    :param interval: seconds between flushes
+    """
+
+    def __init__(self, app, plugin_class, interval):
+        self.app = app
+        self.plugin_class = plugin_class
+        self.interval = interval
+        self.logger = app.logger
+        self.journal_dir = os.path.join(app.lfs_root or '', ASYNC_PENDING_DIR)
+        self.pending = {}
+        self.journal_fd = None
+        self.journal_path = None
+        self.flusher = None
+
+    def _open_journal(self):
+        # Done on first use, so that each forked worker gets its own.
+        mkdirs(self.journal_dir)
+        self.journal_path = os.path.join(
+            self.journal_dir, '%s-%d-%x' % (socket.gethostname(), os.getpid(),
+                                            id(self)))
+        self.journal_fd = os.open(self.journal_path,
+                                  os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        fcntl.flock(self.journal_fd, fcntl.LOCK_EX)
+        self.replay()
+        self._write_journal()
+        if self.interval > 0:
+            self.flusher = spawn(self._run)
+
+    def _add(self, account, container, object_delta, bytes_delta):
+        deltas = self.pending.setdefault((account, container), [0, 0])
+        deltas[0] += object_delta
+        deltas[1] += bytes_delta
+
+    def record(self, account, container, object_delta, bytes_delta):
+        """
+        Record a change of the object count and bytes used of a container.
+
+        :param account: account name
+        :param container: container name
+        :param object_delta: change in the number of objects
+        :param bytes_delta: change in the number of bytes
+        """
+        if not object_delta and not bytes_delta:
+            return
+        if self.journal_fd is None:
+            self._open_journal()
+        self._add(account, container, object_delta, bytes_delta)
+        os.write(self.journal_fd, json.dumps(
+            [account, container, object_delta, bytes_delta]) + '\n')
+
+    def _read_journal(self, path):
+        with open(path) as fp:
+            for line in fp:
+                try:
+                    account, container, object_delta, bytes_delta = \
+                        json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash.
+                    continue
+                if container is not None:
+                    container = container.encode('utf-8')
+                self._add(account.encode('utf-8'), container,
+                          object_delta, bytes_delta)
+
+    def replay(self):
+        """
+        Take over the journals of processes that are gone.
+
+        :returns: number of journals replayed
+        """
+        replayed = 0
+        for name in os.listdir(self.journal_dir):
+            path = os.path.join(self.journal_dir, name)
+            if path == self.journal_path or name.startswith('.'):
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as err:
+                    if err.errno != errno.EAGAIN:
+                        raise
+                    # Its process is alive.
+                    continue
+                if os.fstat(fd).st_nlink == 0:
+                    # Somebody else replayed it while we waited.
+                    continue
+                self._read_journal(path)
+                os.unlink(path)
+                replayed += 1
+            finally:
+                os.close(fd)
+        return replayed
+
+    def _write_journal(self):
+        # Replace the journal with what is still pending. Nothing here
+        # yields, so no record() can slip in between.
+        tmp_path = os.path.join(self.journal_dir,
+                                '.' + os.path.basename(self.journal_path))
+        with open(tmp_path, 'w') as fp:
+            for (account, container), (object_delta, bytes_delta) in \
+                    self.pending.iteritems():
+                fp.write(json.dumps([account, container, object_delta,
+                                     bytes_delta]) + '\n')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_APPEND)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(tmp_path, self.journal_path)
+        os.close(self.journal_fd)
+        self.journal_fd = fd
+
+    def flush(self):
+        """
+        Apply the pending changes to the containers, then the sums of them
+        to the accounts. A change that fails to apply stays pending, and in
+        the journal, for the next flush; one of an account alone is kept
+        under the container None.
+
+        :returns: number of containers updated
+        """
+        # Imported here: the controllers import this module.
+        from swift.proxy.controllers.lfs import get_pbroker
+        if self.journal_fd is None:
+            self._open_journal()
+        pending, self.pending = self.pending, {}
+        accounts = {}
+        updated = 0
+        for (account, container), deltas in pending.iteritems():
+            if not deltas[0] and not deltas[1]:
+                continue
+            if container is not None:
+                try:
+                    pbroker = get_pbroker(self.app, self.plugin_class,
+                                          account, container, None, False)
+                    if pbroker.exists():
+                        pbroker.update_stats(*deltas)
+                        updated += 1
+                except Exception:
+                    self.logger.exception(
+                        _('ERROR updating stats of container '
+                          '%(acc)s/%(cont)s'),
+                        {'acc': account, 'cont': container})
+                    # Its account is updated along with it next time.
+                    self._add(account, container, *deltas)
+                    continue
+            account_deltas = accounts.setdefault(account, [0, 0])
+            account_deltas[0] += deltas[0]
+            account_deltas[1] += deltas[1]
+        for account, deltas in accounts.iteritems():
+            try:
+                pbroker = get_pbroker(self.app, self.plugin_class, account,
+                                      None, None, False)
+                if pbroker.exists():
+                    pbroker.update_stats(*deltas)
+            except Exception:
+                self.logger.exception(
+                    _('ERROR updating stats of account %s'), account)
+                self._add(account, None, *deltas)
+        self._write_journal()
+        self.logger.update_stats('lfs.stats_updater.containers', updated)
+        return updated
+
+    def _run(self):
+        while True:
+            sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception(_('ERROR flushing LFS stats'))
+
+    def stop(self):
+        """Stop the periodic flushes."""
+        if self.flusher is not None:
+            self.flusher.kill()
+            self.flusher = None
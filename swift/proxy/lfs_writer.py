@@ -0,0 +1,95 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Write side of the LFS plugin contract. A plugin's writer(size) returns a
+context manager that yields an LFSWriter for a fresh temporary file; the
+proxy feeds it chunks and then puts it with the object metadata. Writers
+are plain blocking code: the proxy decides which thread runs them.
+"""
+
+import os
+from contextlib import contextmanager
+
+from swift.common.exceptions import DiskFileNoSpace
+from swift.common.utils import drop_buffer_cache, fallocate, fdatasync
+
+
+class LFSWriter(object):
+    """
+    Encapsulation of the write context of one object PUT, in the manner of
+    DiskWriter.
+
+    :param fd: file descriptor of the temporary file
+    :param finalize: callable(fd, metadata) that moves the file into place,
+                     usually the plugin's put()
+    """
+
+    def __init__(self, fd, finalize):
+        self.fd = fd
+        self.finalize = finalize
+        self.upload_size = 0
+        self.last_sync = 0
+
+    def write(self, chunk):
+        """
+        Write a chunk of data into the temporary file.
+
+        :param chunk: the chunk of data to write as a string object
+        """
+        while chunk:
+            written = os.write(self.fd, chunk)
+            self.upload_size += written
+            chunk = chunk[written:]
+
+    def sync(self):
+        """
+        Flush the data written since the last sync to disk and drop it from
+        the page cache.
+        """
+        diff = self.upload_size - self.last_sync
+        if diff:
+            fdatasync(self.fd)
+            drop_buffer_cache(self.fd, self.last_sync, diff)
+            self.last_sync = self.upload_size
+
+    def put(self, metadata):
+        """
+        Finalize writing the file on disk.
+
+        :param metadata: dictionary of metadata to be written
+        """
+        return self.finalize(self.fd, metadata)
+
+
+@contextmanager
+def lfs_writer(mkstemp, finalize, size=None):
+    """
+    Build a plugin's writer() out of its mkstemp() and put().
+
+    :param mkstemp: context manager factory yielding a temporary file
+                    descriptor
+    :param finalize: callable(fd, metadata) that moves the file into place
+    :param size: optional initial size of file to explicitly allocate on
+                 disk, normally the Content-Length of the PUT
+    :raises DiskFileNoSpace: if a size is specified and allocation fails
+    """
+    with mkstemp() as fd:
+        if size is not None and size > 0:
+            try:
+                fallocate(fd, size)
+            except OSError:
+                raise DiskFileNoSpace()
+        yield LFSWriter(fd, finalize)
@@ -40,7 +40,13 @@ from swift.common.constraints import check_utf8
 from swift.proxy.controllers import AccountController, ObjectController, \
     ContainerController
 from swift.proxy.controllers.lfs import LFSAccountController, \
-    LFSContainerController, LFSObjectController
+    LFSContainerController, LFSObjectController, LFSPluginRegistry, \
+    LFSThreadPools
+from swift.proxy.info_cache import InfoCache
+from swift.proxy.lfs_cache import LFSInfoCache
+from swift.proxy.lfs_checksum import get_checksum_engine
+from swift.proxy.lfs_expirer import LFSExpiryIndex
+from swift.proxy.lfs_updater import LFSStatsUpdater
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, Request
@@ -76,6 +82,9 @@ class Application(object):
             int(conf.get('recheck_container_existence', 60))
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence', 60))
+        self.info_cache = InfoCache(
+            float(conf.get('info_cache_ttl', 0)),
+            int(conf.get('info_cache_max_entries', 10000)))
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
         self.object_post_as_copy = \
@@ -135,6 +144,43 @@ class Application(object):
         self.lfs_mode = conf.get('lfs_mode', 'swift')
         # Not defaulting to /var/lib/swift for a better bug detection.
         self.lfs_root = conf.get('lfs_root', None)
+        # Resolve the plugin up front so that a bad lfs_mode fails at
+        # startup and requests never hit the entry point scan.
+        self.lfs_plugins = LFSPluginRegistry()
+        if self.lfs_mode and self.lfs_mode != 'swift':
+            self.lfs_plugins.load(self.lfs_mode)
+        self.lfs_expiry = LFSExpiryIndex(
+            self.lfs_root or '', self.expiring_objects_container_divisor)
+        # The queue depths of the pools are sent as statsd gauges this often.
+        self.lfs_threadpools = LFSThreadPools(
+            int(conf.get('lfs_threads_per_mount', '0')), self.logger,
+            float(conf.get('lfs_threadpool_report_interval', '10')))
+        # Container and account stats are brought up to date this often.
+        self.lfs_stats = None
+        if self.lfs_mode and self.lfs_mode != 'swift' and \
+                self.lfs_plugins.has(self.lfs_mode, 'stats_update'):
+            self.lfs_stats = LFSStatsUpdater(
+                self, self.lfs_plugins.get(self.lfs_mode),
+                float(conf.get('lfs_stats_interval', '5')))
+        # Fraction of whole-object LFS GETs that are hashed on the way out
+        # and quarantined on an ETag mismatch.
+        self.lfs_etag_verify_rate = float(
+            conf.get('lfs_etag_verify_rate', '0'))
+        # Segments of an LFS large object opened ahead of the one being sent.
+        self.lfs_segment_readahead = int(
+            conf.get('lfs_segment_readahead', '1'))
+        # Object layout of the containers that the POSIX plugin creates,
+        # 'flat' or 'hashed'; see swift-lfs-posix-migrate for existing ones.
+        self.lfs_posix_layout = conf.get('lfs_posix_layout', 'flat')
+        # Container lookups of LFS object requests are cached this long,
+        # optionally shared by the workers through memcache. Off by default,
+        # like info_cache_ttl: other workers' changes take this long to show.
+        self.lfs_cache = LFSInfoCache(float(conf.get('lfs_cache_ttl', '0')))
+        self.lfs_cache_memcache = config_true_value(
+            conf.get('lfs_cache_memcache', 'false'))
+        # Extra integrity checksum computed along with the ETag of LFS PUTs.
+        self.lfs_checksum = get_checksum_engine(
+            conf.get('lfs_checksum', ''), self.logger)
         try:
             read_affinity = conf.get('read_affinity', '')
             self.read_affinity_sort_key = affinity_key_function(read_affinity)
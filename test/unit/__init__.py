@@ -220,6 +220,7 @@ class FakeLogger(object):
     timing = _store_in('timing')
     timing_since = _store_in('timing_since')
     update_stats = _store_in('update_stats')
+    gauge = _store_in('gauge')
     set_statsd_prefix = _store_in('set_statsd_prefix')
 
     def get_increments(self):
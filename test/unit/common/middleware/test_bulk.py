@@ -48,7 +48,19 @@ class FakeApp(object):
             if len(env['PATH_INFO']) > self.max_pathlen:
                 return Response(status='400 Bad Request')(env, start_response)
             return Response(status='201 Created')(env, start_response)
-        if env['PATH_INFO'].startswith('/delete_works/'):
+        if env['PATH_INFO'].startswith('/delete_batch/') and \
+                env['REQUEST_METHOD'] == 'BULK_DELETE':
+            self.delete_paths.append('BULK_DELETE ' + env['PATH_INFO'])
+            names = json.loads(env['wsgi.input'].read())
+            return Response(body=json.dumps(dict(
+                (name, '404 Not Found' if name.endswith('404')
+                 else '204 No Content') for name in names)))(
+                     env, start_response)
+        if env['PATH_INFO'].startswith('/delete_works/') and \
+                env['REQUEST_METHOD'] == 'BULK_DELETE':
+            return Response(status='405 Method Not Allowed')(env,
+                                                             start_response)
+        if env['PATH_INFO'].startswith(('/delete_works/', '/delete_batch/')):
             self.delete_paths.append(env['PATH_INFO'])
             if len(env['PATH_INFO']) > self.max_pathlen:
                 return Response(status='400 Bad Request')(env, start_response)
@@ -497,6 +509,39 @@ class TestDelete(unittest.TestCase):
         self.assertEquals(resp_data['Number Deleted'], 1)
         self.assertEquals(resp_data['Number Not Found'], 1)
 
+    def test_bulk_delete_batches(self):
+        req = Request.blank('/delete_batch/AUTH_Acc',
+                            body='/c/f\n/c/f404\n/c/g\n/c2/f\n/c\n/c/h',
+                            headers={'Accept': 'application/json'})
+        req.method = 'DELETE'
+        self.bulk.delete_batch_size = 2
+        resp_body = self.handle_delete_and_iter(req)
+        self.assertEquals(
+            self.app.delete_paths,
+            ['BULK_DELETE /delete_batch/AUTH_Acc/c',
+             'BULK_DELETE /delete_batch/AUTH_Acc/c',
+             'BULK_DELETE /delete_batch/AUTH_Acc/c2',
+             '/delete_batch/AUTH_Acc/c',
+             'BULK_DELETE /delete_batch/AUTH_Acc/c'])
+        resp_data = json.loads(resp_body)
+        self.assertEquals(resp_data['Number Deleted'], 5)
+        self.assertEquals(resp_data['Number Not Found'], 1)
+
+    def test_bulk_delete_batches_not_supported(self):
+        req = Request.blank('/delete_works/AUTH_Acc', body='/c/f\n/c/f404',
+                            headers={'Accept': 'application/json'})
+        req.method = 'DELETE'
+        self.bulk.delete_batch_size = 10
+        resp_body = self.handle_delete_and_iter(req)
+        self.assertEquals(
+            self.app.delete_paths,
+            ['/delete_works/AUTH_Acc/c/f', '/delete_works/AUTH_Acc/c/f404'])
+        self.assertEquals(self.app.calls, 3)
+        self.assertEquals(self.bulk.delete_batch_size, 0)
+        resp_data = json.loads(resp_body)
+        self.assertEquals(resp_data['Number Deleted'], 1)
+        self.assertEquals(resp_data['Number Not Found'], 1)
+
     def test_bulk_delete_bad_content_type(self):
         req = Request.blank('/delete_works/AUTH_Acc',
                             headers={'Accept': 'badformat'})
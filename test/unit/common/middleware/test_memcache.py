@@ -49,6 +49,8 @@ class SetConfigParser(object):
                 return '1.2.3.4:5'
             elif option == 'memcache_serialization_support':
                 return '1'
+            elif option == 'memcache_max_connections':
+                return '4'
             else:
                 raise NoOptionError(option)
         else:
@@ -106,6 +108,7 @@ class TestCacheMiddleware(unittest.TestCase):
         self.assertEquals(app.memcache_servers, '127.0.0.1:11211')
         self.assertEquals(app.memcache._allow_pickle, False)
         self.assertEquals(app.memcache._allow_unpickle, False)
+        self.assertEquals(app.memcache._max_conns, 20)
 
     def test_conf_from_extra_conf(self):
         orig_parser = memcache.ConfigParser
@@ -117,6 +120,7 @@ class TestCacheMiddleware(unittest.TestCase):
         self.assertEquals(app.memcache_servers, '1.2.3.4:5')
         self.assertEquals(app.memcache._allow_pickle, False)
         self.assertEquals(app.memcache._allow_unpickle, True)
+        self.assertEquals(app.memcache._max_conns, 4)
 
     def test_conf_from_inline_conf(self):
         orig_parser = memcache.ConfigParser
@@ -125,12 +129,14 @@ class TestCacheMiddleware(unittest.TestCase):
             app = memcache.MemcacheMiddleware(
                     FakeApp(),
                     {'memcache_servers': '6.7.8.9:10',
-                     'serialization_format': '0'})
+                     'serialization_format': '0',
+                     'memcache_max_connections': '5'})
         finally:
             memcache.ConfigParser = orig_parser
         self.assertEquals(app.memcache_servers, '6.7.8.9:10')
         self.assertEquals(app.memcache._allow_pickle, False)
         self.assertEquals(app.memcache._allow_unpickle, True)
+        self.assertEquals(app.memcache._max_conns, 5)
 
 
 if __name__ == '__main__':
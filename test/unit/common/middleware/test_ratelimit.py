@@ -217,6 +217,25 @@ class TestRateLimit(unittest.TestCase):
         tuples = the_app.get_ratelimitable_key_tuples('PUT', 'a', 'c', 'o')
         self.assertEquals(tuples, [('ratelimit/a/c', 200.0)])
 
+    def test_container_info_shared_in_env(self):
+        conf_dict = {'container_ratelimit_3': 200}
+        fake_memcache = FakeMemcache()
+        fake_memcache.store[get_container_memcache_key('a', 'c')] = \
+            {'object_count': '5'}
+        the_app = ratelimit.RateLimitMiddleware(None, conf_dict,
+                                                logger=FakeLogger())
+        the_app.memcache_client = fake_memcache
+        env = {}
+        tuples = the_app.get_ratelimitable_key_tuples('PUT', 'a', 'c', 'o',
+                                                      env=env)
+        self.assertEquals(tuples, [('ratelimit/a/c', 200.0)])
+        self.assertEquals(env, {'swift.container/a/c': {'object_count': '5'}})
+        # The proxy, and a second look, find it there.
+        del fake_memcache.store[get_container_memcache_key('a', 'c')]
+        tuples = the_app.get_ratelimitable_key_tuples('PUT', 'a', 'c', 'o',
+                                                      env=env)
+        self.assertEquals(tuples, [('ratelimit/a/c', 200.0)])
+
     def test_account_ratelimit(self):
         current_rate = 5
         num_calls = 50
@@ -362,6 +381,7 @@ class TestRateLimit(unittest.TestCase):
         the_app.memcache_client = fake_memcache
         req = lambda: None
         req.method = 'PUT'
+        req.environ = {}
 
         class rate_caller(Thread):
 
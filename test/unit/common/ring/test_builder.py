@@ -18,6 +18,7 @@ import operator
 import os
 import unittest
 import cPickle as pickle
+from array import array
 from collections import defaultdict
 from shutil import rmtree
 
@@ -530,6 +531,47 @@ class TestRingBuilder(unittest.TestCase):
                     "Partition %d not in zones 0 and 1 (got %r)" %
                     (part, zones))
 
+    def test_rebalance_rechecks_parts(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        for dev_id in xrange(4):
+            rb.add_dev({'id': dev_id, 'region': 0, 'zone': dev_id,
+                        'weight': 1, 'ip': '127.0.0.1',
+                        'port': 10000 + dev_id, 'device': 'sda1'})
+        rb.rebalance()
+        self.assertEquals([phase for phase, seconds in rb.rebalance_timings],
+                          ['reassign'])
+        # Every partition is checked the first time round.
+        self.assertEquals(rb._parts_to_recheck, None)
+
+        rb.add_dev({'id': 4, 'region': 0, 'zone': 1, 'weight': 1,
+                    'ip': '127.0.0.1', 'port': 10001, 'device': 'sdb1'})
+        rb.pretend_min_part_hours_passed()
+        rb.rebalance()
+        rb.validate()
+        self.assertEquals([phase for phase, seconds in rb.rebalance_timings],
+                          ['update', 'adjust', 'reassign', 'gather'])
+        self.assertTrue(
+            rb._can_recheck_parts(rb._build_max_replicas_by_tier()))
+
+        # Only the partitions to recheck are looked at for being spread out.
+        dev_id = rb._replica2part2dev[0][0]
+        rb.devs[rb._replica2part2dev[1][0]]['parts'] -= 1
+        rb.devs[dev_id]['parts'] += 1
+        rb._replica2part2dev[1][0] = dev_id
+        rb.pretend_min_part_hours_passed()
+        rb._parts_to_recheck = array('I', [1, 2])
+        self.assertFalse(0 in dict(rb._gather_reassign_parts()))
+        rb._parts_to_recheck = array('I', [0, 1, 2])
+        self.assertTrue(0 in dict(rb._gather_reassign_parts()))
+
+        max_replicas = rb._build_max_replicas_by_tier()
+        rb.devs[1]['port'] = 10005
+        self.assertFalse(rb._can_recheck_parts(max_replicas))
+        rb.devs[1]['port'] = 10001
+        rb.set_replicas(2)
+        self.assertFalse(
+            rb._can_recheck_parts(rb._build_max_replicas_by_tier()))
+
     def test_rerebalance(self):
         rb = ring.RingBuilder(8, 3, 1)
         rb.add_dev({'id': 0, 'region': 0, 'zone': 0, 'weight': 1,
@@ -688,6 +730,17 @@ class TestRingBuilder(unittest.TestCase):
             fake_pickle.reset_mock()
             fake_open.reset_mock()
 
+            #test old style builder without partitions to recheck
+            builder_dict = rb.to_dict()
+            del builder_dict['_last_max_replicas_by_tier']
+            del builder_dict['_parts_to_recheck']
+            fake_pickle.return_value = builder_dict
+            builder = ring.RingBuilder.load('fake.builder', open=fake_open)
+            self.assertEquals(builder._last_max_replicas_by_tier, None)
+            self.assertEquals(builder._parts_to_recheck, None)
+            fake_pickle.reset_mock()
+            fake_open.reset_mock()
+
             #test old devs but no meta
             no_meta_builder = rb
             for dev in no_meta_builder.devs:
@@ -15,6 +15,7 @@
 
 import array
 import cPickle as pickle
+import mock
 import os
 import sys
 import unittest
@@ -71,6 +72,46 @@ class TestRingData(unittest.TestCase):
         rd2 = ring.RingData.load(ring_fname)
         self.assert_ring_data_equal(rd, rd2)
 
+    def test_roundtrip_serialization_v2(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1, 0]), array.array('H', [1, 0, 1])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}], 30)
+        rd.save(ring_fname, format_version=2)
+        self.assertEquals(ring.RingData.get_format_version(ring_fname), 2)
+        with open(ring_fname) as f:
+            self.assertEquals(f.read(6), 'R1NG\x00\x02')
+        self.assertEquals(os.listdir(self.testdir), ['foo.ring.gz'])
+        rd2 = ring.RingData.load(ring_fname)
+        self.assert_ring_data_equal(rd, rd2)
+
+        rd3 = ring.RingData.load(ring_fname, use_mmap=True)
+        self.assertEquals([list(p2d) for p2d in rd3._replica2part2dev_id],
+                          [[0, 1, 0, 1, 0], [1, 0, 1]])
+        self.assertEquals(rd3.devs, rd.devs)
+        # The mapping is not disturbed by a new ring, and can be saved.
+        rd4 = ring.RingData([array.array('H', [1, 1, 0, 0])], rd.devs, 30)
+        rd4.save(ring_fname, format_version=2)
+        self.assertEquals(list(rd3._replica2part2dev_id[0]), [0, 1, 0, 1, 0])
+        ring.RingData.load(ring_fname, use_mmap=True).save(ring_fname)
+        self.assertEquals(ring.RingData.get_format_version(ring_fname), 1)
+        self.assert_ring_data_equal(rd4, ring.RingData.load(ring_fname))
+
+        self.assertRaises(ValueError, rd.save, ring_fname, 3)
+
+    def test_load_v2_other_byteorder(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData([array.array('H', [0, 1, 2, 258])],
+                           [{'id': 0, 'zone': 0}], 30)
+        other = 'big' if sys.byteorder == 'little' else 'little'
+        swapped = array.array('H', [0, 1, 2, 258])
+        swapped.byteswap()
+        with mock.patch('sys.byteorder', other):
+            ring.RingData([swapped], rd.devs, 30).save(ring_fname, 2)
+        for use_mmap in (False, True):
+            self.assert_ring_data_equal(
+                rd, ring.RingData.load(ring_fname, use_mmap=use_mmap))
+
     def test_deterministic_serialization(self):
         """
         Two identical rings should produce identical .gz files on disk.
@@ -211,6 +252,31 @@ class TestRing(unittest.TestCase):
         self.assertEquals(len(self.ring.devs), 9)
         self.assertNotEquals(self.ring._mtime, orig_mtime)
 
+    def test_reload_v2(self):
+        ring.RingData(self.intended_replica2part2dev_id,
+                      self.intended_devs,
+                      self.intended_part_shift).save(self.testgz, 2)
+        self.ring = ring.Ring(self.testdir, reload_time=0.001,
+                              ring_name='whatever')
+        self.assertEquals(
+            [list(p2d) for p2d in self.ring._replica2part2dev_id],
+            [list(p2d) for p2d in self.intended_replica2part2dev_id])
+        self.assertEquals(self.ring.get_nodes('a4'),
+                          (1, [self.intended_devs[1],
+                               self.intended_devs[4]]))
+        self.assertEquals(len(list(self.ring.get_more_nodes(1))), 2)
+
+        self.intended_devs.append({'id': 5, 'region': 0, 'zone': 5,
+                                   'weight': 1.0, 'ip': '10.5.5.5',
+                                   'port': 9876})
+        replica2part2dev_id = [array.array('H', [5, 5, 5, 5])] * 3
+        ring.RingData(replica2part2dev_id, self.intended_devs,
+                      self.intended_part_shift).save(self.testgz, 2)
+        os.utime(self.testgz, (time() + 60, time() + 60))
+        sleep(0.002)
+        self.assertEquals(self.ring.get_part_nodes(0)[0]['id'], 5)
+        self.assertEquals(len(self.ring.devs), 6)
+
     def test_reload_without_replication(self):
         replication_less_devs = [{'id': 0, 'region': 0, 'zone': 0,
                                   'weight': 1.0, 'ip': '10.1.1.1',
@@ -329,6 +395,42 @@ class TestRing(unittest.TestCase):
         self.ring.devs.append(new_dev)
         self.ring._rebuild_tier_data()
 
+    def test_get_nodes_batch(self):
+        paths = [('a',), ('a4',), ('a', 'c1'), ('a', 'c0', 'o1'), ('a',)]
+        results = self.ring.get_nodes_batch(iter(paths))
+        self.assertEquals(results,
+                          [self.ring.get_nodes(*path) for path in paths])
+        # The lists of nodes are not shared.
+        results[0][1].pop()
+        self.assertEquals(len(results[4][1]), 2)
+        self.assertEquals(self.ring.get_nodes_batch([]), [])
+        self.assertRaises(ValueError, self.ring.get_nodes_batch,
+                          [('a', None, 'o')])
+
+    def test_get_more_nodes_cached(self):
+        uncached = ring.Ring(self.testdir, ring_name='whatever',
+                             handoff_cache_size=0)
+        self.ring = ring.Ring(self.testdir, ring_name='whatever',
+                              handoff_cache_size=2)
+        expected = list(uncached.get_more_nodes(1))
+        # A partial walk is picked up where it was left.
+        handoffs = self.ring.get_more_nodes(1)
+        first = next(handoffs)
+        self.assertEquals(self.ring._handoffs.get(1).devs, [first])
+        self.assertEquals(list(self.ring.get_more_nodes(1)), expected)
+        self.assertEquals([first] + list(handoffs), expected)
+        self.assertEquals(self.ring._handoffs.get(1).devs, expected)
+        self.assertEquals(list(self.ring.get_more_nodes(0)),
+                          list(uncached.get_more_nodes(0)))
+        self.ring.get_more_nodes(2)
+        self.assertEquals(self.ring._handoffs.keys(), [0, 2])
+        self.assertEquals(len(uncached._handoffs), 0)
+        # A new ring starts over.
+        os.utime(self.testgz, (time() + 60, time() + 60))
+        self.ring._rtime = 0
+        self.assertEquals(list(self.ring.get_more_nodes(1)), expected)
+        self.assertEquals(self.ring._handoffs.keys(), [1])
+
     def test_get_more_nodes(self):
         # Yes, these tests are deliberately very fragile. We want to make sure
         # that if someone changes the results the ring produces, they know it.
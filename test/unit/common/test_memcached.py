@@ -24,6 +24,7 @@ import unittest
 from uuid import uuid4
 
 from swift.common import memcached
+from swift.common.memcached import md5hash
 from test.unit import NullLoggingHandler
 
 
@@ -308,6 +309,62 @@ class TestMemcached(unittest.TestCase):
             ('some_key2', 'some_key1', 'not_exists'), 'multi_key'),
             [[4, 5, 6], [1, 2, 3], None])
 
+    def test_multi_across_servers(self):
+        servers = ['1.2.3.4:11211', '1.2.3.5:11211']
+        memcache_client = memcached.MemcacheRing(servers)
+        mocks = {}
+        for server in servers:
+            mocks[server] = MockMemcached()
+            memcache_client._client_cache[server] = \
+                [(mocks[server], mocks[server])]
+        mapping = dict(('key%d' % i, i) for i in xrange(20))
+        memcache_client.set_multi(mapping)
+        # Every key went to its own server, as set() would have sent it.
+        for server in servers:
+            self.assert_(mocks[server].cache)
+        self.assertEquals(
+            sum(len(mock.cache) for mock in mocks.itervalues()), 20)
+        for key, value in mapping.iteritems():
+            self.assertEquals(memcache_client.get(key), value)
+        stats = memcache_client.get_stats()
+        requests = dict((server, stats[server]['requests'])
+                        for server in servers)
+
+        keys = sorted(mapping) + ['not_exists']
+        self.assertEquals(memcache_client.get_multi(keys),
+                          [mapping[key] for key in sorted(mapping)] + [None])
+        # One request per server for all the keys.
+        stats = memcache_client.get_stats()
+        for server in servers:
+            self.assertEquals(stats[server]['requests'],
+                              requests[server] + 1)
+            self.assertEquals(stats[server]['errors'], 0)
+            self.assert_(stats[server]['max_timing'] <=
+                         stats[server]['timing'])
+
+        # A server that is down leaves its keys to the next one.
+        mocks[servers[0]].down = True
+        values = memcache_client.get_multi(keys)
+        self.assertEquals(memcache_client.get_stats()[servers[0]]['errors'],
+                          1)
+        for key, value in zip(keys, values):
+            if md5hash(key) in mocks[servers[0]].cache:
+                self.assertEquals(value, None)
+            else:
+                self.assertEquals(value, mapping.get(key))
+
+    def test_max_conns(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
+                                                 max_conns=1)
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._return_conn('1.2.3.4:11211', mock1, mock1)
+        memcache_client._return_conn('1.2.3.4:11211', mock2, mock2)
+        self.assertEquals(memcache_client._client_cache['1.2.3.4:11211'],
+                          [(mock1, mock1)])
+        self.assertFalse(mock1.close_called)
+        self.assert_(mock2.close_called)
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True)
@@ -2005,6 +2005,7 @@ class TestStatsdLoggingDelegation(unittest.TestCase):
         self.assertEqual(None, logger.timing_since('foo', 8948, 0.57))
         self.assertEqual(None, logger.timing_since('foo', 849398,
                                                    sample_rate=0.61))
+        self.assertEqual(None, logger.gauge('foo', 88))
         # Now, the queue should be empty (no UDP packets sent)
         self.assertRaises(Empty, self.queue.get_nowait)
 
@@ -2024,6 +2025,8 @@ class TestStatsdLoggingDelegation(unittest.TestCase):
                                time.time())
         self.assertStat('some-name.another.counter:42|c',
                         self.logger.update_stats, 'another.counter', 42)
+        self.assertStat('some-name.some.level:7|g',
+                        self.logger.gauge, 'some.level', 7)
 
         # Each call can override the sample_rate (also, bonus prefix test)
         self.logger.set_statsd_prefix('pfx')
@@ -2232,6 +2235,60 @@ class TestStatsdLoggingDelegation(unittest.TestCase):
                 self.assertEquals(called, [12345])
 
 
+class TestLRUCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.keys(), ['a', 'c'])
+        cache.set('a', 4)
+        self.assertEquals(cache.keys(), ['c', 'a'])
+        self.assertEquals(cache.pop('c'), 3)
+        self.assertEquals(cache.pop('c'), None)
+        self.assertEquals(cache.keys(), ['a'])
+        cache.clear()
+        self.assertEquals(len(cache), 0)
+
+    def test_recency_stays_compact(self):
+        cache = utils.LRUCache(3)
+        for key in 'abc':
+            cache.set(key, key)
+        for i in xrange(100):
+            cache.get('a')
+            cache.get('b')
+        self.assert_(len(cache._order) <= 2 * len(cache) + 16)
+        cache.set('d', 'd')
+        self.assertEquals(cache.keys(), ['a', 'b', 'd'])
+
+    def test_expires(self):
+        cache = utils.LRUCache(10)
+        with patch('time.time', lambda: 100.0):
+            cache.set('a', 1, expires=105.0)
+            cache.set('b', 2)
+            self.assertEquals(cache.expires('a'), 105.0)
+            self.assertEquals(cache.expires('b'), None)
+        with patch('time.time', lambda: 105.0):
+            self.assertEquals(cache.get('a'), None)
+            self.assertEquals(cache.get('b'), 2)
+        self.assertEquals(len(cache), 1)
+
+    def test_max_size(self):
+        cache = utils.LRUCache(10, max_size=5)
+        cache.set('a', 'a', size=2)
+        cache.set('b', 'b', size=2)
+        self.assertFalse(cache.set('big', 'big', size=6))
+        self.assertEquals(cache.keys(), ['a', 'b'])
+        self.assert_(cache.set('c', 'c', size=3))
+        self.assertEquals(cache.keys(), ['b', 'c'])
+        self.assertEquals(cache.size, 5)
+        cache.pop('b')
+        self.assertEquals(cache.size, 3)
+
+
 class TestThreadpool(unittest.TestCase):
 
     def _thread_id(self):
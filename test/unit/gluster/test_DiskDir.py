@@ -0,0 +1,78 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Tests for gluster.swift.common.DiskDir """
+
+import os
+import threading
+import unittest
+import tempfile
+import shutil
+import gluster.swift.common.DiskDir as dd
+from gluster.swift.common import Glusterfs
+from gluster.swift.common.utils import X_TIMESTAMP, X_CONTENT_LENGTH, \
+    X_CONTENT_TYPE, X_ETAG, X_TYPE, X_OBJECT_TYPE, OBJECT, FILE
+from test_utils import _initxattr, _destroyxattr
+
+
+class TestDiskDir(unittest.TestCase):
+    """ Tests for gluster.swift.common.DiskDir """
+
+    def setUp(self):
+        _initxattr()
+        self.td = tempfile.mkdtemp()
+        self.dir = dd.DiskDir.__new__(dd.DiskDir)
+        self.dir.datadir = self.td
+        self.names = ['o%02d' % i for i in xrange(20)]
+        for name in self.names:
+            with open(os.path.join(self.td, name), 'w') as fp:
+                fp.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+        _destroyxattr()
+
+    def test_get_objects_metadata(self):
+        __read_metadata = dd.read_metadata
+        __threads = Glusterfs.METADATA_READ_THREADS
+        threads = set()
+
+        def _read_metadata(path):
+            threads.add(threading.current_thread().name)
+            return {X_TIMESTAMP: '1', X_CONTENT_LENGTH: '3',
+                    X_CONTENT_TYPE: 'text/plain',
+                    X_ETAG: os.path.basename(path), X_TYPE: OBJECT,
+                    X_OBJECT_TYPE: FILE}
+
+        dd.read_metadata = _read_metadata
+        try:
+            Glusterfs.METADATA_READ_THREADS = 4
+            summaries = self.dir.get_objects_metadata(self.names)
+            assert sorted(summaries) == self.names
+            assert summaries['o03'] == ('1', 3, 'text/plain', 'o03')
+            assert threading.current_thread().name not in threads
+
+            threads.clear()
+            Glusterfs.METADATA_READ_THREADS = 1
+            assert self.dir.get_objects_metadata(self.names) == summaries
+            assert threads == set([threading.current_thread().name])
+        finally:
+            dd.read_metadata = __read_metadata
+            Glusterfs.METADATA_READ_THREADS = __threads
+
+    def test_get_objects_metadata_created(self):
+        summaries = self.dir.get_objects_metadata(self.names[:3])
+        assert sorted(summaries) == self.names[:3]
+        assert summaries['o01'][1] == 3
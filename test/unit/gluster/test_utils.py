@@ -531,125 +531,104 @@ class TestUtils(unittest.TestCase):
         finally:
             utils._get_container_details_from_fs = orig_gcdff
 
+    def _make_container(self, td):
+        cont_path = os.path.join(td, 'drive', 'cont')
+        os.makedirs(cont_path)
+        with open(os.path.join(cont_path, 'foo'), 'w') as fp:
+            fp.write('12345')
+        return cont_path
+
     def test_container_details_cached_hit(self):
         mc = SimMemcache()
-        the_path = "/tmp/bar"
-        def mock_get_container_details_from_fs(cont_path, bu_p=5):
-            bu = bu_p
-            oc = 1
-            ol = ['foo',]
-            dl = [('a',100),]
-            return utils.ContainerDetails(bu, oc, ol, dl)
-        def mock_do_stat(path):
-            class MockStat(object):
-                def __init__(self, mtime):
-                    self.st_mtime = mtime
-            return MockStat(100)
-        cd = mock_get_container_details_from_fs(the_path, bu_p=6)
-        mc.set(utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path, cd)
+        td = tempfile.mkdtemp()
         orig_gcdff = utils._get_container_details_from_fs
-        utils._get_container_details_from_fs = mock_get_container_details_from_fs
-        orig_ds = utils.do_stat
-        utils.do_stat = mock_do_stat
         try:
-            retval = utils.get_container_details(the_path, memcache=mc)
-            # If it did not properly use memcache, the default mocked version
-            # of get details from fs would return 5 bytes used instead of the
-            # 6 we specified above.
-            cd = mock_get_container_details_from_fs(the_path, bu_p=6)
-            assert retval == (cd.obj_list, cd.object_count, cd.bytes_used)
+            cont_path = self._make_container(td)
+            retval = utils.get_container_details(cont_path, memcache=mc)
+            assert retval == (['foo'], 1, 5)
+            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + cont_path
+            # Only the counts are kept in memcache, never the object list.
+            assert mc._d[mkey]['object_count'] == 1
+            assert mc._d[mkey]['bytes_used'] == 5
+            assert 'obj_list' not in mc._d[mkey]
+
+            def mock_get_container_details_from_fs(cont_path):
+                self.fail("the object list should have come from the cache")
+            utils._get_container_details_from_fs = \
+                mock_get_container_details_from_fs
+            retval = utils.get_container_details(cont_path, memcache=mc)
+            assert retval == (['foo'], 1, 5)
         finally:
             utils._get_container_details_from_fs = orig_gcdff
-            utils.do_stat = orig_ds
+            utils._container_details_cache.clear()
+            shutil.rmtree(td)
 
-    def test_container_details_cached_miss_key(self):
+    def test_container_details_cached_miss_generation(self):
         mc = SimMemcache()
-        the_path = "/tmp/bar"
-        def mock_get_container_details_from_fs(cont_path, bu_p=5):
-            bu = bu_p
-            oc = 1
-            ol = ['foo',]
-            dl = [('a',100),]
-            return utils.ContainerDetails(bu, oc, ol, dl)
-        def mock_do_stat(path):
-            # Be sure we don't miss due to mtimes not matching
-            self.fail("do_stat should not have been called")
-        cd = mock_get_container_details_from_fs(the_path + "u", bu_p=6)
-        mc.set(utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path + "u", cd)
-        orig_gcdff = utils._get_container_details_from_fs
-        utils._get_container_details_from_fs = mock_get_container_details_from_fs
-        orig_ds = utils.do_stat
-        utils.do_stat = mock_do_stat
+        td = tempfile.mkdtemp()
         try:
-            retval = utils.get_container_details(the_path, memcache=mc)
-            cd = mock_get_container_details_from_fs(the_path)
-            assert retval == (cd.obj_list, cd.object_count, cd.bytes_used)
-            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path
-            assert mkey in mc._d
+            cont_path = self._make_container(td)
+            assert utils.get_container_details(cont_path, memcache=mc) == \
+                (['foo'], 1, 5)
+            with open(os.path.join(cont_path, 'bar'), 'w') as fp:
+                fp.write('123')
+            utils.record_container_stats(cont_path, 1, 3)
+            assert utils.get_container_details(cont_path, memcache=mc) == \
+                (['bar', 'foo'], 2, 8)
+            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + cont_path
+            assert mc._d[mkey]['generation'] == \
+                utils.get_container_generation(cont_path)
         finally:
-            utils._get_container_details_from_fs = orig_gcdff
-            utils.do_stat = orig_ds
+            utils._container_details_cache.clear()
+            shutil.rmtree(td)
 
-    def test_container_details_cached_miss_dir_list(self):
-        mc = SimMemcache()
-        the_path = "/tmp/bar"
-        def mock_get_container_details_from_fs(cont_path, bu_p=5):
-            bu = bu_p
-            oc = 1
-            ol = ['foo',]
-            dl = []
-            return utils.ContainerDetails(bu, oc, ol, dl)
-        def mock_do_stat(path):
-            # Be sure we don't miss due to mtimes not matching
-            self.fail("do_stat should not have been called")
-        cd = mock_get_container_details_from_fs(the_path, bu_p=6)
-        mc.set(utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path, cd)
-        orig_gcdff = utils._get_container_details_from_fs
-        utils._get_container_details_from_fs = mock_get_container_details_from_fs
-        orig_ds = utils.do_stat
-        utils.do_stat = mock_do_stat
+    def test_container_details_cache_bounded_by_names(self):
+        td = tempfile.mkdtemp()
+        __cache = utils._container_details_cache
+        utils._container_details_cache = utils.LRUCache(64, 2)
         try:
-            retval = utils.get_container_details(the_path, memcache=mc)
-            cd = mock_get_container_details_from_fs(the_path)
-            assert retval == (cd.obj_list, cd.object_count, cd.bytes_used)
-            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path
-            assert mkey in mc._d
-            assert 5 == mc._d[mkey].bytes_used
+            cont_path = self._make_container(td)
+            utils.get_container_details(cont_path)
+            assert utils._container_details_cache.keys() == [cont_path]
+            for name in ('bar', 'baz'):
+                with open(os.path.join(cont_path, name), 'w') as fp:
+                    fp.write('123')
+            utils.record_container_stats(cont_path, 2, 6)
+            assert utils.get_container_details(cont_path)[0] == \
+                ['bar', 'baz', 'foo']
+            # Three names are more than the cache holds.
+            assert utils._container_details_cache.keys() == []
         finally:
-            utils._get_container_details_from_fs = orig_gcdff
-            utils.do_stat = orig_ds
+            utils._container_details_cache = __cache
+            shutil.rmtree(td)
 
-    def test_container_details_cached_miss_mtime(self):
+    def test_container_stats_cached_stale_record(self):
         mc = SimMemcache()
-        the_path = "/tmp/bar"
-        def mock_get_container_details_from_fs(cont_path, bu_p=5):
-            bu = bu_p
-            oc = 1
-            ol = ['foo',]
-            dl = [('a',100),]
-            return utils.ContainerDetails(bu, oc, ol, dl)
-        def mock_do_stat(path):
-            # Be sure we miss due to mtimes not matching
-            class MockStat(object):
-                def __init__(self, mtime):
-                    self.st_mtime = mtime
-            return MockStat(200)
-        cd = mock_get_container_details_from_fs(the_path, bu_p=6)
-        mc.set(utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path, cd)
-        orig_gcdff = utils._get_container_details_from_fs
-        utils._get_container_details_from_fs = mock_get_container_details_from_fs
-        orig_ds = utils.do_stat
-        utils.do_stat = mock_do_stat
+        td = tempfile.mkdtemp()
         try:
-            retval = utils.get_container_details(the_path, memcache=mc)
-            cd = mock_get_container_details_from_fs(the_path)
-            assert retval == (cd.obj_list, cd.object_count, cd.bytes_used)
-            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + the_path
-            assert mkey in mc._d
-            assert 5 == mc._d[mkey].bytes_used
+            cont_path = self._make_container(td)
+            mkey = utils.MEMCACHE_CONTAINER_DETAILS_KEY_PREFIX + cont_path
+            mc.set(mkey, {'generation': 'stale', 'object_count': 7,
+                          'bytes_used': 70})
+            assert utils.get_container_stats(cont_path, memcache=mc) == (1, 5)
+            generation = utils.get_container_generation(cont_path)
+            assert mc._d[mkey]['generation'] == generation
+            mc.set(mkey, {'generation': generation, 'object_count': 7,
+                          'bytes_used': 70})
+            assert utils.get_container_stats(cont_path, memcache=mc) == \
+                (7, 70)
         finally:
-            utils._get_container_details_from_fs = orig_gcdff
-            utils.do_stat = orig_ds
+            shutil.rmtree(td)
+
+    def test_lru_cache(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
 
     def test_account_details_uncached(self):
         the_path = "/tmp/bar"
@@ -846,6 +825,112 @@ class TestUtils(unittest.TestCase):
             os.chdir(orig_cwd)
             shutil.rmtree(td)
 
+    def test_container_stats_journal(self):
+        td = tempfile.mkdtemp()
+        try:
+            cont_path = os.path.join(td, 'drive', 'cont')
+            os.makedirs(os.path.join(cont_path, 'dir1'))
+            with open(os.path.join(cont_path, 'dir1', 'file1'), 'w') as fp:
+                fp.write('1234')
+
+            # Nothing is recorded until the journal is started.
+            utils.record_container_stats(cont_path, 1, 10)
+            assert utils.get_container_stats(cont_path) == (2, 4)
+            assert os.path.isdir(os.path.join(td, 'drive',
+                                              utils.STATS_JOURNAL_DIR))
+            utils.record_container_stats(cont_path, 1, 10)
+            utils.record_container_stats(cont_path, -1, -4)
+            assert utils.get_container_stats(cont_path) == (2, 10)
+            # The journal directory is not a container.
+            assert utils.get_account_details(os.path.join(td, 'drive')) == \
+                (['cont'], 1)
+
+            assert utils.reconcile_container_stats(cont_path) == (2, 4)
+            assert utils.get_container_stats(cont_path) == (2, 4)
+            utils.remove_container_stats(cont_path)
+            utils.remove_container_stats(cont_path)
+        finally:
+            shutil.rmtree(td)
+
+    def test_container_stats_journal_compacts(self):
+        td = tempfile.mkdtemp()
+        __compact_size = utils.STATS_JOURNAL_COMPACT_SIZE
+        utils.STATS_JOURNAL_COMPACT_SIZE = 64
+        try:
+            cont_path = os.path.join(td, 'drive', 'cont')
+            os.makedirs(cont_path)
+            utils.reconcile_container_stats(cont_path)
+            for i in range(100):
+                utils.record_container_stats(cont_path, 1, 3)
+            journal = os.path.join(td, 'drive', utils.STATS_JOURNAL_DIR,
+                                   'cont')
+            assert os.path.getsize(journal) <= 64 + 8
+            assert utils.get_container_stats(cont_path) == (100, 300)
+        finally:
+            utils.STATS_JOURNAL_COMPACT_SIZE = __compact_size
+            shutil.rmtree(td)
+
+    def test_reconcile_container_stats_walks_unlocked(self):
+        td = tempfile.mkdtemp()
+        __get_stats = utils._get_container_stats_from_fs
+        __lock_file = utils.lock_file
+
+        def _get_stats(cont_path):
+            # A write journaled during the walk, which it did not see.
+            utils.record_container_stats(cont_path, 1, 5)
+            return __get_stats(cont_path)
+
+        def _lock_file(*args, **kwargs):
+            kwargs['timeout'] = 0.01
+            return __lock_file(*args, **kwargs)
+
+        utils._get_container_stats_from_fs = _get_stats
+        utils.lock_file = _lock_file
+        try:
+            cont_path = os.path.join(td, 'drive', 'cont')
+            os.makedirs(cont_path)
+            with open(os.path.join(cont_path, 'file1'), 'w') as fp:
+                fp.write('1234')
+            assert utils.reconcile_container_stats(cont_path) == (2, 9)
+            assert utils.get_container_stats(cont_path) == (2, 9)
+
+            # A write that cannot get the lock is skipped, not failed.
+            journal = os.path.join(td, 'drive', utils.STATS_JOURNAL_DIR,
+                                   'cont')
+            with __lock_file(journal, append=True, unlink=False):
+                utils.record_container_stats(cont_path, 1, 5)
+            assert utils.get_container_stats(cont_path) == (2, 9)
+        finally:
+            utils._get_container_stats_from_fs = __get_stats
+            utils.lock_file = __lock_file
+            shutil.rmtree(td)
+
+    def test_reconcile_container_stats_compacted_during_walk(self):
+        td = tempfile.mkdtemp()
+        __get_stats = utils._get_container_stats_from_fs
+        __compact_size = utils.STATS_JOURNAL_COMPACT_SIZE
+
+        def _get_stats(cont_path):
+            # A writer compacts the journal, marker and all, under the walk.
+            utils.STATS_JOURNAL_COMPACT_SIZE = 0
+            utils.record_container_stats(cont_path, 0, 0)
+            return __get_stats(cont_path)
+
+        try:
+            cont_path = os.path.join(td, 'drive', 'cont')
+            os.makedirs(cont_path)
+            for name in ('file1', 'file2', 'file3'):
+                with open(os.path.join(cont_path, name), 'w') as fp:
+                    fp.write('1234567890')
+            assert utils.reconcile_container_stats(cont_path) == (3, 30)
+            utils._get_container_stats_from_fs = _get_stats
+            assert utils.reconcile_container_stats(cont_path) == (3, 30)
+            assert utils.get_container_stats(cont_path) == (3, 30)
+        finally:
+            utils._get_container_stats_from_fs = __get_stats
+            utils.STATS_JOURNAL_COMPACT_SIZE = __compact_size
+            shutil.rmtree(td)
+
     def test_get_account_details_from_fs_notadir_w_stats(self):
         tf = tempfile.NamedTemporaryFile()
         ad = utils._get_account_details_from_fs(tf.name, os.stat(tf.name))
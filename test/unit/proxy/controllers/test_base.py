@@ -13,13 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import unittest
 from mock import patch
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, get_container_info, get_container_memcache_key, \
     get_account_info, get_account_memcache_key, _get_cache_key, get_info, \
-    Controller
+    Controller, clear_info_cache
 from swift.common.swob import Request
+from swift.proxy.info_cache import InfoCache
 from swift.common.utils import split_path
 from test.unit import fake_http_connect, FakeRing, FakeMemcache
 from swift.proxy import server as proxy_server
@@ -64,6 +66,33 @@ class FakeCache(object):
         return self.val
 
 
+class FakeMultiCache(object):
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('get', key))
+        return self.store.get(key)
+
+    def get_multi(self, keys, server_key=None):
+        self.calls.append(('get_multi', keys))
+        return [self.store.get(key) for key in keys]
+
+    def delete(self, key):
+        self.calls.append(('delete', key))
+        self.store.pop(key, None)
+
+
+class FakeInfoApp(object):
+    recheck_account_existence = 60
+    recheck_container_existence = 60
+
+    def __init__(self, store):
+        self.memcache = FakeMultiCache(store)
+        self.info_cache = InfoCache(10)
+
+
 class TestFuncs(unittest.TestCase):
     def setUp(self):
         self.app = proxy_server.Application(None, FakeMemcache(),
@@ -213,6 +242,50 @@ class TestFuncs(unittest.TestCase):
         self.assertEquals(resp['object_count'], 10)
         self.assertEquals(resp['status'], 404)
 
+    def test_get_container_info_prefetches_account(self):
+        account_key = get_account_memcache_key("account")
+        cont_key = get_container_memcache_key("account", "cont")
+        cache = FakeMultiCache({account_key: {'status': 200, 'bytes': 1}})
+        req = Request.blank("/v1/account/cont",
+                            environ={'swift.cache': cache})
+        with patch('swift.proxy.controllers.base.'
+                   '_prepare_pre_auth_info_request', FakeRequest):
+            resp = get_container_info(req.environ, 'xxx')
+        self.assertEquals(resp['bytes'], 6666)
+        # The account came with the container, in one round trip.
+        self.assertEquals(cache.calls,
+                          [('get_multi', [cont_key, account_key])])
+        self.assertEquals(req.environ['swift.' + account_key]['bytes'], 1)
+
+    def test_get_container_info_in_process_cache(self):
+        account_key = get_account_memcache_key("account")
+        cont_key = get_container_memcache_key("account", "cont")
+        app = FakeInfoApp({account_key: {'status': 200, 'bytes': 1},
+                           cont_key: {'status': 200, 'bytes': 5}})
+        env = Request.blank("/v1/account/cont").environ
+        self.assertEquals(get_container_info(env, app)['bytes'], 5)
+        self.assertEquals(app.memcache.calls,
+                          [('get_multi', [cont_key, account_key])])
+        # The next requests skip memcache.
+        env = Request.blank("/v1/account/cont").environ
+        self.assertEquals(get_container_info(env, app)['bytes'], 5)
+        self.assertEquals(get_account_info(env, app)['bytes'], 1)
+        self.assertEquals(len(app.memcache.calls), 1)
+
+        clear_info_cache(app, env, 'account', 'cont')
+        self.assertEquals(app.memcache.calls[1:], [('delete', cont_key)])
+        app.memcache.store[cont_key] = {'status': 404, 'bytes': 0}
+        env = Request.blank("/v1/account/cont").environ
+        self.assertEquals(
+            get_container_info(env, app)['status'], 404)
+        self.assertEquals(app.memcache.calls[2:], [('get', cont_key)])
+        # Missing containers are kept as long as memcache keeps them.
+        expires = app.info_cache.entries.expires(cont_key)
+        self.assert_(expires <= time.time() + 6)
+        env = Request.blank("/v1/account/cont").environ
+        get_container_info(env, app)
+        self.assertEquals(len(app.memcache.calls), 3)
+
     def test_get_container_info_env(self):
         cache_key = get_container_memcache_key("account", "cont")
         env_key = 'swift.%s' % cache_key
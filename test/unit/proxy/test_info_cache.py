@@ -0,0 +1,75 @@
+# Copyright (c) 2010-2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import patch
+
+from swift.proxy import info_cache
+from swift.proxy.info_cache import InfoCache
+
+
+class TestInfoCache(unittest.TestCase):
+
+    def test_disabled(self):
+        cache = InfoCache(0)
+        cache.set('container/a/c', {'status': 200})
+        self.assertEquals(cache.get('container/a/c'), None)
+        self.assertEquals(len(cache.entries), 0)
+
+    def test_ttl(self):
+        cache = InfoCache(10, jitter=0)
+        with patch.object(info_cache.time, 'time', lambda: 100.0):
+            cache.set('container/a/c', {'status': 200})
+            # Memcache keeps missing containers for less.
+            cache.set('container/a/d', {'status': 404}, 6)
+        with patch.object(info_cache.time, 'time', lambda: 105.0):
+            self.assertEquals(cache.get('container/a/c'), {'status': 200})
+            self.assertEquals(cache.get('container/a/d'), {'status': 404})
+        with patch.object(info_cache.time, 'time', lambda: 107.0):
+            self.assertEquals(cache.get('container/a/c'), {'status': 200})
+            self.assertEquals(cache.get('container/a/d'), None)
+        with patch.object(info_cache.time, 'time', lambda: 110.0):
+            self.assertEquals(cache.get('container/a/c'), None)
+        self.assertEquals(len(cache.entries), 0)
+
+    def test_jitter(self):
+        cache = InfoCache(10, jitter=0.5)
+        with patch.object(info_cache.time, 'time', lambda: 100.0):
+            with patch.object(info_cache.random, 'random', lambda: 1.0):
+                cache.set('container/a/c', {'status': 200})
+            with patch.object(info_cache.random, 'random', lambda: 0.0):
+                cache.set('container/a/d', {'status': 200})
+        self.assertEquals(cache.entries.expires('container/a/c'), 105.0)
+        self.assertEquals(cache.entries.expires('container/a/d'), 110.0)
+
+    def test_lru(self):
+        cache = InfoCache(10, max_entries=2)
+        cache.set('account/a', {'status': 200})
+        cache.set('container/a/c', {'status': 200})
+        self.assertEquals(cache.get('account/a'), {'status': 200})
+        cache.set('container/a/d', {'status': 200})
+        self.assertEquals(cache.entries.keys(),
+                          ['account/a', 'container/a/d'])
+
+    def test_invalidate(self):
+        cache = InfoCache(10)
+        cache.set('container/a/c', {'status': 200})
+        cache.invalidate('container/a/c')
+        cache.invalidate('container/a/d')
+        self.assertEquals(cache.get('container/a/c'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,21 +13,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import cPickle as pickle
 import errno
+import fcntl
 import os
 import unittest
 import signal
+import sqlite3
+import time
+import threading
 import xattr
+import zlib
 from contextlib import contextmanager
+from hashlib import md5
 from shutil import rmtree
 from tempfile import mkdtemp
+from xml.dom import minidom
 
-from eventlet import spawn, wsgi, listen
+from eventlet import GreenPool, listen, sleep, spawn, wsgi
 
-from test.unit import connect_tcp, readuntil2crlfs
+from test.unit import connect_tcp, FakeLogger, readuntil2crlfs
 from swift.proxy import server as proxy_server
-from swift.common.swob import Request
-from swift.common.utils import mkdirs, NullLogger
+from swift.proxy import lfs_posix
+from swift.proxy.controllers import lfs
+from swift.proxy.lfs_posix import LFSPluginPosix
+from swift.proxy.lfs_index import INDEX_NAME, LFSNameIndex
+from swift.proxy import lfs_bench
+from swift.proxy import lfs_cache
+from swift.proxy import lfs_checksum
+from swift.proxy import lfs_copy
+from swift.proxy import lfs_expirer
+from swift.proxy import lfs_updater
+from swift.proxy import lfs_writer as lfs_writer_module
+from swift.proxy.lfs_writer import lfs_writer
+from swift.common.middleware import bulk
+from swift.common.exceptions import DiskFileNoSpace, LockTimeout
+from swift.common.swob import HTTPForbidden, Request
+from swift.common.utils import json, mkdirs, NullLogger
 
 # XXX The xattr-patching code is stolen from test/unit/gluster/test_utls.py
 # This is necessary so tests could be run in environments like Koji.
@@ -123,7 +145,8 @@ class S(object):
         self.sockets = None
         self.coros = None
 
-def _setup(state, mode):
+def _setup(state, mode, threads_per_mount='0'):
+    state.mode = mode
     state.testdir = os.path.join(mkdtemp(), 'tmp_test_proxy_server_lfs')
     conf = {'devices': state.testdir,
             'swift_dir': state.testdir,
@@ -131,7 +154,8 @@ def _setup(state, mode):
             'allow_versions': 'True',
             'allow_account_management': 'yes',
             'lfs_mode': mode,
-            'lfs_root': state.testdir}
+            'lfs_root': state.testdir,
+            'lfs_threads_per_mount': threads_per_mount}
     mkdirs(state.testdir)
     rmtree(state.testdir)
     prolis = listen(('localhost', 0))
@@ -139,6 +163,7 @@ def _setup(state, mode):
     prosrv = proxy_server.Application(conf, FakeMemcacheReturnsNone(),
                                       None, FakeRing(), FakeRing(), FakeRing())
     state.servers = (prosrv,)
+    state.plugin_class = prosrv.lfs_plugins.get(mode)
     nl = NullLogger()
     prospa = spawn(wsgi.server, prolis, prosrv, nl)
     state.coros = (prospa,)
@@ -180,6 +205,9 @@ def _setup(state, mode):
 def _teardown(state):
     for server in state.coros:
         server.kill()
+    for server in state.servers:
+        if server.lfs_stats:
+            server.lfs_stats.stop()
     rmtree(os.path.dirname(state.testdir))
 
 
@@ -189,7 +217,8 @@ def setup():
     _sg = S()
     _setup(_sg, 'gluster')
     _sp = S()
-    _setup(_sp, 'posix')
+    # Run one of the plugins through real worker threads.
+    _setup(_sp, 'posix', threads_per_mount='2')
 
 def teardown():
     _teardown(_sg)
@@ -235,7 +264,7 @@ class FakeMemcache(object):
     def keys(self):
         return self.store.keys()
 
-    def set(self, key, value, timeout=0):
+    def set(self, key, value, timeout=0, time=0):
         self.store[key] = value
         return True
 
@@ -311,6 +340,43 @@ class TestProxyServerLFS(unittest.TestCase):
         self._test_GET_newest_large_file(_sg)
         self._test_GET_newest_large_file(_sp)
 
+    def _test_GET_ranges(self, state):
+        prosrv = state.servers[0]
+        path = '/v1/a/c/o.ranges'
+        body = ''.join(chr(ord('a') + i % 26) for i in xrange(300 * 1024))
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/plain'},
+                            body=body)
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 201)
+
+        req = Request.blank(path, headers={'Range': 'bytes=200000-'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 206)
+        self.assertEquals(res.body, body[200000:])
+        self.assertEquals(res.headers['Content-Range'],
+                          'bytes 200000-%d/%d' % (len(body) - 1, len(body)))
+
+        req = Request.blank(path, headers={'Range': 'bytes=-5'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 206)
+        self.assertEquals(res.body, body[-5:])
+
+        req = Request.blank(path, headers={'Range': 'bytes=1-2,140000-140001'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 206)
+        content_type = res.headers['Content-Type']
+        self.assert_(content_type.startswith('multipart/byteranges'))
+        parts = res.body.split('--' + content_type.split('=')[-1])
+        self.assertEquals(len(parts), 4)
+        self.assert_(parts[1].endswith('\r\n\r\n' + body[1:3] + '\r\n'))
+        self.assert_(parts[2].endswith(
+            '\r\n\r\n' + body[140000:140002] + '\r\n'))
+
+    def test_GET_ranges(self):
+        self._test_GET_ranges(_sg)
+        self._test_GET_ranges(_sp)
+
     ## reproduce byte for byte but with LFSObjectController
     #def test_PUT_max_size(self):
     #    with save_globals():
@@ -428,6 +494,27 @@ class TestProxyServerLFS(unittest.TestCase):
         self._test_POST_HEAD_metadata(_sg)
         self._test_POST_HEAD_metadata(_sp)
 
+    def _test_metadata_not_utf8(self, state):
+        prosrv = state.servers[0]
+        for path, method, header in (
+                ('/v1/a/c', 'POST', 'X-Container-Meta-Bad'),
+                ('/v1/a/c_bad_meta', 'PUT', 'X-Container-Meta-Bad'),
+                ('/v1/a', 'POST', 'X-Account-Meta-Bad')):
+            req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                headers={header: '\xff'})
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int, 400)
+            req = Request.blank(path, environ={'REQUEST_METHOD': 'HEAD'})
+            res = req.get_response(prosrv)
+            self.assert_(header.lower() not in res.headers)
+        req = Request.blank('/v1/a/c_bad_meta',
+                            environ={'REQUEST_METHOD': 'HEAD'})
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+
+    def test_metadata_not_utf8(self):
+        self._test_metadata_not_utf8(_sg)
+        self._test_metadata_not_utf8(_sp)
+
     # Test if POST works at all.
     def _test_object_POST(self, state):
         prolis = state.sockets[0]
@@ -516,7 +603,602 @@ class TestProxyServerLFS(unittest.TestCase):
         self._test_object_POST(_sg)
         self._test_object_POST(_sp)
 
-    # def test_DELETE(self):
+    def _put_objects(self, prosrv, path, names):
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Length': '0'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int // 100, 2)
+        for name in names:
+            req = Request.blank('%s/%s' % (path, name),
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Type': 'text/plain'},
+                                body=name)
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int, 201)
+
+    def _test_container_GET_listing(self, state):
+        prosrv = state.servers[0]
+        path = '/v1/a/listing'
+        names = ['b', 'a', 'c']
+        self._put_objects(prosrv, path, names)
+
+        req = Request.blank(path + '?format=json')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals(res.content_type, 'application/json')
+        listing = json.loads(res.body)
+        self.assertEquals([o['name'] for o in listing], ['a', 'b', 'c'])
+        self.assertEquals(listing[0]['bytes'], 1)
+        # The fake xattrs do not follow renames, so Gluster regenerates the
+        # object metadata and only size and hash are stable here.
+        self.assertEquals(listing[0]['hash'], md5('a').hexdigest())
+
+        req = Request.blank(path + '?format=xml')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        dom = minidom.parseString(res.body)
+        self.assertEquals(
+            [n.firstChild.nodeValue for n in dom.getElementsByTagName('name')],
+            ['a', 'b', 'c'])
+
+        req = Request.blank(path + '?marker=a&limit=1')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals(res.body, 'b\n')
+
+        req = Request.blank(path + '?marker=c')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 204)
+
+        req = Request.blank(path + '?marker=c&format=json')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals(json.loads(res.body), [])
+
+    def test_container_GET_listing(self):
+        self._test_container_GET_listing(_sg)
+        self._test_container_GET_listing(_sp)
+
+    def test_container_listing_renderers_stream(self):
+        rows = [('a', '1.00000', 1, 'text/plain', 'x'),
+                ('b/', None, 0, None, None)]
+        chunks = list(lfs.container_listing_json_iter(iter(rows)))
+        self.assertTrue(len(chunks) > 2)
+        self.assertEquals(json.loads(''.join(chunks)),
+                          [{'name': 'a', 'bytes': 1, 'hash': 'x',
+                            'content_type': 'text/plain',
+                            'last_modified': '1970-01-01T00:00:01.000000'},
+                           {'subdir': 'b/'}])
+        body = ''.join(lfs.container_listing_xml_iter('c', iter(rows)))
+        self.assert_('<subdir name="b/"><name>b/</name></subdir>' in body)
+        self.assertEquals(
+            ''.join(lfs.container_listing_plain_iter(iter(rows))), 'a\nb/\n')
+
+    def test_container_GET_delimiter_posix(self):
+        # Nested names are only meaningful where the name index exists.
+        prosrv = _sp.servers[0]
+        path = '/v1/a/nested'
+        self._put_objects(prosrv, path, ['x', 'y/1', 'y/2', 'z'])
+
+        req = Request.blank(path + '?format=json&delimiter=/')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        listing = json.loads(res.body)
+        self.assertEquals([o.get('name', o.get('subdir')) for o in listing],
+                          ['x', 'y/', 'z'])
+
+        req = Request.blank(path + '?prefix=y/')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'y/1\ny/2\n')
+
+        req = Request.blank(path + '?end_marker=y/2')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'x\ny/1\n')
+
+    def test_container_GET_rebuilt_index_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/rebuilt'
+        self._put_objects(prosrv, path, ['a', 'b/c'])
+        index = os.path.join(_sp.testdir, 'a', 'rebuilt', INDEX_NAME)
+        os.unlink(index)
+
+        pbroker = LFSPluginPosix(prosrv, 'a', 'rebuilt', None, False)
+        summaries = pbroker.get_objects_metadata(['a', 'b/c', 'nonexistent'])
+        self.assertEquals(sorted(summaries.keys()), ['a', 'b/c'])
+        self.assertEquals(summaries['a'][1:], (1, 'text/plain',
+                                               md5('a').hexdigest()))
+        # The summaries found in the .meta files were saved to the index.
+        self.assertEquals(
+            LFSNameIndex(os.path.dirname(index)).get_metadata(['b/c']),
+            {'b/c': summaries['b/c']})
+
+        req = Request.blank(path + '?format=json')
+        res = req.get_response(prosrv)
+        self.assertEquals([o['name'] for o in json.loads(res.body)],
+                          ['a', 'b/c'])
+
+    def test_PUT_contends_on_index_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/contended'
+        self._put_objects(prosrv, path, [])
+        index = os.path.join(_sp.testdir, 'a', 'contended', INDEX_NAME)
+        # Another worker is in the middle of writing the index.
+        other = sqlite3.connect(index)
+        other.execute('BEGIN EXCLUSIVE')
+        other.execute("INSERT INTO name (name) VALUES ('other')")
+
+        def put(name):
+            req = Request.blank('%s/%s' % (path, name),
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Type': 'text/plain'},
+                                body=name)
+            return req.get_response(prosrv).status_int
+
+        pool = GreenPool()
+        puts = [pool.spawn(put, 'o%d' % i) for i in xrange(4)]
+        sleep(0.2)
+        other.commit()
+        other.close()
+        self.assertEquals([put.wait() for put in puts], [201] * 4)
+        self.assertEquals(
+            sorted(LFSNameIndex(os.path.dirname(index)).get_metadata(
+                ['o0', 'o1', 'o2', 'o3'])), ['o0', 'o1', 'o2', 'o3'])
+
+    def test_hashed_layout_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/hashed'
+        prosrv.lfs_posix_layout = 'hashed'
+        try:
+            self._put_objects(prosrv, path, ['b', 'a', 'a/c'])
+        finally:
+            prosrv.lfs_posix_layout = 'flat'
+        cont_path = os.path.join(_sp.testdir, 'a', 'hashed')
+        self.assertEquals(lfs_posix.read_layout(cont_path), 'hashed')
+        self.assertFalse(os.path.exists(os.path.join(cont_path, 'a')))
+        pbroker = LFSPluginPosix(prosrv, 'a', 'hashed', 'a/c', False)
+        self.assertEquals(pbroker.datadir,
+                          lfs_posix.hashed_object_path(cont_path, 'a/c'))
+        self.assert_(pbroker.exists())
+        self.assertEquals(Request.blank(path + '/a/c').get_response(
+            prosrv).body, 'a/c')
+
+        # Listings keep their order, and the index can be rebuilt.
+        os.unlink(os.path.join(cont_path, INDEX_NAME))
+        req = Request.blank(path + '?format=json')
+        self.assertEquals([o['name'] for o in
+                           json.loads(req.get_response(prosrv).body)],
+                          ['a', 'a/c', 'b'])
+
+    def test_account_GET_listing_posix(self):
+        prosrv = _sp.servers[0]
+        for cont in ('acc1', 'acc2'):
+            req = Request.blank('/v1/a/' + cont,
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Length': '0'})
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int // 100, 2)
+        req = Request.blank('/v1/a?prefix=acc&format=json')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals([c['name'] for c in json.loads(res.body)],
+                          ['acc1', 'acc2'])
+
+    def test_GET_zero_copy_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/zerocopy'
+        self._put_objects(prosrv, path, ['o'])
+        wrapped = []
+
+        def file_wrapper(fp, chunk_size):
+            wrapped.append(fp.name)
+            return iter(lambda: fp.read(chunk_size), '')
+
+        req = Request.blank(path + '/o',
+                            environ={'wsgi.file_wrapper': file_wrapper})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'o')
+        self.assertEquals(len(wrapped), 1)
+        self.assert_(wrapped[0].endswith('.data'))
+
+        # Without a wrapper the file is still read without hashing.
+        req = Request.blank(path + '/o')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'o')
+
+        # Ranges and sampled verification take the regular path.
+        req = Request.blank(path + '/o', headers={'Range': 'bytes=0-0'},
+                            environ={'wsgi.file_wrapper': file_wrapper})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'o')
+        prosrv.lfs_etag_verify_rate = 1.0
+        try:
+            req = Request.blank(path + '/o',
+                                environ={'wsgi.file_wrapper': file_wrapper})
+            res = req.get_response(prosrv)
+            self.assertEquals(res.body, 'o')
+        finally:
+            prosrv.lfs_etag_verify_rate = 0.0
+        self.assertEquals(len(wrapped), 1)
+
+    def _test_expiring_object(self, state):
+        prosrv = state.servers[0]
+        path = '/v1/a/c/o.expiring'
+        delete_at = int(time.time()) + 100
+        bucket = prosrv.lfs_expiry.bucket(delete_at)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/plain',
+                                     'X-Delete-At': str(delete_at)},
+                            body='x')
+        self.assertEquals(req.get_response(prosrv).status_int, 201)
+        self.assertEquals(
+            [actual for _junk, actual, _junk in
+             prosrv.lfs_expiry.iter_due(bucket, delete_at)],
+            ['a/c/o.expiring'])
+        req = Request.blank(path)
+        self.assertEquals(req.get_response(prosrv).status_int, 200)
+
+        # A POST moves the deletion.
+        delete_at += 1
+        bucket = prosrv.lfs_expiry.bucket(delete_at)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'POST'},
+                            headers={'X-Delete-At': str(delete_at)})
+        self.assertEquals(req.get_response(prosrv).status_int, 202)
+        self.assertEquals(
+            [due for due, _junk, _junk in
+             prosrv.lfs_expiry.iter_due(bucket, delete_at)],
+            [delete_at])
+        self.assertEquals(
+            [due for b in prosrv.lfs_expiry.buckets()
+             for due, _junk, _junk in prosrv.lfs_expiry.iter_due(
+                 b, delete_at)], [delete_at])
+
+        orig_time = lfs_expirer.time
+        lfs_expirer.time = lambda: delete_at
+        try:
+            # Past X-Delete-At, the object is not served.
+            req = Request.blank(path)
+            self.assertEquals(req.get_response(prosrv).status_int, 404)
+            req = Request.blank(path, environ={'REQUEST_METHOD': 'HEAD'})
+            self.assertEquals(req.get_response(prosrv).status_int, 404)
+
+            expirer = lfs_expirer.LFSObjectExpirer(
+                {'lfs_mode': state.mode, 'lfs_root': state.testdir,
+                 'recon_cache_path': state.testdir})
+            expirer.logger = FakeLogger()
+            expirer.run_once()
+            self.assertEquals(expirer.report_objects, 1)
+            self.assertEquals(list(expirer.expiry.iter_due(bucket,
+                                                           delete_at)), [])
+            pbroker = state.plugin_class(prosrv, 'a', 'c', 'o.expiring',
+                                         False)
+            self.assertEquals(pbroker.data_file, None)
+            lfs_expirer.time = lambda: delete_at + 86400
+            expirer.run_once()
+            self.assertEquals(expirer.expiry.buckets(), [])
+        finally:
+            lfs_expirer.time = orig_time
+
+    def test_expiring_object_posix(self):
+        # The xattr fakes lose the metadata that Gluster_DiskFile writes
+        # through its descriptor, X-Delete-At included.
+        self._test_expiring_object(_sp)
+
+    def test_GET_manifest_posix(self):
+        # The xattr fakes lose X-Object-Manifest on Gluster, as they do
+        # X-Delete-At.
+        prosrv = _sp.servers[0]
+        self._put_objects(prosrv, '/v1/a/segs', ['seg/1', 'seg/2', 'seg/3',
+                                                 'segx'])
+        req = Request.blank('/v1/a/c/manifest',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/plain',
+                                     'X-Object-Manifest': 'segs/seg/'},
+                            body='')
+        self.assertEquals(req.get_response(prosrv).status_int, 201)
+        etag = md5(''.join(md5('seg/%d' % i).hexdigest()
+                           for i in (1, 2, 3))).hexdigest()
+
+        req = Request.blank('/v1/a/c/manifest')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals(res.body, 'seg/1seg/2seg/3')
+        self.assertEquals(res.content_length, 15)
+        self.assertEquals(res.etag, etag)
+        req = Request.blank('/v1/a/c/manifest',
+                            environ={'REQUEST_METHOD': 'HEAD'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.headers['Content-Length'], '15')
+        self.assertEquals(res.etag, etag)
+
+        # A range only opens the segments it covers.
+        opened = []
+        orig_open = lfs.LFSSegmentedIterable._open_segment
+
+        def open_segment(iterable, name):
+            opened.append(name)
+            return orig_open(iterable, name)
+
+        lfs.LFSSegmentedIterable._open_segment = open_segment
+        try:
+            req = Request.blank('/v1/a/c/manifest',
+                                headers={'Range': 'bytes=3-6'})
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int, 206)
+            self.assertEquals(res.body, '/1se')
+            self.assertEquals(opened, ['seg/1', 'seg/2'])
+        finally:
+            lfs.LFSSegmentedIterable._open_segment = orig_open
+        req = Request.blank('/v1/a/c/manifest',
+                            headers={'Range': 'bytes=0-0,-2'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 206)
+        self.assert_('\r\n\r\ns\r\n' in res.body)
+        self.assert_('\r\n\r\n/3\r\n' in res.body)
+
+        # A segment that went away cuts the transfer short.
+        pbroker = _sp.plugin_class(prosrv, 'a', 'segs', 'seg/3', False)
+        os.unlink(pbroker.data_file)
+        req = Request.blank('/v1/a/c/manifest')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.status_int, 200)
+        self.assertRaises(Exception, lambda: res.body)
+
+        req = Request.blank('/v1/a/c/manifest2',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/plain',
+                                     'X-Object-Manifest': 'nosuch/seg'},
+                            body='')
+        self.assertEquals(req.get_response(prosrv).status_int, 201)
+        req = Request.blank('/v1/a/c/manifest2')
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+
+    def _test_PUT_copy(self, state):
+        prosrv = state.servers[0]
+        req = Request.blank('/v1/a/c/copy_src',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/x-src',
+                                     'X-Object-Meta-Color': 'blue'},
+                            body='source data')
+        self.assertEquals(req.get_response(prosrv).status_int, 201)
+
+        # The data does not go through a GET.
+        orig_get = lfs.LFSObjectController.GET
+        lfs.LFSObjectController.GET = None
+        try:
+            req = Request.blank('/v1/a/c/copy_dst',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Length': '0',
+                                         'X-Copy-From': 'c/copy_src',
+                                         'X-Object-Meta-Size': 'L'})
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int, 201)
+            self.assertEquals(res.headers['X-Copied-From'], 'c/copy_src')
+            self.assertEquals(res.etag, md5('source data').hexdigest())
+            req = Request.blank('/v1/a/c/copy_src',
+                                environ={'REQUEST_METHOD': 'COPY'},
+                                headers={'Destination': 'c/copy_dst2'})
+            self.assertEquals(req.get_response(prosrv).status_int, 201)
+            req = Request.blank('/v1/a/c/copy_dst3',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Length': '0',
+                                         'X-Copy-From': 'c/nosuch'})
+            self.assertEquals(req.get_response(prosrv).status_int, 404)
+        finally:
+            lfs.LFSObjectController.GET = orig_get
+        for name in ('copy_dst', 'copy_dst2'):
+            req = Request.blank('/v1/a/c/' + name)
+            self.assertEquals(req.get_response(prosrv).body, 'source data')
+        return prosrv
+
+    def test_PUT_copy(self):
+        self._test_PUT_copy(_sg)
+        prosrv = self._test_PUT_copy(_sp)
+        # Gluster metadata does not survive the xattr fakes.
+        res = Request.blank('/v1/a/c/copy_dst').get_response(prosrv)
+        self.assertEquals(res.headers['Content-Type'], 'text/x-src')
+        self.assertEquals(res.headers['X-Object-Meta-Color'], 'blue')
+        self.assertEquals(res.headers['X-Object-Meta-Size'], 'L')
+        src = _sp.plugin_class(prosrv, 'a', 'c', 'copy_src', False)
+        dst = _sp.plugin_class(prosrv, 'a', 'c', 'copy_dst', False)
+        self.assertEquals(os.stat(src.data_file).st_ino,
+                          os.stat(dst.data_file).st_ino)
+
+    def test_container_info_cached(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/cached'
+        self._put_objects(prosrv, path, ['o1'])
+        lookups = []
+        orig_get_pbroker = lfs.get_pbroker
+
+        def get_pbroker(app, plugin_class, account, container, obj, keep):
+            lookups.append((container, obj))
+            return orig_get_pbroker(app, plugin_class, account, container,
+                                    obj, keep)
+
+        lfs.get_pbroker = get_pbroker
+        prosrv.lfs_cache.ttl = 5
+        try:
+            for i in xrange(3):
+                req = Request.blank(path + '/o1',
+                                    environ={'REQUEST_METHOD': 'HEAD'})
+                self.assertEquals(req.get_response(prosrv).status_int, 204)
+            # The first one looks up the container, then it is cached.
+            self.assertEquals(lookups,
+                              [('cached', None)] + [('cached', 'o1')] * 3)
+
+            # The worker that deletes the container sees it gone at once.
+            req = Request.blank(path + '/o1',
+                                environ={'REQUEST_METHOD': 'DELETE'})
+            self.assertEquals(req.get_response(prosrv).status_int, 204)
+            req = Request.blank(path, environ={'REQUEST_METHOD': 'DELETE'})
+            self.assertEquals(req.get_response(prosrv).status_int, 204)
+            req = Request.blank(path + '/o2',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Type': 'text/plain'},
+                                body='o2')
+            self.assertEquals(req.get_response(prosrv).status_int, 404)
+        finally:
+            lfs.get_pbroker = orig_get_pbroker
+            prosrv.lfs_cache.ttl = 0
+
+    def test_stats_update_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/stats'
+        req = Request.blank('/v1/a', environ={'REQUEST_METHOD': 'HEAD'})
+        account_bytes = int(req.get_response(prosrv).headers[
+            'X-Account-Bytes-Used'])
+        self._put_objects(prosrv, path, ['o1', 'o22'])
+        # An overwrite changes the bytes only.
+        req = Request.blank(path + '/o1', environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'text/plain'},
+                            body='o111')
+        self.assertEquals(req.get_response(prosrv).status_int, 201)
+        self.assertEquals(prosrv.lfs_stats.pending[('a', 'stats')], [2, 7])
+        # Other tests leave their writes to the account pending as well.
+        account_bytes += sum(bytes_delta for (account, _junk), (_junk,
+                             bytes_delta) in prosrv.lfs_stats.pending.items()
+                             if account == 'a')
+
+        prosrv.lfs_stats.flush()
+        self.assertEquals(prosrv.lfs_stats.pending, {})
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'HEAD'})
+        res = req.get_response(prosrv)
+        self.assertEquals(res.headers['X-Container-Object-Count'], '2')
+        self.assertEquals(res.headers['X-Container-Bytes-Used'], '7')
+        req = Request.blank('/v1/a', environ={'REQUEST_METHOD': 'HEAD'})
+        res = req.get_response(prosrv)
+        self.assertEquals(int(res.headers['X-Account-Bytes-Used']),
+                          account_bytes)
+
+    def _test_DELETE(self, state):
+        prosrv = state.servers[0]
+        path = '/v1/a/del'
+        self._put_objects(prosrv, path, ['o1', 'o2'])
+        req = Request.blank(path + '/o1', environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 204)
+        req = Request.blank(path + '/o1')
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+        req = Request.blank(path + '/o1', environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+        req = Request.blank(path + '/o2', environ={'REQUEST_METHOD': 'DELETE'},
+                            headers={'X-If-Delete-At': '1'})
+        self.assertEquals(req.get_response(prosrv).status_int, 412)
+
+        # Only an empty container goes.
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 409)
+        req = Request.blank(path + '/o2', environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 204)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 204)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'HEAD'})
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 404)
+        return prosrv
+
+    def test_DELETE(self):
+        self._test_DELETE(_sg)
+        prosrv = self._test_DELETE(_sp)
+        req = Request.blank('/v1/a?format=json')
+        self.assert_('del' not in [c['name'] for c in
+                                   json.loads(req.get_response(prosrv).body)])
+
+    def test_DELETE_tombstone_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/tomb'
+        self._put_objects(prosrv, path, ['o1'])
+        pending = list(prosrv.lfs_stats.pending.get(('a', 'tomb'), [0, 0]))
+        req = Request.blank(path + '/o1', environ={'REQUEST_METHOD': 'DELETE'})
+        self.assertEquals(req.get_response(prosrv).status_int, 204)
+        pbroker = _sp.plugin_class(prosrv, 'a', 'tomb', 'o1', False)
+        self.assertFalse(pbroker.exists())
+        self.assertEquals(pbroker.metadata, {'deleted': True})
+        files = os.listdir(pbroker.datadir)
+        self.assertEquals(len(files), 1)
+        self.assert_(files[0].endswith('.ts'))
+        self.assertEquals(prosrv.lfs_stats.pending[('a', 'tomb')],
+                          [pending[0] - 1, pending[1] - 2])
+        req = Request.blank(path + '?format=json')
+        self.assertEquals(json.loads(req.get_response(prosrv).body), [])
+
+        # A new PUT over the tombstone.
+        self._put_objects(prosrv, path, ['o1'])
+        req = Request.blank(path + '/o1')
+        self.assertEquals(req.get_response(prosrv).body, 'o1')
+
+    def test_BULK_DELETE_unauthorized_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/bulkdelauth'
+        self._put_objects(prosrv, path, ['o1', 'o2'])
+        called = []
+
+        def authorize(req):
+            called.append(req.method)
+            return HTTPForbidden(request=req)
+
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'BULK_DELETE',
+                                           'swift.authorize': authorize},
+                            body=json.dumps(['o1', 'o2']))
+        self.assertEquals(req.get_response(prosrv).status_int, 403)
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'DELETE',
+                                           'swift.authorize': authorize})
+        self.assertEquals(req.get_response(prosrv).status_int, 403)
+        self.assertEquals(called, ['BULK_DELETE', 'DELETE'])
+        req = Request.blank(path + '?format=json')
+        self.assertEquals(
+            [o['name'] for o in json.loads(req.get_response(prosrv).body)],
+            ['o1', 'o2'])
+
+    def test_BULK_DELETE_posix(self):
+        prosrv = _sp.servers[0]
+        path = '/v1/a/bulkdel'
+        names = ['o%d' % i for i in xrange(lfs.LFS_DELETE_BATCH + 5)]
+        self._put_objects(prosrv, path, names)
+        req = Request.blank(path + '/o1', environ={'REQUEST_METHOD': 'POST'},
+                            headers={'X-Delete-At': str(int(time.time()) + 1000)})
+        self.assertEquals(req.get_response(prosrv).status_int, 202)
+        unscheduled = []
+        orig_unschedule = prosrv.lfs_expiry.unschedule
+        prosrv.lfs_expiry.unschedule = \
+            lambda delete_at, a, c, o: unscheduled.append(o)
+        try:
+            req = Request.blank(path, environ={'REQUEST_METHOD': 'BULK_DELETE'},
+                                body=json.dumps(names + ['nosuch']))
+            res = req.get_response(prosrv)
+        finally:
+            prosrv.lfs_expiry.unschedule = orig_unschedule
+        self.assertEquals(res.status_int, 200)
+        statuses = json.loads(res.body)
+        self.assertEquals(len(statuses), len(names) + 1)
+        self.assertEquals(statuses['o0'], '204 No Content')
+        self.assertEquals(statuses['nosuch'], '404 Not Found')
+        self.assertEquals(unscheduled, ['o1'])
+        req = Request.blank(path + '?format=json')
+        self.assertEquals(json.loads(req.get_response(prosrv).body), [])
+        req = Request.blank(path, environ={'REQUEST_METHOD': 'BULK_DELETE'},
+                            body='{"not": "a list"}')
+        self.assertEquals(req.get_response(prosrv).status_int, 400)
+
+        # Through the bulk middleware, one subrequest for the container.
+        self._put_objects(prosrv, path, ['x1', 'x2'])
+        calls = []
+
+        def app(env, start_response):
+            calls.append(env['REQUEST_METHOD'])
+            return prosrv(env, start_response)
+
+        bulk_mw = bulk.Bulk(app, {'delete_batch_size': '10'})
+        req = Request.blank('/v1/a?bulk-delete',
+                            environ={'REQUEST_METHOD': 'DELETE'},
+                            headers={'Accept': 'application/json'},
+                            body='/bulkdel/x1\n/bulkdel/x2\n/bulkdel/x3\n'
+                                 '/bulkdel\n')
+        res = req.get_response(bulk_mw)
+        resp_body = json.loads(res.body)
+        self.assertEquals(resp_body['Number Deleted'], 3)
+        self.assertEquals(resp_body['Number Not Found'], 1)
+        self.assertEquals(calls, ['BULK_DELETE', 'DELETE'])
 
     # XXX Test that numbers of objects are updated in containers
     # XXX Test that numbers of containers are updated in accounts
@@ -524,6 +1206,860 @@ class TestProxyServerLFS(unittest.TestCase):
     # XXX write a test for container listings with marker and delimiter 4.2.1.3
     # XXX Test lists of objects (delimiter and marker)
 
+class TestLFSPosixLayout(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.app = proxy_server.Application(
+            {'lfs_mode': 'posix', 'lfs_root': self.testdir},
+            FakeMemcache(), FakeLogger(), FakeRing(), FakeRing(), FakeRing())
+        self.cont_path = os.path.join(self.testdir, 'a', 'c')
+        for obj in ('a', 'b', 'a/c'):
+            self._put(obj, '1.00000', obj)
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    def _put(self, obj, timestamp, body):
+        pbroker = LFSPluginPosix(self.app, 'a', 'c', obj, False)
+        if not os.path.exists(os.path.join(self.testdir, 'a', 'c')):
+            LFSPluginPosix(self.app, 'a', None, None, False).initialize(
+                timestamp)
+            LFSPluginPosix(self.app, 'a', 'c', None, False).initialize(
+                timestamp)
+        pbroker.initialize(timestamp)
+        with pbroker.mkstemp() as fd:
+            os.write(fd, body)
+            pbroker.put(fd, {'X-Timestamp': timestamp,
+                             'Content-Type': 'text/plain',
+                             'ETag': md5(body).hexdigest(),
+                             'Content-Length': str(len(body))})
+
+    def _read(self, obj):
+        pbroker = LFSPluginPosix(self.app, 'a', 'c', obj, True)
+        return ''.join(pbroker)
+
+    def test_migrate(self):
+        self.assertEquals(lfs_posix.read_layout(self.cont_path), 'flat')
+        orig_migrate_object = lfs_posix.migrate_object
+
+        def migrate_object(cont_path, obj):
+            if obj != 'a' or moved_a:
+                return orig_migrate_object(cont_path, obj)
+            self.assertEquals(lfs_posix.read_layout(cont_path), 'migrating')
+            # A writer finds the flat path, and the object moves under it.
+            pbroker = LFSPluginPosix(self.app, 'a', 'c', 'a', False)
+            moved_a.append(orig_migrate_object(cont_path, obj))
+            self.assertEquals(self._read('a'), 'a')
+            with pbroker.mkstemp() as fd:
+                os.write(fd, 'a2')
+                pbroker.put(fd, {'X-Timestamp': '2.00000',
+                                 'Content-Type': 'text/plain',
+                                 'ETag': md5('a2').hexdigest(),
+                                 'Content-Length': '2'})
+            return moved_a[0]
+
+        moved_a = []
+        lfs_posix.migrate_object = migrate_object
+        try:
+            # The second pass moves the new version of a.
+            self.assertEquals(lfs_posix.migrate_container(self.cont_path), 4)
+        finally:
+            lfs_posix.migrate_object = orig_migrate_object
+        self.assertEquals(lfs_posix.read_layout(self.cont_path), 'hashed')
+        self.assertEquals(self._read('a'), 'a2')
+        self.assertEquals(self._read('a/c'), 'a/c')
+        self.assertEquals(self._read('b'), 'b')
+        # Only the fan-out directories, the index and the layout are left.
+        self.assertEquals(
+            sorted(name for name in os.listdir(self.cont_path)
+                   if len(name) != 2),
+            sorted([INDEX_NAME, lfs_posix.LAYOUT_FILE]))
+        self.assertEquals(sorted(lfs_posix.scan_object_names(
+            self.cont_path)), ['a', 'a/c', 'b'])
+        self.assertEquals(lfs_posix.migrate_container(self.cont_path), 0)
+
+    def test_layout_rewritten_elsewhere(self):
+        lfs_posix.write_layout(self.cont_path, 'hashed')
+        self.assertEquals(lfs_posix.read_layout(self.cont_path), 'hashed')
+        # Another worker deletes the container and recreates it flat.
+        os.unlink(os.path.join(self.cont_path, lfs_posix.LAYOUT_FILE))
+        self.assertEquals(lfs_posix.read_layout(self.cont_path), 'flat')
+
+    def test_merge_into_hashed(self):
+        lfs_posix.write_layout(self.cont_path, 'migrating')
+        # Written hashed while its flat copy was still there.
+        hashed_path = lfs_posix.hashed_object_path(self.cont_path, 'a')
+        os.makedirs(hashed_path)
+        self._put('a', '2.00000', 'a2')
+        self.assertEquals(
+            LFSPluginPosix(self.app, 'a', 'c', 'a', False).datadir,
+            hashed_path)
+        self.assert_(lfs_posix.migrate_object(self.cont_path, 'a'))
+        self.assertEquals(self._read('a'), 'a2')
+        self.assertEquals(len(os.listdir(hashed_path)), 4)
+        self.assertFalse(lfs_posix.migrate_object(self.cont_path, 'a'))
+
+
+class TestLFSPosixMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.path = '/lfs/metadata/%s' % self.id()
+        self.metadata = {'X-Timestamp': '1.00000',
+                         'X-Container-Meta-Color': ('blue', '1.00000'),
+                         'X-Object-Count': (3, 0),
+                         'X-Container-Meta-Long': ('x' * 1000, '1.00000')}
+
+    def test_one_xattr(self):
+        lfs_posix.write_metadata(self.path, self.metadata)
+        gets = _xattr_op_cnt['get']
+        metadata = lfs_posix.read_metadata(self.path)
+        self.assertEquals(_xattr_op_cnt['get'] - gets, 1)
+        self.assertEquals(metadata, self.metadata)
+        self.assert_(isinstance(metadata.keys()[0], str))
+        self.assert_(isinstance(metadata['X-Container-Meta-Color'][0], str))
+
+    def test_chunked_when_too_big(self):
+        orig_setxattr = xattr.setxattr
+
+        def small_setxattr(path, key, value):
+            if len(value) > lfs_posix.METADATA_CHUNK_SIZE + 10:
+                err = IOError()
+                err.errno = errno.E2BIG
+                raise err
+            orig_setxattr(path, key, value)
+        xattr.setxattr = small_setxattr
+        orig_chunk_size = lfs_posix.METADATA_CHUNK_SIZE
+        lfs_posix.METADATA_CHUNK_SIZE = 400
+        try:
+            lfs_posix.write_metadata(self.path, self.metadata)
+            gets = _xattr_op_cnt['get']
+            self.assertEquals(lfs_posix.read_metadata(self.path),
+                              self.metadata)
+            # Three chunks, and no probe for a fourth one.
+            self.assertEquals(_xattr_op_cnt['get'] - gets, 3)
+        finally:
+            xattr.setxattr = orig_setxattr
+            lfs_posix.METADATA_CHUNK_SIZE = orig_chunk_size
+
+    def test_legacy_pickle(self):
+        metastr = pickle.dumps(self.metadata, lfs_posix.PICKLE_PROTOCOL)
+        key = 0
+        while metastr:
+            xattr.setxattr(self.path, '%s%s' % (lfs_posix.METADATA_KEY,
+                                                key or ''), metastr[:254])
+            metastr = metastr[254:]
+            key += 1
+        self.assertEquals(lfs_posix.read_metadata(self.path), self.metadata)
+        # Rewriting converts it, and the new format takes precedence.
+        self.metadata['X-Timestamp'] = '2.00000'
+        lfs_posix.write_metadata(self.path, self.metadata)
+        self.assertEquals(lfs_posix.read_metadata(self.path), self.metadata)
+
+    def test_no_metadata(self):
+        self.assertEquals(lfs_posix.read_metadata(self.path), {})
+
+
+class TestLFSPosixStats(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.logger = FakeLogger()
+        self.app = proxy_server.Application(
+            {'lfs_mode': 'posix', 'lfs_root': self.testdir},
+            FakeMemcache(), self.logger, FakeRing(), FakeRing(), FakeRing())
+        LFSPluginPosix(self.app, 'a', None, None, False).initialize('1.00000')
+        LFSPluginPosix(self.app, 'a', 'c', None, False).initialize('1.00000')
+        self.pbroker = LFSPluginPosix(self.app, 'a', 'c', None, False)
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    @contextmanager
+    def _locked(self):
+        # Another proxy worker in the middle of an update.
+        fd = os.open(os.path.join(self.pbroker.datadir, '.lock'),
+                     os.O_WRONLY | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def test_waits_in_hub(self):
+        self.assertEquals(self.app.lfs_threadpools.threads_per_mount, 0)
+        with self._locked():
+            update = spawn(self.pbroker.update_stats, 1, 10)
+            # Only returns if the update yields while it waits.
+            sleep(0.05)
+            self.assertEquals(self.pbroker._read_stats(), (0, 0))
+        update.wait()
+        self.assertEquals(self.pbroker._read_stats(), (1, 10))
+
+    def test_lock_timeout(self):
+        orig_timeout = lfs_posix.STATS_LOCK_TIMEOUT
+        lfs_posix.STATS_LOCK_TIMEOUT = 0.05
+        try:
+            with self._locked():
+                self.assertRaises(LockTimeout, self.pbroker.update_stats,
+                                  1, 10)
+        finally:
+            lfs_posix.STATS_LOCK_TIMEOUT = orig_timeout
+        self.assertEquals(self.pbroker._read_stats(), (0, 0))
+
+    def test_clamps_with_warning(self):
+        self.pbroker.update_stats(1, 10)
+        self.assertEquals(self.logger.log_dict['warning'], [])
+        self.pbroker.update_stats(-2, -5)
+        self.assertEquals(self.pbroker._read_stats(), (0, 5))
+        self.assertEquals(len(self.logger.log_dict['warning']), 1)
+
+
+class TestLFSThreadPools(unittest.TestCase):
+
+    def test_run_in_thread(self):
+        pools = lfs.LFSThreadPools(2, FakeLogger())
+        self.assertEquals(pools.run_in_thread('/m', lambda x: x + 1, 1), 2)
+        self.assertRaises(ZeroDivisionError, pools.run_in_thread, '/m',
+                          lambda: 1 / 0)
+        self.assert_(pools.get('/m') is pools.get('/m'))
+        self.assertEquals(pools.stats('/m'),
+                          {'threads': 2, 'depth': 0, 'max_depth': 1,
+                           'queued': 0})
+        self.assertEquals(pools.stats('/other')['max_depth'], 0)
+
+    def test_queue_depth(self):
+        logger = FakeLogger()
+        pools = lfs.LFSThreadPools(1, logger)
+        gate = threading.Event()
+        waiters = [spawn(pools.run_in_thread, '/m', gate.wait)
+                   for _junk in xrange(3)]
+        sleep(0.01)
+        stats = pools.stats('/m')
+        self.assertEquals(stats['depth'], 3)
+        self.assertEquals(stats['queued'], 2)
+        gate.set()
+        for waiter in waiters:
+            waiter.wait()
+        self.assertEquals(pools.stats('/m')['depth'], 0)
+        self.assertEquals(pools.stats('/m')['max_depth'], 3)
+        self.assertEquals(
+            logger.get_increments().count('lfs.threadpool.queued'), 2)
+
+    def test_report(self):
+        logger = FakeLogger()
+        pools = lfs.LFSThreadPools(1, logger)
+        pools.report()
+        self.assertEquals(logger.log_dict['gauge'], [])
+        gate = threading.Event()
+        waiters = [spawn(pools.run_in_thread, '/m', gate.wait)
+                   for _junk in xrange(3)]
+        sleep(0.01)
+        pools.run_in_thread('/n', lambda: None)
+        pools.report()
+        self.assertEquals(logger.log_dict['gauge'],
+                          [(('lfs.threadpool.depth', 3), {}),
+                           (('lfs.threadpool.max_depth', 3), {})])
+        gate.set()
+        for waiter in waiters:
+            waiter.wait()
+        # The highest depth is the one since the last report.
+        pools.report()
+        self.assertEquals(logger.log_dict['gauge'][2:],
+                          [(('lfs.threadpool.depth', 0), {}),
+                           (('lfs.threadpool.max_depth', 3), {})])
+        pools.report()
+        self.assertEquals(logger.log_dict['gauge'][4:],
+                          [(('lfs.threadpool.depth', 0), {}),
+                           (('lfs.threadpool.max_depth', 0), {})])
+
+    def test_reporter(self):
+        logger = FakeLogger()
+        pools = lfs.LFSThreadPools(1, logger, 0.01)
+        self.assertEquals(pools.reporter, None)
+        pools.run_in_thread('/m', lambda: None)
+        try:
+            sleep(0.05)
+            self.assert_(('lfs.threadpool.depth', 0) in
+                         [args for args, kwargs in logger.log_dict['gauge']])
+        finally:
+            pools.reporter.kill()
+
+    def test_threaded_broker(self):
+        class Broker(object):
+            metadata = {'ETag': 'x'}
+
+            def exists(self):
+                return threading.current_thread().name
+
+            def iter_objects(self):
+                for i in xrange(250):
+                    yield i
+
+            def __iter__(self):
+                return iter(['ab', 'cd'])
+
+        pools = lfs.LFSThreadPools(1, FakeLogger())
+        pbroker = lfs.LFSThreadedBroker(Broker(), pools, '/m')
+        self.assertEquals(pbroker.metadata, {'ETag': 'x'})
+        self.assertNotEquals(pbroker.exists(),
+                             threading.current_thread().name)
+        self.assertEquals(list(pbroker.iter_objects()), range(250))
+        self.assertEquals(list(pbroker), ['ab', 'cd'])
+        self.assertRaises(AttributeError, getattr, pbroker, 'app_iter_range')
+
+
+class TestLFSPipelinedWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    @contextmanager
+    def _mkstemp(self):
+        fd = os.open(os.path.join(self.testdir, 'tmp'),
+                     os.O_RDWR | os.O_CREAT)
+        try:
+            yield fd
+        finally:
+            os.close(fd)
+
+    def test_writes_and_syncs(self):
+        finalized = []
+        pools = lfs.LFSThreadPools(1, FakeLogger())
+        with lfs_writer(self._mkstemp,
+                        lambda fd, md: finalized.append(md)) as writer:
+            syncs = []
+            orig_sync = writer.sync
+            writer.sync = lambda: syncs.append(writer.upload_size) or \
+                orig_sync()
+            pipe = lfs.LFSPipelinedWriter(
+                writer, pools, '/m', 4,
+                lfs_checksum.get_checksum_engine('crc32'))
+            for chunk in ('ab', 'cd', 'ef', 'g'):
+                pipe.write(chunk)
+            pipe.put({'X-Timestamp': '1'})
+        self.assertEquals(syncs, [4])
+        self.assertEquals(pipe.etag.hexdigest(), md5('abcdefg').hexdigest())
+        self.assertEquals(pipe.checksum_header(),
+                          'crc32:%08x' % (zlib.crc32('abcdefg') & 0xffffffff))
+        self.assertEquals(finalized, [{'X-Timestamp': '1'}])
+        with open(os.path.join(self.testdir, 'tmp')) as fp:
+            self.assertEquals(fp.read(), 'abcdefg')
+
+    def test_write_error(self):
+        pools = lfs.LFSThreadPools(1, FakeLogger())
+        with lfs_writer(self._mkstemp, lambda fd, md: None) as writer:
+            def bad_write(chunk):
+                raise OSError(errno.EIO, 'nope')
+            writer.write = bad_write
+            pipe = lfs.LFSPipelinedWriter(writer, pools, '/m', 4)
+            pipe.write('ab')
+            self.assertRaises(OSError, pipe.close)
+            self.assertRaises(OSError, pipe.write, 'cd')
+
+    def test_preallocates(self):
+        allocated = []
+        orig_fallocate = lfs_writer_module.fallocate
+        lfs_writer_module.fallocate = \
+            lambda fd, size: allocated.append(size)
+        try:
+            with lfs_writer(self._mkstemp, None, 10):
+                pass
+            with lfs_writer(self._mkstemp, None):
+                pass
+            self.assertEquals(allocated, [10])
+
+            def no_space(fd, size):
+                raise OSError(errno.ENOSPC, 'full')
+            lfs_writer_module.fallocate = no_space
+            try:
+                with lfs_writer(self._mkstemp, None, 10):
+                    pass
+            except DiskFileNoSpace:
+                pass
+            else:
+                self.fail('DiskFileNoSpace not raised')
+        finally:
+            lfs_writer_module.fallocate = orig_fallocate
+
+    def test_PUT_no_space(self):
+        prosrv = _sp.servers[0]
+        req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'PUT'})
+        self.assertEquals(req.get_response(prosrv).status_int // 100, 2)
+
+        def no_space(fd, size):
+            raise OSError(errno.ENOSPC, 'full')
+        orig_fallocate = lfs_writer_module.fallocate
+        lfs_writer_module.fallocate = no_space
+        try:
+            req = Request.blank('/v1/a/c/nospace',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Type': 'text/plain'},
+                                body='abc')
+            self.assertEquals(req.get_response(prosrv).status_int, 507)
+        finally:
+            lfs_writer_module.fallocate = orig_fallocate
+        self.assertEquals(os.listdir(os.path.join(_sp.testdir, 'tmp')), [])
+
+    def test_PUT_checksum(self):
+        prosrv = _sp.servers[0]
+        req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'PUT'})
+        self.assertEquals(req.get_response(prosrv).status_int // 100, 2)
+        prosrv.lfs_checksum = lfs_checksum.get_checksum_engine('crc32')
+        try:
+            req = Request.blank('/v1/a/c/summed',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Content-Type': 'text/plain'},
+                                body='abc')
+            res = req.get_response(prosrv)
+            self.assertEquals(res.status_int, 201)
+            self.assertEquals(res.etag, md5('abc').hexdigest())
+        finally:
+            prosrv.lfs_checksum = (None, None)
+        req = Request.blank('/v1/a/c/summed')
+        res = req.get_response(prosrv)
+        self.assertEquals(res.body, 'abc')
+        self.assertEquals(res.headers[lfs_checksum.CHECKSUM_HEADER],
+                          'crc32:%08x' % (zlib.crc32('abc') & 0xffffffff))
+
+
+class TestLFSChecksum(unittest.TestCase):
+
+    def test_engines(self):
+        for name in ('md5', 'crc32', 'crc32c', 'xxhash'):
+            used, factory = lfs_checksum.get_checksum_engine(name)
+            checksum = factory()
+            checksum.update('ab')
+            checksum.update('c')
+            whole = factory()
+            whole.update('abc')
+            self.assertEquals(checksum.hexdigest(), whole.hexdigest())
+        self.assertEquals(lfs_checksum.get_checksum_engine(''), (None, None))
+        self.assertEquals(lfs_checksum.get_checksum_engine('none'),
+                          (None, None))
+        self.assertRaises(ValueError, lfs_checksum.get_checksum_engine,
+                          'sha0')
+
+    def test_fallback(self):
+        logger = FakeLogger()
+        orig_engine = lfs_checksum.CHECKSUM_ENGINES['xxhash']
+        lfs_checksum.CHECKSUM_ENGINES['xxhash'] = None
+        try:
+            used, factory = lfs_checksum.get_checksum_engine('xxhash', logger)
+        finally:
+            lfs_checksum.CHECKSUM_ENGINES['xxhash'] = orig_engine
+        self.assertEquals(used, lfs_checksum.FALLBACK_ENGINE)
+        self.assertEquals(factory, lfs_checksum.ZlibCRC32)
+        self.assertEquals(len(logger.log_dict['warning']), 1)
+
+
+class TestLFSExpiryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    def test_schedule(self):
+        expiry = lfs_expirer.LFSExpiryIndex(self.testdir, 100)
+        self.assertEquals(expiry.buckets(), [])
+        expiry.schedule(250, 'a', 'c', 'o1')
+        expiry.schedule(220, 'a', 'c', 'o/2')
+        expiry.schedule(310, 'a', 'c', 'o3')
+        expiry.unschedule(999, 'a', 'c', 'o3')
+        self.assertEquals(expiry.buckets(), [200, 300])
+        self.assertEquals(list(expiry.iter_due(200, 230)),
+                          [(220, 'a/c/o/2', '0000000220-a/c/o/2')])
+        self.assertEquals([actual for _junk, actual, _junk in
+                           expiry.iter_due(200, 400)], ['a/c/o/2', 'a/c/o1'])
+        expiry.unschedule(220, 'a', 'c', 'o/2')
+        expiry.remove(200, '0000000250-a/c/o1')
+        self.assertEquals(list(expiry.iter_due(200, 400)), [])
+        self.assertFalse(expiry.prune(300, 400))
+        self.assertFalse(expiry.prune(200, 250))
+        self.assertTrue(expiry.prune(200, 300))
+        self.assertEquals(expiry.buckets(), [300])
+
+    def test_iter_due_batches(self):
+        expiry = lfs_expirer.LFSExpiryIndex(self.testdir, 100)
+        orig_batch = lfs_expirer.EXPIRY_BATCH
+        lfs_expirer.EXPIRY_BATCH = 2
+        try:
+            for i in xrange(5):
+                expiry.schedule(200 + i, 'a', 'c', 'o%d' % i)
+            self.assertEquals([delete_at for delete_at, _junk, _junk in
+                               expiry.iter_due(200, 203)],
+                              [200, 201, 202, 203])
+        finally:
+            lfs_expirer.EXPIRY_BATCH = orig_batch
+
+    def test_is_expired(self):
+        self.assertFalse(lfs_expirer.is_expired({}))
+        self.assertTrue(lfs_expirer.is_expired({'X-Delete-At': '1'}))
+        self.assertFalse(lfs_expirer.is_expired({'X-Delete-At': '%d' % (
+            time.time() + 100)}))
+
+
+class TestLFSCopy(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.src = os.path.join(self.testdir, 'src')
+        with open(self.src, 'w') as fp:
+            fp.write('x' * 1000)
+        self.dst = os.path.join(self.testdir, 'dst')
+        self.fd = os.open(self.dst, os.O_RDWR | os.O_CREAT)
+
+    def tearDown(self):
+        os.close(self.fd)
+        rmtree(self.testdir)
+
+    def _read_dst(self):
+        with open(self.dst) as fp:
+            return fp.read()
+
+    def test_link(self):
+        self.assertEquals(lfs_copy.copy_file(self.src, self.dst, self.fd,
+                                             link=True), 'link')
+        self.assertEquals(os.stat(self.src).st_ino,
+                          os.stat(self.dst).st_ino)
+
+    def test_copy(self):
+        how = lfs_copy.copy_file(self.src, self.dst, self.fd)
+        self.assert_(how in ('reflink', 'copy_file_range', 'copy'))
+        self.assertNotEquals(os.stat(self.src).st_ino,
+                             os.stat(self.dst).st_ino)
+        self.assertEquals(self._read_dst(), 'x' * 1000)
+
+    def test_fallbacks(self):
+        def no_link(src, dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        orig_link = os.link
+        orig_reflink = lfs_copy.reflink
+        orig_copy_file_range = lfs_copy._copy_file_range
+        orig_chunk_size = lfs_copy.COPY_CHUNK_SIZE
+        os.link = no_link
+        lfs_copy.reflink = lambda src_fd, dst_fd: False
+        lfs_copy._copy_file_range = lfs_copy.noop_libc_function
+        lfs_copy.COPY_CHUNK_SIZE = 300
+        try:
+            self.assertEquals(lfs_copy.copy_file(self.src, self.dst, self.fd,
+                                                 link=True), 'copy')
+        finally:
+            os.link = orig_link
+            lfs_copy.reflink = orig_reflink
+            lfs_copy._copy_file_range = orig_copy_file_range
+            lfs_copy.COPY_CHUNK_SIZE = orig_chunk_size
+        self.assertEquals(self._read_dst(), 'x' * 1000)
+
+    def test_copy_range_short(self):
+        counts = []
+
+        def copy_file_range(src_fd, src_off, dst_fd, dst_off, size, flags):
+            return counts.pop(0)
+
+        orig_reflink = lfs_copy.reflink
+        orig_copy_file_range = lfs_copy._copy_file_range
+        lfs_copy.reflink = lambda src_fd, dst_fd: False
+        lfs_copy._copy_file_range = copy_file_range
+        try:
+            # Nothing copied at all: the plain copy takes over.
+            counts.append(0)
+            self.assertEquals(lfs_copy.copy_file(self.src, self.dst,
+                                                 self.fd), 'copy')
+            self.assertEquals(self._read_dst(), 'x' * 1000)
+            # The source got shorter under way.
+            counts.extend([300, 0])
+            with open(self.src) as fp:
+                self.assertRaises(OSError, lfs_copy.copy_range,
+                                  fp.fileno(), self.fd, 1000)
+        finally:
+            lfs_copy.reflink = orig_reflink
+            lfs_copy._copy_file_range = orig_copy_file_range
+
+
+class TestLFSStatsUpdater(unittest.TestCase):
+
+    class FakeBroker(object):
+
+        def __init__(self, updates, account, container):
+            self.updates = updates
+            self.key = (account, container)
+
+        def exists(self):
+            return True
+
+        def update_stats(self, object_delta, bytes_delta):
+            if self.key in self.failures:
+                self.failures.remove(self.key)
+                raise OSError(errno.EIO, 'update failed')
+            self.updates.append((self.key, object_delta, bytes_delta))
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.updates = []
+        self.FakeBroker.failures = self.failures = []
+        updates = self.updates
+        broker = self.FakeBroker
+
+        def plugin_class(app, account, container, obj, keep):
+            return broker(updates, account, container)
+
+        self.plugin_class = plugin_class
+        self.app = proxy_server.Application(
+            {'lfs_mode': 'posix', 'lfs_root': self.testdir},
+            FakeMemcache(), FakeLogger(), FakeRing(), FakeRing(), FakeRing())
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    def _updater(self):
+        return lfs_updater.LFSStatsUpdater(self.app, self.plugin_class, 0)
+
+    def test_coalesces(self):
+        updater = self._updater()
+        updater.record('a', 'c1', 1, 10)
+        updater.record('a', 'c1', 1, 5)
+        updater.record('a', 'c2', 1, 1)
+        updater.record('a', 'c2', -1, -1)
+        updater.record('b', 'c1', 0, 0)
+        self.assertEquals(updater.flush(), 1)
+        self.assertEquals(self.updates, [(('a', 'c1'), 2, 15),
+                                         (('a', None), 2, 15)])
+        with open(updater.journal_path) as fp:
+            self.assertEquals(fp.read(), '')
+
+    def test_keeps_failed_updates(self):
+        updater = self._updater()
+        updater.record('a', 'c1', 1, 10)
+        updater.record('a', 'c2', 1, 5)
+        updater.record('b', 'c1', 1, 1)
+        self.failures.extend([('a', 'c1'), ('b', None)])
+        self.assertEquals(updater.flush(), 2)
+        self.assertEquals(sorted(self.updates), [(('a', None), 1, 5),
+                                                 (('a', 'c2'), 1, 5),
+                                                 (('b', 'c1'), 1, 1)])
+        self.assertEquals(updater.pending, {('a', 'c1'): [1, 10],
+                                            ('b', None): [1, 1]})
+        # The journal keeps them too, for a process that takes it over.
+        os.close(updater.journal_fd)
+        updater = self._updater()
+        updater.record('a', 'c3', 0, 1)
+        self.assertEquals(updater.pending, {('a', 'c1'): [1, 10],
+                                            ('b', None): [1, 1],
+                                            ('a', 'c3'): [0, 1]})
+        del self.updates[:]
+        self.assertEquals(updater.flush(), 2)
+        self.assertEquals(sorted(self.updates), [(('a', None), 1, 11),
+                                                 (('a', 'c1'), 1, 10),
+                                                 (('a', 'c3'), 0, 1),
+                                                 (('b', None), 1, 1)])
+        self.assertEquals(updater.pending, {})
+
+    def test_replays_dead_journal(self):
+        dead = self._updater()
+        dead.record('a', 'c', 1, 10)
+        dead.record('a', 'c', 1, 20)
+        # The process of dead goes away with its journal unflushed.
+        os.close(dead.journal_fd)
+        updater = self._updater()
+        updater.record('a', 'c', 1, 1)
+        self.assertFalse(os.path.exists(dead.journal_path))
+        self.assertEquals(updater.pending, {('a', 'c'): [3, 31]})
+        # A live journal is left alone.
+        self.assertEquals(self._updater().flush(), 0)
+        self.assert_(os.path.exists(updater.journal_path))
+        updater.flush()
+        self.assertEquals(self.updates, [(('a', 'c'), 3, 31),
+                                         (('a', None), 3, 31)])
+
+
+class TestLFSInfoCache(unittest.TestCase):
+
+    def test_ttl(self):
+        cache = lfs_cache.LFSInfoCache(5)
+        key = lfs_cache.cache_key('a', 'c')
+        self.assertEquals(key, 'a/c')
+        self.assertEquals(cache.get(key), None)
+        self.assert_(cache.set(key, {'status': 200}, cache.generation(key)))
+        self.assertEquals(cache.get(key), {'status': 200})
+        orig_time = lfs_cache.time.time
+        lfs_cache.time.time = lambda: orig_time() + 10
+        try:
+            self.assertEquals(cache.get(key), None)
+        finally:
+            lfs_cache.time.time = orig_time
+        self.assertEquals(len(cache.entries), 0)
+
+        cache = lfs_cache.LFSInfoCache(0)
+        self.assertFalse(cache.set(key, {'status': 200}, 0))
+        self.assertEquals(cache.get(key), None)
+
+    def test_generation(self):
+        cache = lfs_cache.LFSInfoCache(5)
+        generation = cache.generation('a/c')
+        # A write lands while the lookup reads the plugin.
+        cache.invalidate('a/c')
+        self.assertFalse(cache.set('a/c', {'status': 404}, generation))
+        self.assertEquals(cache.get('a/c'), None)
+        self.assert_(cache.set('a/c', {'status': 200},
+                               cache.generation('a/c')))
+
+    def test_max_entries(self):
+        cache = lfs_cache.LFSInfoCache(5, max_entries=2)
+        for key in ('a/c1', 'a/c2', 'a/c3'):
+            cache.set(key, key, 0)
+        self.assertEquals(cache.entries.keys(), ['a/c2', 'a/c3'])
+
+    def test_memcache(self):
+        memcache = FakeMemcache()
+        cache1 = lfs_cache.LFSInfoCache(5)
+        cache2 = lfs_cache.LFSInfoCache(5)
+        cache1.set('a/c', {'status': 200}, 0, memcache)
+        self.assertEquals(memcache.keys(), ['lfs/a/c'])
+        self.assertEquals(cache2.get('a/c', memcache), {'status': 200})
+        cache1.invalidate('a/c', memcache)
+        self.assertEquals(memcache.keys(), [])
+        self.assertEquals(cache1.get('a/c', memcache), None)
+
+    def test_container_info(self):
+        testdir = mkdtemp()
+        try:
+            app = proxy_server.Application(
+                {'lfs_mode': 'posix', 'lfs_root': testdir},
+                FakeMemcache(), FakeLogger(), FakeRing(), FakeRing(),
+                FakeRing())
+            self.assertEquals(app.lfs_cache.ttl, 0)
+            app.lfs_cache.ttl = 5
+            exists = []
+
+            class FakeBroker(object):
+                metadata = {}
+
+                def __init__(self, *args):
+                    pass
+
+                def exists(self):
+                    return bool(exists)
+
+            info = lfs.get_container_info(app, FakeBroker, 'a', 'c')
+            self.assertEquals(info['status'], 404)
+            self.assertEquals(len(app.lfs_cache.entries), 0)
+            # Another worker creates the container.
+            exists.append(True)
+            info = lfs.get_container_info(app, FakeBroker, 'a', 'c')
+            self.assertEquals(info['status'], 200)
+            self.assertEquals(app.lfs_cache.get('a/c'), info)
+        finally:
+            rmtree(testdir)
+
+
+class TestLFSBench(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.testdir)
+
+    def test_parse_size(self):
+        self.assertEquals(lfs_bench.parse_size('512'), 512)
+        self.assertEquals(lfs_bench.parse_size('64k'), 65536)
+        self.assertEquals(lfs_bench.parse_size('1M'), 1048576)
+        self.assertRaises(ValueError, lfs_bench.parse_size, 'big')
+
+    def test_percentile(self):
+        latencies = range(100)
+        self.assertEquals(lfs_bench.percentile(latencies, 0.5), 50)
+        self.assertEquals(lfs_bench.percentile(latencies, 0.99), 99)
+        self.assertEquals(lfs_bench.percentile([3], 0.99), 3)
+        self.assertEquals(lfs_bench.percentile([], 0.5), 0.0)
+
+    def test_run(self):
+        profile_dir = os.path.join(self.testdir, 'profile')
+        mkdirs(profile_dir)
+        bench = lfs_bench.LFSBench(
+            {'lfs_mode': 'posix',
+             'lfs_root': os.path.join(self.testdir, 'root')},
+            concurrency=2, profile_dir=profile_dir, logger=FakeLogger())
+        results = list(bench.run([10], [3], lists=2))
+        self.assertEquals([r.phase for r in results], list(lfs_bench.PHASES))
+        self.assertEquals([(r.ops, r.errors) for r in results],
+                          [(3, 0), (3, 0), (3, 0), (2, 0), (3, 0)])
+        for result in results:
+            self.assertEquals((result.size, result.objects), (10, 3))
+            self.assert_(result.ops_per_sec > 0)
+            self.assert_(result.p50 <= result.p99)
+        self.assertEquals(sorted(os.listdir(profile_dir)),
+                          sorted('posix-%s-10-3.prof' % phase
+                                 for phase in lfs_bench.PHASES))
+        # The container is gone again.
+        self.assertEquals(
+            [name for name in os.listdir(
+                os.path.join(self.testdir, 'root', 'bench'))
+             if not name.startswith('.')], [])
+
+
+class TestLFSPluginRegistry(unittest.TestCase):
+
+    def test_load_caches_class(self):
+        registry = lfs.LFSPluginRegistry()
+        orig_load = lfs.load_the_plugin
+        calls = []
+
+        def counting_load(selector):
+            calls.append(selector)
+            return orig_load(selector)
+        lfs.load_the_plugin = counting_load
+        try:
+            self.assertEquals(registry.load('posix'), LFSPluginPosix)
+            self.assertEquals(registry.get('posix'), LFSPluginPosix)
+            self.assertEquals(registry.get('posix'), LFSPluginPosix)
+            self.assertEquals(calls, ['posix'])
+        finally:
+            lfs.load_the_plugin = orig_load
+
+    def test_unknown_plugin(self):
+        registry = lfs.LFSPluginRegistry()
+        self.assertRaises(ValueError, registry.load, 'no-such-plugin')
+
+    def test_incomplete_plugin(self):
+        class HalfPlugin(object):
+            def exists(self):
+                return True
+
+        registry = lfs.LFSPluginRegistry()
+        orig_load = lfs.load_the_plugin
+        lfs.load_the_plugin = lambda selector: HalfPlugin
+        try:
+            self.assertRaises(ValueError, registry.load, 'half')
+        finally:
+            lfs.load_the_plugin = orig_load
+
+    def test_capabilities(self):
+        registry = lfs.LFSPluginRegistry()
+        caps = registry.capabilities('posix')
+        self.assertEquals(sorted(caps.keys()),
+                          sorted(lfs.LFS_OPTIONAL_METHODS.keys()))
+        for cap, method in lfs.LFS_OPTIONAL_METHODS.iteritems():
+            self.assertEquals(registry.has('posix', cap),
+                              hasattr(LFSPluginPosix, method))
+        self.assertFalse(registry.has('posix', 'no-such-capability'))
+
+    def test_app_resolves_at_startup(self):
+        self.assertEquals(_sp.servers[0].lfs_plugins.get('posix'),
+                          LFSPluginPosix)
+        conf = {'lfs_mode': 'no-such-plugin', 'lfs_root': '/tmp'}
+        self.assertRaises(ValueError, proxy_server.Application, conf,
+                          FakeMemcache(), None, FakeRing(), FakeRing(),
+                          FakeRing())
+
+
 if __name__ == '__main__':
     setup()
     try:
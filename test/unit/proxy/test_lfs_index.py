@@ -0,0 +1,115 @@
+# Copyright (c) 2012 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Tests for swift.proxy.lfs_index """
+
+import unittest
+from contextlib import closing
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from swift.proxy.lfs_index import LFSNameIndex
+
+
+class TestLFSNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.index = LFSNameIndex(self.testdir)
+        self.index.initialize(['c', 'a', 'b/1', 'b/2', 'b/3/x', 'd'])
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def _names(self, *args, **kwargs):
+        return [name for name, is_subdir in
+                self.index.iter_names(*args, **kwargs)]
+
+    def test_add_remove(self):
+        self.assert_(self.index.exists())
+        self.assertEquals(self.index.count(), 6)
+        self.index.add('e')
+        self.index.add('e')
+        self.assertEquals(self.index.count(), 7)
+        self.index.remove('e')
+        self.index.remove('nonexistent')
+        self.assertEquals(self.index.count(), 6)
+
+    def test_initialize_replaces(self):
+        self.index.initialize(['z'])
+        self.assertEquals(self._names(100, '', '', None, ''), ['z'])
+
+    def test_metadata_summary(self):
+        self.index.add('e', '1.00000', 3, 'text/plain', 'x')
+        self.assertEquals(self.index.get_metadata(['a', 'e', 'nonexistent']),
+                          {'e': ('1.00000', 3, 'text/plain', 'x')})
+        self.index.set_metadata([('a', '2.00000', 0, 'text/html', 'y'),
+                                 ('nonexistent', '2.00000', 0, '', '')])
+        self.assertEquals(self.index.get_metadata(['a', 'nonexistent']),
+                          {'a': ('2.00000', 0, 'text/html', 'y')})
+        self.assertEquals(self.index.count(), 7)
+
+    def test_metadata_many_names(self):
+        names = ['o%05d' % i for i in xrange(1200)]
+        self.index.initialize(names)
+        self.index.set_metadata([(n, '1.00000', 1, 'text/plain', n)
+                                 for n in names])
+        self.assertEquals(len(self.index.get_metadata(names)), 1200)
+
+    def test_metadata_old_schema(self):
+        with closing(self.index._connect()) as conn:
+            conn.execute('DROP TABLE name')
+            conn.execute('CREATE TABLE name (name TEXT PRIMARY KEY)')
+            conn.execute("INSERT INTO name (name) VALUES ('a')")
+            conn.commit()
+        self.assertEquals(self.index.get_metadata(['a']), {})
+        self.index.set_metadata([('a', '1.00000', 1, 'text/plain', 'x')])
+        self.index.add('b', '1.00000', 2, 'text/plain', 'y')
+        self.assertEquals(self.index.get_metadata(['a', 'b']),
+                          {'a': ('1.00000', 1, 'text/plain', 'x'),
+                           'b': ('1.00000', 2, 'text/plain', 'y')})
+
+    def test_marker_limit(self):
+        self.assertEquals(self._names(100, '', '', None, ''),
+                          ['a', 'b/1', 'b/2', 'b/3/x', 'c', 'd'])
+        self.assertEquals(self._names(2, '', '', None, ''), ['a', 'b/1'])
+        self.assertEquals(self._names(2, 'b/1', '', None, ''),
+                          ['b/2', 'b/3/x'])
+        self.assertEquals(self._names(100, 'a', 'c', None, ''),
+                          ['b/1', 'b/2', 'b/3/x'])
+
+    def test_prefix(self):
+        self.assertEquals(self._names(100, '', '', 'b/', ''),
+                          ['b/1', 'b/2', 'b/3/x'])
+        self.assertEquals(self._names(100, '', '', 'z', ''), [])
+
+    def test_delimiter(self):
+        listing = list(self.index.iter_names(100, '', '', None, '/'))
+        self.assertEquals(listing, [('a', False), ('b/', True),
+                                    ('c', False), ('d', False)])
+        self.assertEquals(self._names(2, '', '', None, '/'), ['a', 'b/'])
+        self.assertEquals(self._names(100, 'b/', '', None, '/'), ['c', 'd'])
+        self.assertEquals(self._names(100, '', '', 'b/', '/'),
+                          ['b/1', 'b/2', 'b/3/'])
+
+    def test_path(self):
+        self.assertEquals(self._names(100, '', '', None, '', 'b'),
+                          ['b/1', 'b/2'])
+        self.assertEquals(self._names(100, '', '', None, '', ''),
+                          ['a', 'c', 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()